@@ -0,0 +1,106 @@
+# ADMISSION CONTROL
+# When Postgres slows down, every request that gets in holds a thread and a
+# pooled connection until it finishes. Each route belongs to a class with a
+# concurrency limit, a bounded queue and a deadline for time spent queued;
+# anything over budget is turned away immediately with a 503 instead of
+# piling up. Classes are ranked: while a higher-priority class (scans) has
+# requests queued, lower-priority arrivals are shed outright.
+
+import time
+import threading
+from password_pool import PASSWORD_JOB_LIMIT
+
+# name -> settings. Queued requests still occupy a server thread, so keep
+# queues short and deadlines tight.
+ADMISSION_CLASSES = {
+    'scan':      {'priority': 0, 'limit': 8, 'queue': 16, 'deadline': 2.0},
+    'default':   {'priority': 1, 'limit': 4, 'queue': 8, 'deadline': 1.0},
+    'sheddable': {'priority': 2, 'limit': 1, 'queue': 1, 'deadline': 0.25},
+    # Login and user creation spend most of their time waiting on bcrypt. Their
+    # own class keeps a shift-change login surge out of the 'default' slots, and
+    # its limit is password_pool.py's job limit, which leaves
+    # RESERVED_THREADS server threads that logins never take. It never queues,
+    # so it never sheds other classes either.
+    'password':  {'priority': 1, 'limit': PASSWORD_JOB_LIMIT, 'queue': 0, 'deadline': 0},
+}
+
+class AdmissionRejected(Exception):
+    def __init__(self, admission_class, reason):
+        super().__init__(f'{admission_class}: {reason}')
+        self.admission_class = admission_class
+        self.reason = reason
+
+class AdmissionClass:
+    def __init__(self, name, priority, limit, queue, deadline):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue = queue
+        self.deadline = deadline
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'deadline': 0, 'priority': 0}
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        if any(c.waiting for c in _classes.values() if c.priority < self.priority):
+            self._reject('priority')
+
+        with self.condition:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return
+
+            if self.waiting >= self.queue:
+                self._reject('queue_full')
+
+            start = time.monotonic()
+            self.waiting += 1
+            try:
+                admitted = self.condition.wait_for(lambda: self.active < self.limit, self.deadline)
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.monotonic() - start
+            if not admitted:
+                if self.active < self.limit:
+                    # We may have swallowed a notify meant for the next waiter
+                    self.condition.notify()
+                self._reject('deadline')
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def _reject(self, reason):
+        # Counters are only ever bumped, so a rare lost update under the GIL is acceptable
+        self.rejected[reason] += 1
+        raise AdmissionRejected(self.name, reason)
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'queue_limit': self.queue,
+            'deadline_seconds': self.deadline,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'wait_seconds': round(self.wait_seconds, 3)
+        }
+
+_classes = {name: AdmissionClass(name, **settings) for name, settings in ADMISSION_CLASSES.items()}
+
+def admit(admission_class):
+    """Block until admitted (returns the class to release) or raise AdmissionRejected"""
+    cls = _classes[admission_class]
+    cls.acquire()
+    return cls
+
+def get_admission_stats():
+    return {name: cls.stats() for name, cls in _classes.items()}
@@ -1,20 +1,47 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, send_file, render_template, make_response, g, has_request_context, stream_with_context, url_for, abort
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import pytz
 import psycopg
 from psycopg.rows import dict_row
-import bcrypt
+from psycopg_pool import ConnectionPool
 import jwt
 from functools import wraps
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+import hashlib
+import re
+import base64
+import secrets
 import io
+import threading
+import itertools
+from hot_statements import execute_hot, get_hot_statement_stats
+from password_pool import check_password, hash_password, PasswordPoolBusy, PASSWORD_RETRY_AFTER
+from revocations import revoke_user, is_revoked, start_revocation_listener
+from admission import admit, AdmissionRejected, get_admission_stats
+from query_budget import (query_budget_ms, set_query_budget, on_cancellation,
+                          on_statement, get_cancellation_stats,
+                          BudgetCursor, watchdog)
+import metrics
+import query_stats
+import profiling
+from repository import PostgresRepository, MemoryRepository, CAR_FIELDS, HOLDING_COLUMNS, cars_sql
+import time
+import uuid
+import logging
+from logging_setup import configure_logging, set_context_provider
+from json_provider import FastJSONProvider
+from compression import compress_response, StaticAssets
 
 app = Flask(__name__)
+# Rows are encoded straight from the cursor - see json_provider.py
+app.json = FastJSONProvider(app)
 CORS(app)
 
+# run.py configures logging (with a log file) before importing us; this is for `python app.py` and asgi.py
+configure_logging()
+logger = logging.getLogger('car_scanner.api')
+
 app.config['SECRET_KEY'] = 'parking-system-secret-key-2025'
 DB_CONFIG = {
     'host': 'localhost',
@@ -22,6 +49,13 @@ DB_CONFIG = {
     'user': 'postgres',
     'password': 'postgres'
 }
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 20
+
+# Access tokens are checked without a database hit, so they are kept short;
+# the refresh token renews them for the rest of the shift without bcrypt
+ACCESS_TOKEN_MINUTES = 15
+REFRESH_TOKEN_DAYS = 7
 
 # South Africa Timezone
 SOUTH_AFRICA_TZ = pytz.timezone('Africa/Johannesburg')
@@ -30,8 +64,264 @@ def get_current_time():
     """Get current time in South Africa timezone"""
     return datetime.now(SOUTH_AFRICA_TZ)
 
+class PooledConnection(psycopg.Connection):
+    """Connection whose close() hands it back to the pool (see close_returns)"""
+    checkout_id = None
+
+    def close(self):
+        end_checkout(self)
+        super().close()
+
+db_pool = None
+db_pool_lock = threading.Lock()
+
+def get_pool():
+    """Open the pool on first use so importing app doesn't start connecting"""
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                db_pool = ConnectionPool(
+                    kwargs={**DB_CONFIG, 'row_factory': dict_row, 'cursor_factory': BudgetCursor},
+                    connection_class=PooledConnection,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    check=start_checkout,
+                    close_returns=True,
+                    timeout=10,
+                    open=True
+                )
+    return db_pool
+
+# Each checkout is tagged so teardown can tell "still ours" from "reused by
+# another request". The pool sets the tag before getconn() hands the connection
+# over, and close() clears it (and the watchdog deadline) before handing the
+# connection back, so a stale tag never matches.
+checkout_counter = itertools.count(1)
+
+def start_checkout(conn):
+    """Pool check callback, run on every getconn()"""
+    conn.checkout_id = next(checkout_counter)
+
+def end_checkout(conn):
+    conn.checkout_id = None
+    watchdog.unwatch(conn)
+
 def get_db():
-    return psycopg.connect(**DB_CONFIG, row_factory=dict_row)
+    conn = get_pool().getconn()
+    if not has_request_context():
+        set_query_budget(conn, None)
+        return conn
+    g.setdefault('db_connections', []).append((conn, conn.checkout_id))
+    budget_ms = query_budget_ms(request.endpoint)
+    # Sent along with the first statement of each transaction - see query_budget.py
+    set_query_budget(conn, budget_ms)
+    watchdog.watch(conn, budget_ms)
+    return conn
+
+# STORAGE - see repository.py
+# CAR_SCANNER_STORAGE=memory serves the data routes from an in-process store
+# (empty until something fills it), for tests and handler benchmarks
+STORAGE_BACKEND = os.environ.get('CAR_SCANNER_STORAGE', 'postgres')
+memory_repository = MemoryRepository() if STORAGE_BACKEND == 'memory' else None
+
+def get_repository():
+    """Repository for this request; close() it like a connection"""
+    if memory_repository is not None:
+        return memory_repository
+    return PostgresRepository(get_db())
+
+@app.teardown_request
+def return_db_connections(exc):
+    """Return connections a handler didn't close (e.g. on an exception path) to the pool"""
+    for conn, checkout_id in g.pop('db_connections', []):
+        if conn.checkout_id == checkout_id and getattr(conn, '_pool', None) is not None:
+            conn.close()
+
+# COMPRESSION - see compression.py
+# Registered before the other hooks, so it runs last and sees the final response
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+# Fingerprinted, pre-compressed static files; templates link them with asset_url()
+static_assets = StaticAssets(app.static_folder)
+
+@app.template_global()
+def asset_url(filename):
+    fingerprinted = static_assets.url_path(filename)
+    if fingerprinted is None:
+        return url_for('static', filename=filename)
+    return url_for('static_asset', filename=fingerprinted)
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    asset = static_assets.get(filename)
+    if asset is None:
+        abort(404)
+    encoding, body = asset.body_for(request.accept_encodings)
+    response = app.response_class(body, mimetype=asset.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # A strong ETag names exact bytes, so each encoding gets its own
+    response.set_etag(f'{asset.digest}-{encoding}' if encoding else asset.digest)
+    # The name changes with the content, so this URL never goes stale
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# REQUEST IDS
+# Taken from X-Request-ID when a proxy or client sends one, echoed back on the
+# response and attached to every log record written during the request.
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+@app.before_request
+def assign_request_id():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+
+@app.after_request
+def add_request_id_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+def log_context():
+    if not has_request_context():
+        return None
+    return g.get('request_id'), request.endpoint
+
+set_context_provider(log_context)
+
+# PROFILING - see profiling.py
+# First hook in and last out, so the profile covers the other hooks as well
+def profile_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+@app.before_request
+def start_request_profile():
+    if not profile_requested():
+        return
+    try:
+        if decode_token(request.headers.get('Authorization', ''))['role'] != 'admin':
+            return
+    except Exception:
+        return
+    g.profile_id = profiling.new_profile_id()
+    g.profiler = profiling.start_profile()
+
+@app.after_request
+def add_profile_header(response):
+    if 'profile_id' in g:
+        response.headers['X-Profile-Id'] = g.profile_id if g.profiler else 'busy'
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiling.finish_profile(profiler, g.profile_id, {
+        'request_id': g.request_id,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': g.get('metrics_status', 500)
+    })
+
+# METRICS - see metrics.py
+# Registered ahead of admission control so shed requests are counted too
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_started(g.metrics_route, request.method)
+
+@app.after_request
+def note_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'metrics_start' not in g:
+        return
+    metrics.request_finished(g.metrics_route, request.method, g.get('metrics_status', 500),
+                             time.perf_counter() - g.metrics_start, g.get('db_seconds', 0.0))
+
+@on_statement
+def statement_finished(conn, query, params, seconds, name):
+    """DB time for the request metrics, and per-statement totals for query_stats"""
+    route = None
+    if has_request_context():
+        g.db_seconds = g.get('db_seconds', 0.0) + seconds
+        route = request.endpoint
+    query_stats.record(conn, query, params, seconds, route, name)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    body = metrics.render_metrics(
+        pool_stats=db_pool.get_stats() if db_pool is not None else None,
+        admission_stats=get_admission_stats(),
+        cancellations=get_cancellation_stats()
+    )
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# ADMISSION CONTROL - see admission.py
+# Endpoints that don't touch the database skip the limiter; anything not
+# listed here is in the 'default' class.
+ROUTE_ADMISSION_CLASSES = {
+    'scan_car': 'scan',
+    'export_excel': 'sheddable',
+    'export_holding_excel': 'sheddable',
+    'get_worker_profile': 'sheddable',
+    'login': 'password',
+    'create_user': 'password'
+}
+ADMISSION_EXEMPT = {'static', 'static_asset', 'favicon', 'well_known', 'index', 'dashboard', 'metrics_endpoint'}
+ADMISSION_RETRY_AFTER = 1
+
+@app.before_request
+def admit_request():
+    if request.endpoint is None or request.endpoint in ADMISSION_EXEMPT:
+        return None
+    try:
+        g.admission = admit(ROUTE_ADMISSION_CLASSES.get(request.endpoint, 'default'))
+    except AdmissionRejected as e:
+        return jsonify({
+            'error': 'Server busy, please try again in a moment',
+            'class': e.admission_class,
+            'reason': e.reason
+        }), 503, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    admission = g.pop('admission', None)
+    if admission is not None:
+        admission.release()
+
+@on_cancellation
+def note_query_cancelled(source):
+    if not has_request_context():
+        return None
+    g.query_cancelled = source
+    return request.endpoint
+
+@app.after_request
+def query_timeout_response(response):
+    """Swap whatever error the handler built after a cancelled query for a structured 504"""
+    source = g.pop('query_cancelled', None)
+    if source is None or response.status_code < 500:
+        return response
+    timeout = jsonify({
+        'error': 'Query timed out',
+        'code': 'query_timeout',
+        'cancelled_by': source,
+        'budget_ms': query_budget_ms(request.endpoint)
+    })
+    timeout.status_code = 504
+    return timeout
 
 SHIFTS = {
     1: {'start': 6, 'end': 18, 'name': '6AM-6PM (Day Shift)'},
@@ -52,6 +342,18 @@ def get_status_color(hours_parked):
     else:
         return {'emoji': '🔴', 'status': 'red', 'text': 'Overdue'}
 
+def decode_token(auth_header):
+    """Decode an Authorization header value ("Bearer <jwt>" or the bare token)"""
+    # The in-memory store has no database to LISTEN on
+    if memory_repository is None:
+        start_revocation_listener(DB_CONFIG)
+    token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
+    claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'],
+                        options={'require': ['exp', 'iat']})
+    if is_revoked(claims):
+        raise jwt.InvalidTokenError('Token revoked')
+    return claims
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -59,11 +361,9 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token missing'}), 401
         try:
-            token = token.split(' ')[1] if ' ' in token else token
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = data
+            current_user = decode_token(token)
         except Exception as e:
-            print(f"Token decode error: {e}")
+            logger.warning('Token decode error', extra={'error': str(e), 'sample': True})
             return jsonify({'error': 'Invalid token'}), 401
         return f(current_user, *args, **kwargs)
     return decorated
@@ -78,6 +378,145 @@ def role_required(roles):
         return decorated_function
     return decorator
 
+# CONDITIONAL GET - ETags derived from data versions
+# setup_db.py installs statement-level triggers that bump a counter in
+# data_versions whenever a tracked table changes, so validating a poll costs
+# one index lookup instead of running the endpoint's query. Each resource's
+# counter is split into per-backend slots (see setup_db.py); its version is the sum.
+# The in-memory store keeps its own counters (MemoryRepository.data_versions)
+DATA_VERSIONS_ENABLED = True
+DATA_VERSIONS_QUERY = 'SELECT resource, SUM(version)::bigint AS version FROM data_versions WHERE resource = ANY(%s) GROUP BY resource'
+
+def get_data_versions(resources):
+    """Return {resource: version} for the given tables, or None if versions are unavailable"""
+    global DATA_VERSIONS_ENABLED
+    if memory_repository is not None:
+        return memory_repository.data_versions(resources)
+    if not DATA_VERSIONS_ENABLED:
+        return None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(DATA_VERSIONS_QUERY, (list(resources),))
+        versions = {row['resource']: row['version'] for row in cur.fetchall()}
+        conn.close()
+        return versions
+    except psycopg.errors.UndefinedTable:
+        logger.warning('data_versions table missing - run setup_db.py to enable ETags')
+        DATA_VERSIONS_ENABLED = False
+        return None
+    except Exception as e:
+        logger.warning('Data version lookup error', extra={'error': str(e), 'sample': True})
+        return None
+
+def make_etag(path, current_user, args, resources, versions):
+    """Build an ETag from the data versions plus everything else the response depends on"""
+    key = '|'.join([
+        path,
+        str(current_user.get('user_id')),
+        str(current_user.get('role')),
+        get_current_time().date().isoformat(),
+        '&'.join(f'{k}={v}' for k, v in sorted(args)),
+        ','.join(f'{r}:{versions.get(r, 0)}' for r in resources)
+    ])
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def compute_etag(resources, current_user):
+    versions = get_data_versions(resources)
+    if versions is None:
+        return None
+    return make_etag(request.path, current_user, request.args.items(multi=True), resources, versions)
+
+def conditional_get(*resources):
+    """Answer 304 without running the handler when the client's ETag is still current"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(current_user, *args, **kwargs):
+            etag = compute_etag(resources, current_user)
+            if etag is None:
+                return f(current_user, *args, **kwargs)
+
+            # Weak comparison (RFC 9110): compressed responses carry W/ etags
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(current_user, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+# STREAMED RESPONSES
+# The full car, user and vessel lists are sent as they are read from a
+# server-side cursor (repository stream_* methods) instead of being fetched and
+# encoded in one piece. There is no Content-Length, so the server sends them
+# chunked. stream_with_context keeps the request open until the last chunk, so
+# the pooled connection and request metrics are only released by the teardown
+# hooks once the body has been written.
+#
+# How long that takes depends on the client's link, not on the database. So
+# once the handler returns a streamed response (its first chunk already read,
+# see prefetched) the request gives back its admission slot and drops its
+# watchdog deadline; each later FETCH is still bounded by the transaction's
+# statement_timeout.
+def json_array_chunks(chunks):
+    """Encode an iterable of row lists as the bytes of one JSON array"""
+    dumpb = app.json.dumpb
+    yield b'['
+    first = True
+    for rows in chunks:
+        if not rows:
+            continue
+        body = dumpb(rows)[1:-1]
+        yield body if first else b',' + body
+        first = False
+    yield b']'
+
+def json_object_chunks(members):
+    """Encode (key, row chunks) pairs as the bytes of a JSON object of arrays"""
+    yield b'{'
+    for i, (key, chunks) in enumerate(members):
+        yield (b',' if i else b'') + app.json.dumpb(key) + b':'
+        yield from json_array_chunks(chunks)
+    yield b'}'
+
+def prefetched(chunks):
+    """
+    Read the first chunk now, so a failing query still gets an error response
+    rather than a 200 whose body stops short
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    return chunks if first is None else itertools.chain([first], chunks)
+
+def stop_request_budgets(repo):
+    """Release what bounds the handler phase of a request that is now only streaming"""
+    conn = getattr(repo, 'conn', None)
+    if conn is not None:
+        watchdog.unwatch(conn)
+    admission = g.pop('admission', None)
+    if admission is not None:
+        admission.release()
+
+def streamed_json(body, repo):
+    """Response streaming body (bytes chunks); closes repo once it is sent"""
+    def generate():
+        try:
+            stop_request_budgets(repo)
+            yield from body
+            yield b'\n'
+        except Exception:
+            # Headers are gone - all that is left is to cut the body short
+            logger.exception('Streamed response failed', extra={'sample': True})
+            raise
+        finally:
+            repo.close()
+    return app.response_class(stream_with_context(generate()), mimetype=app.json.mimetype)
+
 # Routes that were causing 404 errors
 @app.route('/favicon.ico')
 def favicon():
@@ -87,13 +526,24 @@ def favicon():
 def well_known(path):
     return '', 204
 
+# The page shells take no per-request context, so each is rendered once
+rendered_shells = {}
+
+def render_shell(template):
+    if app.jinja_env.auto_reload:
+        return render_template(template)
+    html = rendered_shells.get(template)
+    if html is None:
+        html = rendered_shells[template] = render_template(template)
+    return html
+
 @app.route('/')
 def index():
-    return render_template('login.html')
+    return render_shell('login.html')
 
 @app.route('/dashboard')
 def dashboard():
-    return render_template('dashboard.html')
+    return render_shell('dashboard.html')
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -104,7 +554,113 @@ def health():
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+@app.route('/api/admin/prepared-statements', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def prepared_statement_stats(current_user):
+    return jsonify(get_hot_statement_stats())
+
+@app.route('/api/admin/admission', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def admission_stats(current_user):
+    return jsonify(get_admission_stats())
+
+@app.route('/api/admin/query-stats', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def query_stats_summary(current_user):
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+    return jsonify(query_stats.get_query_stats(limit))
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def list_request_profiles(current_user):
+    return jsonify(profiling.list_profiles())
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_request_profile(current_user, profile_id):
+    """The raw .prof file (for snakeviz/pstats), or ?format=text for a pstats report"""
+    if not profiling.has_profile(profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in profiling.sort_keys():
+            return jsonify({'error': 'Unknown sort key', 'sort_keys': profiling.sort_keys()}), 400
+        text = profiling.profile_text(profile_id, sort=sort)
+        return text, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return send_file(profiling.profile_path(profile_id), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f'{profile_id}.prof')
+
+@app.route('/api/admin/query-cancellations', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def query_cancellation_stats(current_user):
+    return jsonify(get_cancellation_stats())
+
 # AUTH - FIXED
+# Refresh tokens are random strings stored as their SHA-256, so checking one
+# is an indexed lookup rather than a bcrypt comparison.
+REFRESH_TOKEN_INSERT = '''
+    INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES (%s, %s, %s)
+'''
+# Rotation: the presented token is spent in the same statement that reads the user
+REFRESH_TOKEN_ROTATE = '''
+    UPDATE refresh_tokens rt SET revoked_at = NOW()
+    FROM users u
+    WHERE rt.token_hash = %s AND rt.revoked_at IS NULL AND rt.expires_at > NOW()
+      AND u.user_id = rt.user_id AND u.is_active = TRUE
+    RETURNING u.*
+'''
+REFRESH_TOKEN_REVOKE = 'UPDATE refresh_tokens SET revoked_at = NOW() WHERE token_hash = %s AND revoked_at IS NULL'
+
+def hash_refresh_token(refresh_token):
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+def new_refresh_token(user):
+    """(token for the client, params for REFRESH_TOKEN_INSERT)"""
+    refresh_token = secrets.token_urlsafe(32)
+    expires_at = get_current_time() + timedelta(days=REFRESH_TOKEN_DAYS)
+    return refresh_token, (user['user_id'], hash_refresh_token(refresh_token), expires_at)
+
+def login_payload(user, refresh_token):
+    """Tokens and user summary returned by a successful login or refresh"""
+    assigned_shift = user['assigned_shift'] or get_current_shift()
+    issued_at = int(time.time())
+    
+    token = jwt.encode({
+        'user_id': user['user_id'],
+        'username': user['username'],
+        'role': user['role'],
+        'full_name': user['full_name'] or user['username'],
+        'assigned_shift': assigned_shift,
+        'supervisor_id': user['supervisor_id'],
+        'iat': issued_at,
+        'exp': issued_at + ACCESS_TOKEN_MINUTES * 60
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+    
+    return {
+        'token': token,
+        'refresh_token': refresh_token,
+        'expires_in': ACCESS_TOKEN_MINUTES * 60,
+        'user': {
+            'user_id': user['user_id'],
+            'username': user['username'],
+            'role': user['role'],
+            'full_name': user['full_name'] or user['username'],
+            'assigned_shift': assigned_shift
+        }
+    }
+
+PASSWORD_POOL_BUSY = {'error': 'Server busy, please try again in a moment'}
+
+def password_pool_busy():
+    """503 for when the bcrypt pool is saturated (e.g. a shift-change login surge)"""
+    return jsonify(PASSWORD_POOL_BUSY), 503, {'Retry-After': str(PASSWORD_RETRY_AFTER)}
+
 @app.route('/api/login', methods=['POST'])
 def login():
     try:
@@ -119,9 +675,7 @@ def login():
             return jsonify({'error': 'Username and password required'}), 400
         
         conn = get_db()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM users WHERE username = %s AND is_active = TRUE', (username,))
-        user = cur.fetchone()
+        user = execute_hot(conn, 'login_user', (username,)).fetchone()
         conn.close()
         
         if not user:
@@ -130,79 +684,90 @@ def login():
         if not user['password_hash']:
             return jsonify({'error': 'User account needs password setup'}), 401
         
-        password_hash_bytes = user['password_hash']
-        if isinstance(password_hash_bytes, str):
-            password_hash_bytes = password_hash_bytes.encode('utf-8')
-        
-        if bcrypt.checkpw(password.encode(), password_hash_bytes):
-            assigned_shift = user['assigned_shift'] or get_current_shift()
-            
-            token = jwt.encode({
-                'user_id': user['user_id'],
-                'username': user['username'],
-                'role': user['role'],
-                'full_name': user['full_name'] or user['username'],
-                'assigned_shift': assigned_shift,
-                'supervisor_id': user['supervisor_id']
-            }, app.config['SECRET_KEY'], algorithm='HS256')
-            
-            return jsonify({
-                'token': token,
-                'user': {
-                    'user_id': user['user_id'],
-                    'username': user['username'],
-                    'role': user['role'],
-                    'full_name': user['full_name'] or user['username'],
-                    'assigned_shift': assigned_shift
-                }
-            }), 200
-        else:
+        if not check_password(password, user['password_hash']):
             return jsonify({'error': 'Invalid credentials'}), 401
+        
+        refresh_token, params = new_refresh_token(user)
+        conn = get_db()
+        conn.execute(REFRESH_TOKEN_INSERT, params)
+        conn.commit()
+        conn.close()
+        return jsonify(login_payload(user, refresh_token)), 200
             
+    except PasswordPoolBusy:
+        return password_pool_busy()
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.exception('Login error', extra={'sample': True})
         return jsonify({'error': 'Server error during login'}), 500
 
-# HOLDING AREAS
-@app.route('/api/holding-areas', methods=['GET'])
-@token_required
-def get_holding_areas(current_user):
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_access_token():
     try:
+        data = request.get_json(silent=True) or {}
+        presented = data.get('refresh_token')
+        if not presented:
+            return jsonify({'error': 'Refresh token required'}), 400
+        
         conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'holding_areas'
-            )
-        """)
-        if not cur.fetchone()['exists']:
+        user = conn.execute(REFRESH_TOKEN_ROTATE, (hash_refresh_token(presented),)).fetchone()
+        if not user:
+            conn.rollback()
             conn.close()
-            return jsonify([
-                {'holding_area_id': 1, 'area_name': 'Holding Area A'},
-                {'holding_area_id': 2, 'area_name': 'Holding Area B'},
-                {'holding_area_id': 3, 'area_name': 'Holding Area C'}
-            ])
+            return jsonify({'error': 'Invalid refresh token'}), 401
         
-        cur.execute('SELECT * FROM holding_areas WHERE is_active = TRUE ORDER BY area_name')
-        areas = cur.fetchall()
+        refresh_token, params = new_refresh_token(user)
+        conn.execute(REFRESH_TOKEN_INSERT, params)
+        conn.commit()
+        conn.close()
+        return jsonify(login_payload(user, refresh_token))
+    except Exception as e:
+        logger.exception('Token refresh error', extra={'sample': True})
+        return jsonify({'error': 'Server error during token refresh'}), 500
+
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        conn = get_db()
+        conn.execute(REFRESH_TOKEN_REVOKE, (hash_refresh_token(data['refresh_token']),))
+        conn.commit()
         conn.close()
-        return jsonify([dict(a) for a in areas])
+    return jsonify({'message': 'Logged out'})
+
+# HOLDING AREAS
+DEFAULT_HOLDING_AREAS = [
+    {'holding_area_id': 1, 'area_name': 'Holding Area A'},
+    {'holding_area_id': 2, 'area_name': 'Holding Area B'},
+    {'holding_area_id': 3, 'area_name': 'Holding Area C'}
+]
+@app.route('/api/holding-areas', methods=['GET'])
+@token_required
+@conditional_get('holding_areas')
+def get_holding_areas(current_user):
+    try:
+        repo = get_repository()
+        # Query directly and fall back on a missing table instead of checking
+        # information_schema first, saving a round trip on every call
+        try:
+            areas = repo.list_holding_areas()
+        except psycopg.errors.UndefinedTable:
+            repo.close()
+            return jsonify(DEFAULT_HOLDING_AREAS)
+        repo.close()
+        return jsonify(areas)
     except Exception as e:
-        print(f"Error loading holding areas: {e}")
+        logger.exception('Error loading holding areas', extra={'sample': True})
         return jsonify([])
 
 # VESSELS
 @app.route('/api/vessels', methods=['GET'])
 @token_required
+@conditional_get('vessels')
 def get_vessels(current_user):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM vessels WHERE is_active = TRUE ORDER BY arrival_date DESC')
-        vessels = cur.fetchall()
-        conn.close()
-        return jsonify([dict(v) for v in vessels])
+        repo = get_repository()
+        vessels = prefetched(repo.stream_vessels())
+        return streamed_json(json_array_chunks(vessels), repo)
     except:
         return jsonify([])
 
@@ -218,46 +783,23 @@ def create_vessel(current_user):
         if not vessel_name:
             return jsonify({'error': 'Vessel name required'}), 400
         
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO vessels (vessel_name, vessel_type, arrival_date)
-            VALUES (%s, %s, %s) RETURNING vessel_id
-        ''', (vessel_name, vessel_type, arrival_date))
-        vessel_id = cur.fetchone()['vessel_id']
-        conn.commit()
-        conn.close()
+        repo = get_repository()
+        vessel_id = repo.create_vessel(vessel_name, vessel_type, arrival_date)
+        repo.commit()
+        repo.close()
         return jsonify({'message': 'Vessel created', 'vessel_id': vessel_id}), 201
     except Exception as e:
-        print(f"Error creating vessel: {e}")
+        logger.exception('Error creating vessel')
         return jsonify({'error': str(e)}), 500
 
 # USERS
 @app.route('/api/users', methods=['GET'])
 @token_required
+@conditional_get('users')
 def get_users(current_user):
-    conn = get_db()
-    cur = conn.cursor()
-    
-    if current_user['role'] == 'supervisor':
-        cur.execute('''
-            SELECT u.*, s.full_name as supervisor_name
-            FROM users u
-            LEFT JOIN users s ON u.supervisor_id = s.user_id
-            WHERE u.supervisor_id = %s AND u.role = 'worker'
-            ORDER BY u.full_name
-        ''', (current_user['user_id'],))
-    else:
-        cur.execute('''
-            SELECT u.*, s.full_name as supervisor_name
-            FROM users u
-            LEFT JOIN users s ON u.supervisor_id = s.user_id
-            ORDER BY u.role, u.full_name
-        ''')
-    
-    users = cur.fetchall()
-    conn.close()
-    return jsonify([dict(u) for u in users])
+    repo = get_repository()
+    users = prefetched(repo.stream_users(current_user))
+    return streamed_json(json_array_chunks(users), repo)
 
 @app.route('/api/users', methods=['POST'])
 @token_required
@@ -273,7 +815,7 @@ def create_user(current_user):
         if not username or not password or not role:
             return jsonify({'error': 'Missing required fields'}), 400
         
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        password_hash = hash_password(password)
         
         assigned_shift = data.get('assigned_shift')
         if assigned_shift in [None, '', 'null']:
@@ -301,8 +843,63 @@ def create_user(current_user):
         
     except psycopg.errors.UniqueViolation:
         return jsonify({'error': 'Username already exists'}), 400
+    except PasswordPoolBusy:
+        return password_pool_busy()
     except Exception as e:
-        print(f"Error creating user: {e}")
+        logger.exception('Error creating user')
+        return jsonify({'error': str(e)}), 500
+
+USER_SEARCH_LIMIT = 10
+USER_SEARCH_MAX_LIMIT = 50
+
+def escape_like(term):
+    """Escape LIKE wildcards so the search term is matched literally"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def user_search_query(q, limit, current_user):
+    """(query, params) for the top username/full_name matches the caller may see"""
+    pattern = escape_like(q)
+    query = '''
+        SELECT user_id, username, full_name, role, supervisor_id
+        FROM users
+        WHERE is_active = TRUE
+          AND (username ILIKE %(contains)s OR full_name ILIKE %(contains)s)
+    '''
+    params = {'contains': f'%{pattern}%', 'prefix': f'{pattern}%', 'q': q, 'limit': limit}
+
+    if current_user['role'] == 'supervisor':
+        query += " AND supervisor_id = %(supervisor_id)s AND role = 'worker'"
+        params['supervisor_id'] = current_user['user_id']
+
+    # Prefix matches first, then by trigram similarity
+    query += '''
+        ORDER BY (username ILIKE %(prefix)s OR full_name ILIKE %(prefix)s) DESC,
+                 GREATEST(similarity(username, %(q)s), similarity(full_name, %(q)s)) DESC,
+                 full_name
+        LIMIT %(limit)s
+    '''
+    return query, params
+
+@app.route('/api/users/search', methods=['GET'])
+@token_required
+@role_required(['admin', 'supervisor'])
+def search_users(current_user):
+    """Top matches on username/full_name, served by the pg_trgm indexes from setup_db.py"""
+    try:
+        q = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', USER_SEARCH_LIMIT, type=int), 1), USER_SEARCH_MAX_LIMIT)
+
+        if len(q) < 2:
+            return jsonify([])
+
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(*user_search_query(q, limit, current_user))
+        users = cur.fetchall()
+        conn.close()
+        return jsonify(users)
+    except Exception as e:
+        logger.exception('User search error', extra={'sample': True})
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/users/<int:user_id>', methods=['DELETE'])
@@ -312,302 +909,404 @@ def delete_user(current_user, user_id):
     conn = get_db()
     cur = conn.cursor()
     cur.execute('UPDATE users SET is_active = FALSE WHERE user_id = %s', (user_id,))
+    cur.execute('UPDATE refresh_tokens SET revoked_at = NOW() WHERE user_id = %s AND revoked_at IS NULL', (user_id,))
     conn.commit()
     conn.close()
+    # Other processes hear about it from the users_revoke_tokens trigger
+    revoke_user(user_id)
     return jsonify({'message': 'User deactivated'})
 
 # WORKER PROFILE
+def worker_profile_payload(results):
+    """Build the profile response from the worker_profile_statements() results, or None if no such worker"""
+    worker_rows, today_rows, week_rows, car_rows, recent_scans = results
+    if not worker_rows:
+        return None
+    
+    worker = worker_rows[0]
+    return {
+        'worker': worker,
+        'stats': {
+            'today_scans': today_rows[0]['today_scans'],
+            'week_scans': week_rows[0]['week_scans'],
+            'total_scans': worker.get('total_scans') or 0,
+            'unique_cars': car_rows[0]['unique_cars']
+        },
+        'recent_activity': recent_scans
+    }
+
 @app.route('/api/workers/<int:worker_id>/profile', methods=['GET'])
 @token_required
+@conditional_get('users', 'scans', 'cars')
 def get_worker_profile(current_user, worker_id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute('SELECT * FROM users WHERE user_id = %s AND role = \'worker\'', (worker_id,))
-        worker = cur.fetchone()
-        
-        if not worker:
-            conn.close()
-            return jsonify({'error': 'Worker not found'}), 404
-        
+        repo = get_repository()
         today = get_current_time().date()
+        profile = worker_profile_payload(repo.worker_profile(worker_id, today))
+        repo.close()
         
-        cur.execute('SELECT COUNT(*) as today_scans FROM scans WHERE worker_id = %s AND date = %s', (worker_id, today))
-        today_stats = cur.fetchone()
-        
-        cur.execute('SELECT COUNT(*) as week_scans FROM scans WHERE worker_id = %s AND date >= CURRENT_DATE - INTERVAL \'7 days\'', (worker_id,))
-        week_stats = cur.fetchone()
-        
-        cur.execute('SELECT COUNT(DISTINCT car_id) as unique_cars FROM scans WHERE worker_id = %s', (worker_id,))
-        car_stats = cur.fetchone()
-        
-        cur.execute('''
-            SELECT c.car_identifier, s.scan_time, s.shift_number
-            FROM scans s
-            JOIN cars c ON s.car_id = c.car_id
-            WHERE s.worker_id = %s
-            ORDER BY s.scan_time DESC
-            LIMIT 10
-        ''', (worker_id,))
-        recent_scans = cur.fetchall()
-        
-        conn.close()
+        if not profile:
+            return jsonify({'error': 'Worker not found'}), 404
         
-        return jsonify({
-            'worker': dict(worker),
-            'stats': {
-                'today_scans': today_stats['today_scans'],
-                'week_scans': week_stats['week_scans'],
-                'total_scans': worker.get('total_scans') or 0,
-                'unique_cars': car_stats['unique_cars']
-            },
-            'recent_activity': [dict(s) for s in recent_scans]
-        })
+        return jsonify(profile)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception('Worker profile error', extra={'sample': True})
         return jsonify({'error': str(e)}), 500
 
 # SCANNING - FIXED to use South Africa time
+def parse_scan_request(data):
+    """Normalise the /api/scan body"""
+    return {
+        'car_identifier': data.get('car_identifier', '').strip().upper(),
+        'vessel_id': data.get('vessel_id'),
+        'holding_area_id': data.get('holding_area_id'),
+        'stack_number': data.get('stack_number', '').strip(),
+        'is_in_holding': data.get('is_in_holding', False)
+    }
+
+def shift_violation(current_user, now):
+    """403 payload if a worker scans outside their assigned shift, else None"""
+    user_role = current_user.get('role')
+    assigned_shift = current_user.get('assigned_shift')
+    current_hour = now.hour
+
+    # Only enforce shift restriction for workers (not supervisors or admins)
+    if user_role != 'worker' or not assigned_shift:
+        return None
+
+    shift_info = SHIFTS[assigned_shift]
+    shift_start = shift_info['start']
+    shift_end = shift_info['end']
+
+    # Check if current time is within worker's assigned shift
+    if assigned_shift == 1:  # Day shift 6AM-6PM
+        is_on_shift = shift_start <= current_hour < shift_end
+    else:  # Night shift 6PM-6AM (spans midnight)
+        is_on_shift = current_hour >= shift_start or current_hour < shift_end
+
+    if is_on_shift:
+        return None
+
+    shift_name = shift_info['name']
+    return {
+        'error': 'Outside working hours',
+        'message': f'You cannot scan outside your shift. Your shift ({shift_name}) starts at {shift_start}:00',
+        'assigned_shift': assigned_shift,
+        'shift_info': shift_name,
+        'current_hour': current_hour
+    }
+
+def scan_car_changes(car, scan, now):
+    """Column values a re-scan of an existing car sets"""
+    hours_parked = (now - car['first_scan_time']).total_seconds() / 3600
+    changes = {
+        'last_scan_time': now,
+        'scan_count': car['scan_count'] + 1,
+        'status': get_status_color(hours_parked)['status']
+    }
+
+    # Update with holding info if provided
+    if scan['is_in_holding']:
+        changes.update({column: scan[column] for column in HOLDING_COLUMNS})
+    return changes
+
+def new_car_values(scan, now):
+    """Column values of a car scanned for the first time"""
+    return {
+        'car_identifier': scan['car_identifier'],
+        'first_scan_time': now,
+        'last_scan_time': now,
+        'status': 'green',
+        'date': now.date(),
+        **{column: scan[column] for column in HOLDING_COLUMNS}
+    }
+
+def scan_payload(car, updated_car, previous_scans, now):
+    """Response body for a recorded scan"""
+    scan_history = []
+    for scan in previous_scans:
+        time_ago = (now - scan['scan_time']).total_seconds() / 3600
+        time_str = f"{int(time_ago * 60)} min ago" if time_ago < 1 else f"{int(time_ago)}h ago"
+        scan_history.append({
+            'worker': scan['worker_name'],
+            'shift': scan['shift_number'],
+            'time_ago': time_str
+        })
+
+    return {
+        'message': 'Scan recorded successfully',
+        'car': updated_car,
+        'previous_scans': scan_history,
+        'is_new': len(previous_scans) == 0 and car is None
+    }
+
 @app.route('/api/scan', methods=['POST'])
 @token_required
 def scan_car(current_user):
     try:
-        data = request.json
-        car_identifier = data.get('car_identifier', '').strip().upper()
-        
-        vessel_id = data.get('vessel_id')
-        holding_area_id = data.get('holding_area_id')
-        stack_number = data.get('stack_number', '').strip()
-        is_in_holding = data.get('is_in_holding', False)
-        
-        if not car_identifier:
+        scan = parse_scan_request(request.json)
+
+        if not scan['car_identifier']:
             return jsonify({'error': 'Car identifier required'}), 400
-        
+
         user_id = current_user.get('user_id')
-        
-        conn = get_db()
-        cur = conn.cursor()
-        
+
         # Use South Africa time with timezone info (don't strip tzinfo)
         now = get_current_time()
         today = now.date()
-        
-        # Check if worker has assigned shift
-        user_role = current_user.get('role')
-        assigned_shift = current_user.get('assigned_shift')
-        current_hour = now.hour
-        
-        # Only enforce shift restriction for workers (not supervisors or admins)
-        if user_role == 'worker' and assigned_shift:
-            shift_info = SHIFTS[assigned_shift]
-            shift_start = shift_info['start']
-            shift_end = shift_info['end']
-            
-            # Check if current time is within worker's assigned shift
-            if assigned_shift == 1:  # Day shift 6AM-6PM
-                is_on_shift = shift_start <= current_hour < shift_end
-            else:  # Night shift 6PM-6AM (spans midnight)
-                is_on_shift = current_hour >= shift_start or current_hour < shift_end
-            
-            if not is_on_shift:
-                shift_name = shift_info['name']
-                return jsonify({
-                    'error': 'Outside working hours',
-                    'message': f'You cannot scan outside your shift. Your shift ({shift_name}) starts at {shift_start}:00',
-                    'assigned_shift': assigned_shift,
-                    'shift_info': shift_name,
-                    'current_hour': current_hour
-                }), 403
-        
+
+        violation = shift_violation(current_user, now)
+        if violation:
+            return jsonify(violation), 403
+
         shift_number = current_user.get('assigned_shift') or get_current_shift()
-        
+
+        repo = get_repository()
+
         # Check if car exists
-        cur.execute('SELECT * FROM cars WHERE car_identifier = %s AND is_active = TRUE', (car_identifier,))
-        car = cur.fetchone()
-        
+        car = repo.find_car(scan['car_identifier'])
+
         if car:
             car_id = car['car_id']
-            scan_count = car['scan_count'] + 1
-            hours_parked = (now - car['first_scan_time']).total_seconds() / 3600
-            status_info = get_status_color(hours_parked)
-            status = status_info['status']
-            
-            # Update with holding info if provided
-            if is_in_holding:
-                cur.execute('''
-                    UPDATE cars SET last_scan_time = %s, scan_count = %s, status = %s,
-                           vessel_id = %s, holding_area_id = %s, stack_number = %s, is_in_holding = %s
-                    WHERE car_id = %s
-                ''', (now, scan_count, status, vessel_id, holding_area_id, stack_number, is_in_holding, car_id))
-            else:
-                cur.execute('''
-                    UPDATE cars SET last_scan_time = %s, scan_count = %s, status = %s
-                    WHERE car_id = %s
-                ''', (now, scan_count, status, car_id))
+            repo.update_car(car_id, scan_car_changes(car, scan, now))
         else:
             # Create new car
-            status = 'green'
-            cur.execute('''
-                INSERT INTO cars (car_identifier, first_scan_time, last_scan_time, scan_count, status, date,
-                                  vessel_id, holding_area_id, stack_number, is_in_holding)
-                VALUES (%s, %s, %s, 1, %s, %s, %s, %s, %s, %s) RETURNING car_id
-            ''', (car_identifier, now, now, status, today, vessel_id, holding_area_id, stack_number, is_in_holding))
-            car_id = cur.fetchone()['car_id']
-        
+            car_id = repo.insert_car(new_car_values(scan, now))
+
         # Insert scan record
-        cur.execute('''
-            INSERT INTO scans (car_id, worker_id, scan_time, shift_number, date)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (car_id, user_id, now, shift_number, today))
-        
-        conn.commit()
-        
-        # Get updated car info
-        cur.execute('''
-            SELECT c.*, u.full_name as last_worker,
-                   v.vessel_name, v.vessel_type,
-                   ha.area_name as holding_area_name
-            FROM cars c
-            LEFT JOIN scans s ON c.car_id = s.car_id AND s.scan_time = c.last_scan_time
-            LEFT JOIN users u ON s.worker_id = u.user_id
-            LEFT JOIN vessels v ON c.vessel_id = v.vessel_id
-            LEFT JOIN holding_areas ha ON c.holding_area_id = ha.holding_area_id
-            WHERE c.car_id = %s
-        ''', (car_id,))
-        updated_car = cur.fetchone()
-        
-        # Get previous scans
-        cur.execute('''
-            SELECT s.scan_time, u.full_name as worker_name, s.shift_number
-            FROM scans s
-            JOIN users u ON s.worker_id = u.user_id
-            WHERE s.car_id = %s AND s.worker_id != %s
-            ORDER BY s.scan_time DESC
-            LIMIT 3
-        ''', (car_id, user_id))
-        previous_scans = cur.fetchall()
-        
-        conn.close()
-        
-        scan_history = []
-        for scan in previous_scans:
-            time_ago = (now - scan['scan_time']).total_seconds() / 3600
-            time_str = f"{int(time_ago * 60)} min ago" if time_ago < 1 else f"{int(time_ago)}h ago"
-            scan_history.append({
-                'worker': scan['worker_name'],
-                'shift': scan['shift_number'],
-                'time_ago': time_str
-            })
-        
-        return jsonify({
-            'message': 'Scan recorded successfully', 
-            'car': dict(updated_car),
-            'previous_scans': scan_history,
-            'is_new': len(previous_scans) == 0 and car is None
-        })
-        
+        repo.insert_scan(car_id, user_id, now, shift_number, today)
+
+        repo.commit()
+
+        # Get updated car info and previous scans
+        updated_car, previous_scans = repo.scan_result(car_id, user_id)
+
+        repo.close()
+
+        return jsonify(scan_payload(car, updated_car, previous_scans, now))
+
     except Exception as e:
-        print(f"Scan error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Scan error', extra={'sample': True})
         return jsonify({'error': str(e)}), 500
 
 # GET CARS - FIXED
+MAX_CARS_PAGE_SIZE = 500
+
+def encode_cars_cursor(car):
+    """Opaque keyset cursor for the (last_scan_time, car_id) ordering"""
+    raw = f"{car['last_scan_time'].isoformat()}|{car['car_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cars_cursor(cursor):
+    last_scan_time, car_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(last_scan_time), int(car_id)
+
+def build_cars_query(args, current_user):
+    """
+    Turn /api/cars query args into a car list spec for the repository. The
+    dict also carries the SQL (query, params) and the paging/grouping
+    options; raises ValueError on bad input.
+    """
+    shift = args.get('shift', type=int)
+    date_filter = args.get('date', get_current_time().date().isoformat())
+    try:
+        date_filter = datetime.strptime(date_filter, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    holding_only = args.get('holding_only', 'false').lower() == 'true'
+    # location=holding|parked|all is matched by the partial indexes from setup_db.py;
+    # holding_only=true is kept for older clients
+    location = args.get('location', 'holding' if holding_only else 'all').lower()
+    group_by_location = args.get('group_by') == 'location'
+    fields = args.get('fields')
+    # Pagination is opt-in: without limit/cursor the full list is returned as before
+    paginate = 'limit' in args or 'cursor' in args
+    limit = min(max(args.get('limit', MAX_CARS_PAGE_SIZE, type=int), 1), MAX_CARS_PAGE_SIZE)
+
+    if location not in ('holding', 'parked', 'all'):
+        raise ValueError('location must be holding, parked or all')
+
+    requested = None
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in CAR_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # Columns the server itself needs for grouping and the next cursor
+        if group_by_location:
+            requested.append('is_in_holding')
+        if paginate:
+            requested += ['last_scan_time', 'car_id']
+        requested = list(dict.fromkeys(requested))
+
+    after = None
+    if args.get('cursor'):
+        try:
+            after = decode_cars_cursor(args['cursor'])
+        except ValueError:
+            raise ValueError('Invalid cursor')
+
+    spec = {
+        'date': date_filter,
+        'location': location,
+        # Workers only see cars they scanned themselves
+        'worker_id': current_user['user_id'] if current_user['role'] == 'worker' else None,
+        'shift': shift,
+        'status': args.get('status'),
+        'after': after,
+        'fields': requested,
+        'paginate': paginate,
+        'limit': limit,
+        'group_by_location': group_by_location
+    }
+    spec['query'], spec['params'] = cars_sql(spec)
+    return spec
+
+def cars_payload(cars, cars_query):
+    """Shape the rows fetched for build_cars_query() into the response body"""
+    next_cursor = None
+    if cars_query['paginate'] and len(cars) > cars_query['limit']:
+        cars = cars[:cars_query['limit']]
+        next_cursor = encode_cars_cursor(cars[-1])
+
+    # Combined shape lets one request fill both the holding and parked tables
+    if cars_query['group_by_location']:
+        result = {
+            'holding': [c for c in cars if c['is_in_holding']],
+            'parked': [c for c in cars if not c['is_in_holding']]
+        }
+    else:
+        result = cars
+
+    if cars_query['paginate']:
+        if not cars_query['group_by_location']:
+            result = {'cars': result}
+        result['next_cursor'] = next_cursor
+    return result
+
 @app.route('/api/cars', methods=['GET'])
 @token_required
+@conditional_get('cars', 'scans', 'users', 'vessels', 'holding_areas')
 def get_cars(current_user):
     try:
-        shift = request.args.get('shift', type=int)
-        date_filter = request.args.get('date', get_current_time().date().isoformat())
-        status_filter = request.args.get('status')
-        holding_only = request.args.get('holding_only', 'false').lower() == 'true'
-        
+        try:
+            cars_query = build_cars_query(request.args, current_user)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        repo = get_repository()
+        if cars_query['paginate']:
+            # Pages are bounded by MAX_CARS_PAGE_SIZE; fetch them whole for the cursor
+            cars = repo.list_cars(cars_query)
+            repo.close()
+            return jsonify(cars_payload(cars, cars_query))
+
+        if cars_query['group_by_location']:
+            # One cursor per group, read one after the other
+            members = [
+                (group, repo.stream_cars({**cars_query, 'location': group})
+                 if cars_query['location'] in (group, 'all') else ())
+                for group in ('holding', 'parked')
+            ]
+            members[0] = ('holding', prefetched(members[0][1]))
+            return streamed_json(json_object_chunks(members), repo)
+        return streamed_json(json_array_chunks(prefetched(repo.stream_cars(cars_query))), repo)
+    except Exception as e:
+        logger.exception('Error getting cars', extra={'sample': True})
+        return jsonify({'error': str(e)}), 500
+
+# CAR SEARCH - partial VIN / plate across all dates
+CAR_SEARCH_LIMIT = 20
+CAR_SEARCH_MAX_LIMIT = 100
+# Identifiers are stored upper-cased by scan_car, so LIKE can use the
+# varchar_pattern_ops index for prefixes and the trigram index otherwise.
+# The page of matches is ranked and cut in the subquery first, so the
+# last-scan lookup and the joins only run for the cars actually returned
+# rather than for every car a short prefix matches.
+CAR_SEARCH_SQL = '''
+    SELECT c.car_id, c.car_identifier, c.date, c.status, c.scan_count,
+           c.first_scan_time, c.last_scan_time, c.is_in_holding,
+           c.stack_number, ha.area_name as holding_area_name,
+           v.vessel_name, v.vessel_type,
+           ls.scan_time as last_scan, ls.shift_number as last_shift,
+           ls.worker_id as last_worker_id, u.full_name as last_worker
+    FROM (
+        SELECT c.car_id, c.car_identifier, c.date, c.status, c.scan_count,
+               c.first_scan_time, c.last_scan_time, c.is_in_holding, c.stack_number,
+               c.vessel_id, c.holding_area_id,
+               c.car_identifier = %(q)s AS exact_match,
+               c.car_identifier LIKE %(prefix)s AS prefix_match,
+               similarity(c.car_identifier, %(q)s) AS score
+        FROM cars c
+        WHERE c.is_active = TRUE
+          AND (c.car_identifier LIKE %(prefix)s
+               OR c.car_identifier LIKE %(contains)s
+               OR c.car_identifier %% %(q)s)
+          {worker_filter}
+        ORDER BY exact_match DESC, prefix_match DESC, score DESC, c.last_scan_time DESC
+        LIMIT %(limit)s
+    ) c
+    LEFT JOIN vessels v ON c.vessel_id = v.vessel_id
+    LEFT JOIN holding_areas ha ON c.holding_area_id = ha.holding_area_id
+    LEFT JOIN LATERAL (
+        SELECT s.scan_time, s.shift_number, s.worker_id
+        FROM scans s
+        WHERE s.car_id = c.car_id
+        ORDER BY s.scan_time DESC
+        LIMIT 1
+    ) ls ON TRUE
+    LEFT JOIN users u ON ls.worker_id = u.user_id
+    ORDER BY c.exact_match DESC, c.prefix_match DESC, c.score DESC, c.last_scan_time DESC
+'''
+
+CAR_SEARCH_QUERY = CAR_SEARCH_SQL.format(worker_filter='')
+# Workers only find cars they scanned themselves, as in /api/cars
+CAR_SEARCH_WORKER_QUERY = CAR_SEARCH_SQL.format(
+    worker_filter='AND EXISTS (SELECT 1 FROM scans sw WHERE sw.car_id = c.car_id AND sw.worker_id = %(worker_id)s)')
+
+def car_search_query(q, limit, current_user):
+    """(query, params) for a car search by current_user"""
+    pattern = escape_like(q)
+    params = {'prefix': f'{pattern}%', 'contains': f'%{pattern}%', 'q': q, 'limit': limit}
+    if current_user['role'] == 'worker':
+        return CAR_SEARCH_WORKER_QUERY, {**params, 'worker_id': current_user['user_id']}
+    return CAR_SEARCH_QUERY, params
+
+@app.route('/api/cars/search', methods=['GET'])
+@token_required
+def search_cars(current_user):
+    """Prefix and trigram lookup on car_identifier with each car's current location and last scan"""
+    try:
+        q = request.args.get('q', '').strip().upper()
+        limit = min(max(request.args.get('limit', CAR_SEARCH_LIMIT, type=int), 1), CAR_SEARCH_MAX_LIMIT)
+
+        if len(q) < 2:
+            return jsonify([])
+
         conn = get_db()
         cur = conn.cursor()
-        
-        base_query = '''
-            SELECT DISTINCT c.*, 
-                   (SELECT u.full_name FROM scans s 
-                    JOIN users u ON s.worker_id = u.user_id 
-                    WHERE s.car_id = c.car_id 
-                    ORDER BY s.scan_time DESC LIMIT 1) as last_worker,
-                   (SELECT s.worker_id FROM scans s 
-                    WHERE s.car_id = c.car_id 
-                    ORDER BY s.scan_time DESC LIMIT 1) as last_worker_id,
-                   v.vessel_name, v.vessel_type,
-                   ha.area_name as holding_area_name
-            FROM cars c
-            LEFT JOIN vessels v ON c.vessel_id = v.vessel_id
-            LEFT JOIN holding_areas ha ON c.holding_area_id = ha.holding_area_id
-            WHERE c.date = %s AND c.is_active = TRUE
-        '''
-        
-        params = [date_filter]
-        
-        if holding_only:
-            base_query += ' AND c.is_in_holding = TRUE'
-        
-        if current_user['role'] == 'worker':
-            base_query += ' AND EXISTS (SELECT 1 FROM scans s WHERE s.car_id = c.car_id AND s.worker_id = %s)'
-            params.append(current_user['user_id'])
-        elif shift:
-            base_query += ' AND EXISTS (SELECT 1 FROM scans s WHERE s.car_id = c.car_id AND s.shift_number = %s)'
-            params.append(shift)
-        
-        if status_filter:
-            base_query += ' AND c.status = %s'
-            params.append(status_filter)
-        
-        base_query += ' ORDER BY c.last_scan_time DESC'
-        
-        cur.execute(base_query, params)
+        cur.execute(*car_search_query(q, limit, current_user))
         cars = cur.fetchall()
         conn.close()
-        return jsonify([dict(c) for c in cars])
+        return jsonify(cars)
     except Exception as e:
-        print(f"Error getting cars: {e}")
+        logger.exception('Car search error', extra={'sample': True})
         return jsonify({'error': str(e)}), 500
 
 # DASHBOARD
 @app.route('/api/dashboard', methods=['GET'])
 @token_required
+@conditional_get('cars', 'scans', 'users')
 def get_dashboard(current_user):
     try:
-        conn = get_db()
-        cur = conn.cursor()
+        repo = get_repository()
         today = get_current_time().date()
         
-        if current_user['role'] == 'worker':
-            cur.execute('''
-                SELECT 
-                    COUNT(DISTINCT c.car_id) as total_cars,
-                    COUNT(DISTINCT CASE WHEN c.status = 'red' THEN c.car_id END) as overdue_cars,
-                    COUNT(DISTINCT CASE WHEN c.status = 'amber' THEN c.car_id END) as warning_cars,
-                    COUNT(DISTINCT CASE WHEN c.status = 'green' THEN c.car_id END) as active_cars
-                FROM cars c
-                JOIN scans s ON c.car_id = s.car_id
-                WHERE s.date = %s AND s.worker_id = %s
-            ''', (today, current_user['user_id']))
-        else:
-            cur.execute('''
-                SELECT 
-                    COUNT(DISTINCT car_id) as total_cars,
-                    COUNT(DISTINCT CASE WHEN status = 'red' THEN car_id END) as overdue_cars,
-                    COUNT(DISTINCT CASE WHEN status = 'amber' THEN car_id END) as warning_cars,
-                    COUNT(DISTINCT CASE WHEN status = 'green' THEN car_id END) as active_cars
-                FROM cars WHERE date = %s AND is_active = TRUE
-            ''', (today,))
-        
-        stats = cur.fetchone()
-        
-        cur.execute('SELECT COUNT(*) as count FROM users WHERE is_active = TRUE AND role = %s', ('worker',))
-        worker_stats = cur.fetchone()
-        
-        conn.close()
-        return jsonify({**dict(stats), 'active_workers': worker_stats['count']})
+        stats, active_workers = repo.dashboard(current_user, today)
+        repo.close()
+        return jsonify({**stats, 'active_workers': active_workers})
     except Exception as e:
-        print(f"Dashboard error: {e}")
+        logger.exception('Dashboard error', extra={'sample': True})
         return jsonify({'error': str(e)}), 500
 
 # EXCEL EXPORT - FIXED with proper auth
@@ -650,6 +1349,9 @@ def export_excel(current_user):
     data = cur.fetchall()
     conn.close()
     
+    # openpyxl adds ~0.1s to every worker start, and only the exports need it
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
     wb = Workbook()
     ws = wb.active
     ws.title = "Parking Report"
@@ -749,6 +1451,8 @@ def export_holding_excel(current_user):
     data = cur.fetchall()
     conn.close()
     
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
     wb = Workbook()
     ws = wb.active
     ws.title = "Holding Area"
@@ -804,14 +1508,11 @@ def not_found(e):
 
 @app.errorhandler(500)
 def internal_error(e):
-    print(f"Internal error: {e}")
+    logger.error('Internal error', exc_info=getattr(e, 'original_exception', None) or e)
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':  
-    print("=" * 60)
-    print("🚀 M Scanner - FIXED VERSION")
-    print("=" * 60)
-    print("📡 Server: http://localhost:5000")
-    print("🔐 Login: admin / admin123")
-    print("=" * 60)
+    logger.info("🚀 M Scanner - FIXED VERSION")
+    logger.info("📡 Server: http://localhost:5000")
+    logger.info("🔐 Login: admin / admin123")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+ASGI entry point - serves the Car Scanner API on asyncio.
+
+/api/events streams data changes over SSE, so each open dashboard costs a
+coroutine instead of a server thread. Every other route runs in the Flask app
+in app.py on a thread executor - with the same admission control, query
+budgets, metrics, conditional GET, compression and storage backend as under
+run.py - and its body is relayed chunk by chunk, so streamed lists stay
+streamed.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+or:
+    python asgi.py
+"""
+
+import asyncio
+import contextvars
+import io
+import logging
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import psycopg
+from werkzeug.datastructures import MultiDict
+
+from app import app as flask_app, DB_CONFIG, REQUEST_ID_PATTERN, log_context as flask_log_context, decode_token
+from logging_setup import set_context_provider
+from password_pool import SERVER_THREADS
+
+# Threads the Flask app runs on (CAR_SCANNER_THREADS, like run.py --threads)
+WSGI_EXECUTOR = ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix='wsgi')
+SSE_KEEPALIVE_SECONDS = 20
+
+logger = logging.getLogger('car_scanner.asgi')
+
+# (request id, handler name) of the request the current task is serving
+request_context = contextvars.ContextVar('request_context', default=None)
+
+def log_context():
+    # Requests handed to Flask run on executor threads and have Flask's context instead
+    return request_context.get() or flask_log_context()
+
+set_context_provider(log_context)
+
+# REQUEST / RESPONSE
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.body = body
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, stream=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or []
+        self.stream = stream
+
+def json_response(payload, status=200, headers=None):
+    # Encode with the Flask app's JSON provider so both servers emit identical bodies
+    body = flask_app.json.dumpb(payload) + b'\n'
+    return Response(body, status, [('content-type', 'application/json'), *(headers or [])])
+
+# SERVER-SENT EVENTS
+# One LISTEN connection relays the data_versions notifications from the
+# setup_db.py triggers (installed with setup_db.py --change-events) to every
+# subscriber, so each open dashboard costs a coroutine rather than a database
+# connection. Without those triggers the stream only carries keepalives.
+subscribers = set()
+
+class Subscriber:
+    """
+    Changed tables not yet sent to one client. Repeats coalesce, so a slow
+    client holds at most one entry per table and never holds up the others.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self.ready = asyncio.Event()
+
+    def notify(self, resource):
+        self.pending.add(resource)
+        self.ready.set()
+
+    async def changes(self, timeout):
+        """Tables changed since the last call; raises asyncio.TimeoutError after timeout seconds"""
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        self.ready.clear()
+        changes, self.pending = self.pending, set()
+        return sorted(changes)
+
+async def listen_for_changes():
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(**DB_CONFIG, autocommit=True)
+            async with conn:
+                await conn.execute('LISTEN data_versions')
+                async for notify in conn.notifies():
+                    for subscriber in list(subscribers):
+                        subscriber.notify(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Change listener error', extra={'error': str(e)})
+            await asyncio.sleep(5)
+
+async def events(request):
+    """text/event-stream of changed tables"""
+    request_context.set((request.request_id, 'events'))
+    # EventSource can't set headers, so this route alone also takes the JWT as
+    # ?token= (keep it out of the access log format)
+    header = request.headers.get('authorization') or request.args.get('token')
+    if not header:
+        return json_response({'error': 'Token missing'}, 401)
+    try:
+        decode_token(header)
+    except Exception as e:
+        logger.warning('Token decode error', extra={'error': str(e), 'sample': True})
+        return json_response({'error': 'Invalid token'}, 401)
+
+    async def stream():
+        subscriber = Subscriber()
+        subscribers.add(subscriber)
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                try:
+                    changes = await subscriber.changes(SSE_KEEPALIVE_SECONDS)
+                    yield b''.join(f'event: change\ndata: {resource}\n\n'.encode() for resource in changes)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+        finally:
+            subscribers.discard(subscriber)
+
+    return Response(status=200, headers=[
+        ('content-type', 'text/event-stream'),
+        ('cache-control', 'no-cache'),
+        ('x-accel-buffering', 'no')
+    ], stream=stream())
+
+# FLASK
+def start_flask(scope, body):
+    """
+    Run the Flask app for one request (on an executor thread) up to its
+    response headers. Returns (status, headers, body iterable or bytes).
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    started = {}
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower(), v) for k, v in headers]
+
+    result = flask_app(environ, start_response)
+    if any(k == 'content-length' for k, _ in started['headers']):
+        # Buffered response: already complete, send it in one piece
+        try:
+            return started['status'], started['headers'], b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    return started['status'], started['headers'], result
+
+async def relay_body(context, result):
+    """Pull a streamed Flask body on the executor, one chunk per hop"""
+    loop = asyncio.get_running_loop()
+    chunks = iter(result)
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(WSGI_EXECUTOR, context.run, next, chunks, None)
+            # shield: if the client goes, the thread still finishes its chunk
+            # before close() below touches the generator
+            chunk = await asyncio.shield(pending)
+            pending = None
+            if chunk is None:
+                return
+            if chunk:
+                yield chunk
+    finally:
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(WSGI_EXECUTOR, context.run, result.close)
+
+async def call_flask(scope, body):
+    loop = asyncio.get_running_loop()
+    # A streamed body holds Flask's request context (stream_with_context), a
+    # context variable, so every hop runs in the same context whichever
+    # executor thread takes it
+    context = contextvars.copy_context()
+    status, headers, content = await loop.run_in_executor(WSGI_EXECUTOR, context.run, start_flask, scope, body)
+    if isinstance(content, bytes):
+        return Response(content, status, headers)
+    return Response(status=status, headers=headers, stream=relay_body(context, content))
+
+# ASGI
+async def lifespan(receive, send):
+    listener = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            listener = asyncio.create_task(listen_for_changes())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if listener:
+                listener.cancel()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    if scope['method'] == 'GET' and scope['path'] == '/api/events':
+        request = Request(scope, body)
+        request_id = request.headers.get('x-request-id', '')
+        request.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        response = await events(request)
+        response.headers.append(('x-request-id', request.request_id))
+    else:
+        response = await call_flask(scope, body)
+
+    headers = [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in response.headers]
+    if response.stream is None and not any(k == b'content-length' for k, _ in headers):
+        headers.append((b'content-length', str(len(response.body)).encode()))
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+
+    if response.stream is None:
+        await send({'type': 'http.response.body', 'body': response.body})
+        return
+
+    # uvicorn's send() returns quietly once the client has gone, so watch
+    # receive() for the disconnect instead of waiting for a send to fail
+    disconnected = asyncio.create_task(wait_for_disconnect(receive))
+    chunks = response.stream.__aiter__()
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                # Cancelling the pending chunk runs the stream's cleanup
+                next_chunk.cancel()
+                await asyncio.gather(next_chunk, return_exceptions=True)
+                break
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                await send({'type': 'http.response.body', 'body': b''})
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    except OSError:
+        # Client went away mid-stream
+        pass
+    finally:
+        disconnected.cancel()
+        await response.stream.aclose()
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # psycopg's async connections need the selector event loop on Windows
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    logger.info("Starting Car Scanner API Server (asyncio)...")
+    logger.info("Server running on http://0.0.0.0:5000")
+    uvicorn.run(application, host='0.0.0.0', port=5000, loop='none')
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite - route handlers, Excel exports and the excel.py CLI
+
+Runs each benchmark in-process through the Flask test client (so admission,
+metrics and budgets are included, but no network) against the dataset from
+synthetic_data.py. Every benchmark reports min/median/p95/max wall time and
+the peak Python memory of one extra traced run; excel.py runs as a
+subprocess and reports the child's peak RSS instead.
+
+With --storage memory the app runs on the in-memory repository (see
+repository.py), filled with the same synthetic yard, so the handler numbers
+are Python time only - routing, logic and serialization without Postgres.
+The exports and excel.py still go straight to SQL and are skipped there.
+
+Results are written as JSON. Pass --baseline to compare against an earlier
+result file: any benchmark whose median time or memory peak grows by more
+than --threshold fails the run (exit code 1), so it can gate a deploy.
+
+    python synthetic_data.py --seed 1 --end-date 2026-01-31
+    python benchmark.py --save-baseline
+    python benchmark.py --baseline benchmark_results/baseline.json
+    python benchmark.py --storage memory --cars 20000
+
+json_flask_default / json_fast encode the same full car list with Flask's
+stdlib provider (after the old per-row dict copies) and with the app's
+provider (json_provider.py), to show what the encoder alone costs.
+
+/api/scan writes: each run adds a few hundred SYNBENCH cars and scans,
+which synthetic_data.py --reset removes along with the rest.
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+import psycopg
+
+from load_test import percentile
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+BASELINE_FILE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+PARKED_CAR_FIELDS = 'car_identifier,first_scan_time,last_scan_time,scan_count,last_worker,last_worker_id'
+HOLDING_CAR_FIELDS = ('car_identifier,last_scan_time,vessel_name,vessel_type,holding_area_name,'
+                      'stack_number,last_worker,last_worker_id')
+
+# Imported once --storage is known: app picks its backend at import time
+app_module = None
+
+# Benchmarks that bypass the repository layer
+SQL_ONLY_BENCHMARKS = ('export_excel', 'export_holding_excel', 'excel_cli')
+
+class BenchmarkError(Exception):
+    pass
+
+def load_app(storage):
+    global app_module
+    os.environ['CAR_SCANNER_STORAGE'] = storage
+    import app
+    app_module = app
+
+def summarise(name, timings, memory_peak_bytes, memory_kind, **details):
+    timings = sorted(timings)
+    return {
+        'name': name,
+        'runs': len(timings),
+        'min_ms': round(timings[0] * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3),
+        'memory_peak_kb': round(memory_peak_bytes / 1024, 1),
+        'memory_kind': memory_kind,
+        **details
+    }
+
+def time_request(client, name, make_request, repeat, warmup):
+    """Time make_request(client) `repeat` times, then once more under tracemalloc"""
+    def run():
+        response = make_request(client)
+        if response.status_code != 200:
+            raise BenchmarkError(f'{name}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}')
+        return response
+
+    for _ in range(warmup):
+        run()
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(run().get_data())
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarise(name, timings, peak, 'python_heap', response_bytes=size)
+
+def time_excel_cli(date, repeat):
+    """Wall time and child peak RSS of `python excel.py`"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'excel.py')
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'export.xlsx')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, script, '--date', date, '--output', output],
+                                    capture_output=True, text=True)
+            timings.append(time.perf_counter() - started)
+            if result.returncode != 0:
+                raise BenchmarkError(f'excel.py: exit {result.returncode} {result.stdout[-200:]}{result.stderr[-200:]}')
+        size = os.path.getsize(output)
+    # ru_maxrss is the largest child so far: KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_bytes = peak if sys.platform == 'darwin' else peak * 1024
+    return summarise('excel_cli', timings, peak_bytes, 'child_max_rss', output_bytes=size)
+
+def time_json_encoders(date, repeat, warmup):
+    """Encode the full /api/cars row list the old way (dict copies + Flask's provider) and the current way"""
+    from flask.json.provider import DefaultJSONProvider
+    from werkzeug.datastructures import MultiDict
+    flask_app = app_module.app
+    spec = app_module.build_cars_query(MultiDict({'date': date}), {'role': 'supervisor', 'user_id': 0})
+    repo = app_module.get_repository()
+    rows = repo.list_cars(spec)
+    repo.close()
+
+    stdlib = DefaultJSONProvider(flask_app)
+    encoders = [
+        ('json_flask_default', lambda: stdlib.response([dict(row) for row in rows])),
+        ('json_fast', lambda: flask_app.json.response(rows))
+    ]
+    results = []
+    with flask_app.app_context():
+        for name, encode in encoders:
+            for _ in range(warmup):
+                encode()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                size = len(encode().get_data())
+                timings.append(time.perf_counter() - started)
+            tracemalloc.start()
+            try:
+                encode()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            results.append(summarise(name, timings, peak, 'python_heap', rows=len(rows), response_bytes=size,
+                                     backend=getattr(flask_app.json, 'backend', 'json') if name == 'json_fast' else 'json'))
+    return results
+
+def dataset_facts():
+    """Benchmark date, a busy worker of the shift on duty and a supervisor"""
+    shift = app_module.get_current_shift()
+    with psycopg.connect(**app_module.DB_CONFIG) as conn:
+        date = conn.execute("SELECT MAX(date) FROM cars WHERE car_identifier LIKE 'SYN%'").fetchone()[0]
+        worker = conn.execute(r'''
+            SELECT u.user_id, u.username FROM users u
+            WHERE u.username LIKE 'syn\_worker\_%%' AND u.assigned_shift = %s AND u.is_active = TRUE
+            ORDER BY u.total_scans DESC NULLS LAST, u.user_id LIMIT 1
+        ''', (shift,)).fetchone()
+        counts = conn.execute('SELECT (SELECT COUNT(*) FROM cars), (SELECT COUNT(*) FROM scans)').fetchone()
+    if date is None or worker is None:
+        raise BenchmarkError('No synthetic dataset found - run synthetic_data.py first')
+    return {'date': date.isoformat(), 'worker_id': worker[0], 'worker_username': worker[1],
+            'shift': shift, 'cars': counts[0], 'scans': counts[1]}
+
+def memory_dataset_facts(options):
+    """Fill the in-memory repository with the synthetic yard; same facts as dataset_facts()"""
+    import synthetic_data
+    repository = app_module.memory_repository
+    yard_options = argparse.Namespace(seed=options.seed, workers=400, supervisors=24, cars=options.cars,
+                                      days=options.days, end_date=options.end_date, vessels=60, holding_areas=8,
+                                      holding_ratio=0.3, patrol_minutes=45)
+    started = time.time()
+    synthetic_data.fill_repository(repository, yard_options)
+    print(f'🧠 In-memory yard built in {time.time() - started:.1f}s')
+
+    shift = app_module.get_current_shift()
+    users = repository.tables['users'].values()
+    worker = max((u for u in users if u['role'] == 'worker' and u['assigned_shift'] == shift),
+                 key=lambda u: (u['total_scans'], -u['user_id']))
+    return {'date': max(repository.car_ids_by_date).isoformat(), 'worker_id': worker['user_id'],
+            'worker_username': worker['username'], 'shift': shift, 'cars': len(repository.tables['cars']),
+            'scans': len(repository.tables['scans'])}
+
+def memory_login(username):
+    """Token for a user of the in-memory store (login itself is not behind the repository)"""
+    user = next(u for u in app_module.memory_repository.tables['users'].values() if u['username'] == username)
+    return {'Authorization': f"Bearer {app_module.login_payload(user, None)['token']}"}
+
+def login(client, username, password):
+    response = client.post('/api/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise BenchmarkError(f'Login as {username} failed: HTTP {response.status_code}')
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def run_benchmarks(options):
+    memory = options.storage == 'memory'
+    facts = memory_dataset_facts(options) if memory else dataset_facts()
+    date = facts['date']
+    print(f"📦 Dataset: {facts['cars']:,} cars, {facts['scans']:,} scans - benchmarking {date}")
+
+    results = []
+    with app_module.app.test_client() as client:
+        if memory:
+            worker = memory_login(facts['worker_username'])
+            supervisor = memory_login('syn_supervisor_0')
+        else:
+            worker = login(client, facts['worker_username'], options.password)
+            supervisor = login(client, 'syn_supervisor_0', options.password)
+        rescan_ids = []
+
+        def scan(client):
+            # Two new cars for every re-scan, roughly what the yard sees
+            if rescan_ids and len(rescan_ids) % 3 == 0:
+                car_identifier = rescan_ids[len(rescan_ids) // 2]
+            else:
+                car_identifier = f'SYNBENCH{uuid.uuid4().hex[:12].upper()}'
+            rescan_ids.append(car_identifier)
+            return client.post('/api/scan', headers=worker, json={'car_identifier': car_identifier})
+
+        benchmarks = [
+            ('scan_car', scan),
+            ('get_cars_parked', lambda c: c.get('/api/cars', headers=supervisor, query_string={
+                'date': date, 'location': 'parked', 'fields': PARKED_CAR_FIELDS})),
+            ('get_cars_holding', lambda c: c.get('/api/cars', headers=supervisor, query_string={
+                'date': date, 'location': 'holding', 'fields': HOLDING_CAR_FIELDS})),
+            ('get_cars_all', lambda c: c.get('/api/cars', headers=supervisor, query_string={'date': date})),
+            ('get_dashboard', lambda c: c.get('/api/dashboard', headers=supervisor)),
+            ('get_worker_profile', lambda c: c.get(f"/api/workers/{facts['worker_id']}/profile", headers=supervisor)),
+            ('export_excel', lambda c: c.get('/api/export', headers=supervisor, query_string={'date': date})),
+            ('export_holding_excel', lambda c: c.get('/api/export/holding', headers=supervisor,
+                                                     query_string={'date': date}))
+        ]
+        for name, make_request in benchmarks:
+            if (options.only and name not in options.only) or (memory and name in SQL_ONLY_BENCHMARKS):
+                continue
+            result = time_request(client, name, make_request, options.repeat, options.warmup)
+            results.append(result)
+            print_result(result)
+
+    for result in time_json_encoders(date, options.repeat, options.warmup):
+        if not options.only or result['name'] in options.only:
+            results.append(result)
+            print_result(result)
+
+    if not memory and (not options.only or 'excel_cli' in options.only):
+        result = time_excel_cli(date, max(1, options.repeat // 5))
+        results.append(result)
+        print_result(result)
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'storage': options.storage,
+        'dataset': facts,
+        'repeat': options.repeat,
+        'benchmarks': results
+    }
+
+def print_result(result):
+    print(f"   {result['name']:<22} median {result['median_ms']:>9.2f} ms   p95 {result['p95_ms']:>9.2f} ms   "
+          f"peak {result['memory_peak_kb']:>10.1f} KB")
+
+def compare(current, baseline, threshold):
+    """Print the comparison; returns the names that regressed"""
+    previous = {b['name']: b for b in baseline['benchmarks']}
+    regressions = []
+    print('\n' + '=' * 80)
+    print(f"📈 COMPARED WITH BASELINE {baseline.get('created_at', '')} (threshold {threshold:.0%})")
+    print('=' * 80)
+    if baseline.get('storage', 'postgres') != current['storage']:
+        print(f"   ⚠️  Baseline used {baseline.get('storage', 'postgres')} storage, this run {current['storage']}")
+    for result in current['benchmarks']:
+        before = previous.get(result['name'])
+        if before is None:
+            print(f"   {result['name']:<22} (new)")
+            continue
+        time_change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        memory_change = (result['memory_peak_kb'] / before['memory_peak_kb'] - 1
+                         if before['memory_peak_kb'] else 0.0)
+        regressed = time_change > threshold or memory_change > threshold
+        if regressed:
+            regressions.append(result['name'])
+        print(f"   {'❌' if regressed else '✅'} {result['name']:<22} time {time_change:+7.1%}   "
+              f"memory {memory_change:+7.1%}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark route handlers, exports and excel.py')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed runs first')
+    parser.add_argument('--password', default='synthetic123', help='Password used by synthetic_data.py')
+    parser.add_argument('--storage', choices=['postgres', 'memory'], default='postgres',
+                        help='Run against Postgres or the in-memory repository')
+    parser.add_argument('--seed', type=int, default=1, help='Synthetic yard seed (memory storage)')
+    parser.add_argument('--cars', type=int, default=20000, help='Synthetic cars (memory storage)')
+    parser.add_argument('--days', type=int, default=30, help='Days of synthetic history (memory storage)')
+    parser.add_argument('--end-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help='Last day of synthetic history (memory storage, default: synthetic_data.DEFAULT_END_DATE)')
+    parser.add_argument('--only', nargs='+', help='Run just these benchmarks (e.g. scan_car excel_cli)')
+    parser.add_argument('--output', help='Result file (default: benchmark_results/<timestamp>.json)')
+    parser.add_argument('--baseline', help='Earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Allowed slowdown / memory growth before failing (default: %(default)s = 15%%)')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Also write the results to {BASELINE_FILE}')
+    options = parser.parse_args()
+    load_app(options.storage)
+
+    print('=' * 80)
+    print('⏱️  CAR SCANNER BENCHMARKS')
+    print('=' * 80)
+    try:
+        current = run_benchmarks(options)
+    except BenchmarkError as e:
+        print(f'❌ {e}')
+        sys.exit(2)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = options.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f'\n💾 Results written to {output}')
+    if options.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'📌 Baseline saved to {BASELINE_FILE}')
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, options.threshold)
+        if regressions:
+            print(f"\n❌ Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print('\n✅ No regressions')
@@ -0,0 +1,202 @@
+# RESPONSE COMPRESSION
+# The yard Wi-Fi is the slow part of most requests, so text responses are
+# compressed when the client offers it: brotli if the Brotli package is
+# installed and the client accepts br, otherwise gzip. Buffered responses are
+# only compressed above COMPRESS_MIN_BYTES. Streamed responses (the big lists,
+# see app.py STREAMED RESPONSES) are compressed chunk by chunk with a flush
+# after each one, so the client can start parsing before the body is complete
+# and nothing is buffered on the server.
+#
+# Static files are compressed once per process (gzip when StaticAssets loads
+# them, brotli in the background once they are first asked for) and served
+# under a content-hash fingerprint (css/style.<hash>.css) that can be cached
+# forever - a changed file gets a new name.
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:     # optional - see requirements.txt
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript',
+    'text/css', 'text/html', 'text/plain', 'image/svg+xml'
+}
+# Per-request compression favours speed; static files are done once at the top levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encodings):
+    """Best encoding we can produce from a werkzeug Accept-Encoding header, or None"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class StreamCompressor:
+    """Incremental compressor; every compress() returns output the client can decode right away"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31: zlib stream with a gzip header and trailer
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+def compress_bytes(data, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    return gzip.compress(data, STATIC_GZIP_LEVEL if static else GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks, encoding, close=None):
+    """Compress an iterable of bytes chunks; close() the source when done or abandoned"""
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if close is not None:
+            close()
+
+def compress_response(response, accept_encodings, min_bytes=COMPRESS_MIN_BYTES):
+    """Compress a Flask response in place if the client and the content allow it"""
+    if (response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        source = response.response
+        response.response = compress_stream(response.iter_encoded(), encoding, getattr(source, 'close', None))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    # The bytes differ per encoding, so the validator can only be a weak one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# STATIC ASSETS
+class StaticAsset:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(filename)
+        self.fingerprinted = f'{stem}.{self.digest}{ext}'
+        # encoding (None for identity) -> body
+        self.bodies = {None: data}
+
+    @property
+    def compressible(self):
+        return self.mimetype in COMPRESSIBLE_MIMETYPES and len(self.bodies[None]) >= COMPRESS_MIN_BYTES
+
+    def add_encoding(self, encoding):
+        body = compress_bytes(self.bodies[None], encoding, static=True)
+        if len(body) < len(self.bodies[None]):
+            self.bodies[encoding] = body
+
+    def body_for(self, accept_encodings):
+        """(encoding, body) to send; the best accepted encoding that has been built"""
+        best, best_quality = None, 0
+        for encoding in tuple(self.bodies):
+            if encoding is not None and accept_encodings[encoding] > best_quality:
+                best, best_quality = encoding, accept_encodings[encoding]
+        return best, self.bodies[best]
+
+class StaticAssets:
+    """
+    Every file under folder, read, fingerprinted and gzipped at load time.
+    Brotli at quality 11 takes ~150 ms for app.js, so those bodies are built
+    on a background thread and served as soon as they are ready. The thread is
+    started by the first lookup in each process: one started at import would
+    not survive the fork into run.py's prefork workers.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.by_filename = {}
+        self.by_fingerprint = {}
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    asset = StaticAsset(filename, f.read())
+                if asset.compressible:
+                    asset.add_encoding('gzip')
+                self.by_filename[filename] = asset
+                self.by_fingerprint[asset.fingerprinted] = asset
+
+        self.brotli_ready = threading.Event()
+        self._brotli_lock = threading.Lock()
+        self._brotli_pid = None     # process the build thread was started in
+        if brotli is None:
+            self.brotli_ready.set()
+
+    def start_brotli(self):
+        """Start building the brotli bodies in this process, unless done or under way"""
+        if self.brotli_ready.is_set() or self._brotli_pid == os.getpid():
+            return
+        with self._brotli_lock:
+            if self.brotli_ready.is_set() or self._brotli_pid == os.getpid():
+                return
+            self._brotli_pid = os.getpid()
+            threading.Thread(target=self._add_brotli, name='static-brotli', daemon=True).start()
+
+    def _add_brotli(self):
+        # A build interrupted by a fork is picked up where it stopped
+        for asset in list(self.by_filename.values()):
+            if asset.compressible and 'br' not in asset.bodies:
+                asset.add_encoding('br')
+        self.brotli_ready.set()
+
+    def url_path(self, filename):
+        """Fingerprinted path for filename (relative to the static folder), or None"""
+        self.start_brotli()
+        asset = self.by_filename.get(filename)
+        return asset.fingerprinted if asset is not None else None
+
+    def get(self, fingerprinted):
+        self.start_brotli()
+        return self.by_fingerprint.get(fingerprinted)
@@ -0,0 +1,99 @@
+# HOT STATEMENT REGISTRY
+# The queries behind /api/login, /api/scan and /api/dashboard. They run with
+# psycopg's prepare=True, so each pooled connection parses and plans them once
+# (on first use) and from then on only binds and executes them, with the
+# parameters sent separately like any other query. Columns are listed rather
+# than selected with *: a cached plan over * fails with "cached plan must not
+# change result type" after an ALTER TABLE adds a column.
+
+import threading
+
+# Every column of setup_db.py's cars table
+CAR_COLUMNS = ('car_id', 'car_identifier', 'first_scan_time', 'last_scan_time', 'scan_count', 'status', 'date',
+               'is_active', 'vessel_id', 'holding_area_id', 'stack_number', 'is_in_holding')
+
+# name -> SQL with %s placeholders
+HOT_STATEMENTS = {
+    'login_user': '''
+        SELECT user_id, username, password_hash, role, full_name, assigned_shift, supervisor_id, is_active
+        FROM users WHERE username = %s AND is_active = TRUE
+    ''',
+    'scan_find_car': f'''
+        SELECT {', '.join(CAR_COLUMNS)}
+        FROM cars WHERE car_identifier = %s AND is_active = TRUE
+    ''',
+    'scan_update_car': '''
+        UPDATE cars SET last_scan_time = %s, scan_count = %s, status = %s WHERE car_id = %s
+    ''',
+    'scan_update_car_holding': '''
+        UPDATE cars SET last_scan_time = %s, scan_count = %s, status = %s,
+               vessel_id = %s, holding_area_id = %s, stack_number = %s, is_in_holding = %s
+        WHERE car_id = %s
+    ''',
+    'scan_insert_car': '''
+        INSERT INTO cars (car_identifier, first_scan_time, last_scan_time, scan_count, status, date,
+                          vessel_id, holding_area_id, stack_number, is_in_holding)
+        VALUES (%s, %s, %s, 1, %s, %s, %s, %s, %s, %s) RETURNING car_id
+    ''',
+    'scan_insert_scan': '''
+        INSERT INTO scans (car_id, worker_id, scan_time, shift_number, date)
+        VALUES (%s, %s, %s, %s, %s)
+    ''',
+    'scan_car_details': f'''
+        SELECT {', '.join('c.' + column for column in CAR_COLUMNS)},
+               u.full_name as last_worker,
+               v.vessel_name, v.vessel_type,
+               ha.area_name as holding_area_name
+        FROM cars c
+        LEFT JOIN scans s ON c.car_id = s.car_id AND s.scan_time = c.last_scan_time
+        LEFT JOIN users u ON s.worker_id = u.user_id
+        LEFT JOIN vessels v ON c.vessel_id = v.vessel_id
+        LEFT JOIN holding_areas ha ON c.holding_area_id = ha.holding_area_id
+        WHERE c.car_id = %s
+    ''',
+    'scan_previous_scans': '''
+        SELECT s.scan_time, u.full_name as worker_name, s.shift_number
+        FROM scans s
+        JOIN users u ON s.worker_id = u.user_id
+        WHERE s.car_id = %s AND s.worker_id != %s
+        ORDER BY s.scan_time DESC
+        LIMIT 3
+    ''',
+    'dashboard_worker_stats': '''
+        SELECT
+            COUNT(DISTINCT c.car_id) as total_cars,
+            COUNT(DISTINCT CASE WHEN c.status = 'red' THEN c.car_id END) as overdue_cars,
+            COUNT(DISTINCT CASE WHEN c.status = 'amber' THEN c.car_id END) as warning_cars,
+            COUNT(DISTINCT CASE WHEN c.status = 'green' THEN c.car_id END) as active_cars
+        FROM cars c
+        JOIN scans s ON c.car_id = s.car_id
+        WHERE s.date = %s AND s.worker_id = %s
+    ''',
+    'dashboard_stats': '''
+        SELECT
+            COUNT(DISTINCT car_id) as total_cars,
+            COUNT(DISTINCT CASE WHEN status = 'red' THEN car_id END) as overdue_cars,
+            COUNT(DISTINCT CASE WHEN status = 'amber' THEN car_id END) as warning_cars,
+            COUNT(DISTINCT CASE WHEN status = 'green' THEN car_id END) as active_cars
+        FROM cars WHERE date = %s AND is_active = TRUE
+    ''',
+    'dashboard_active_workers': '''
+        SELECT COUNT(*) as count FROM users WHERE is_active = TRUE AND role = 'worker'
+    '''
+}
+
+_counts = {name: 0 for name in HOT_STATEMENTS}
+_counts_lock = threading.Lock()
+
+def execute_hot(conn, name, params=()):
+    """Execute a registered statement and return the cursor holding its results"""
+    with _counts_lock:
+        _counts[name] += 1
+    cur = conn.cursor()
+    cur.execute(HOT_STATEMENTS[name], params, prepare=True)
+    return cur
+
+def get_hot_statement_stats():
+    """Execution count of every registered statement"""
+    with _counts_lock:
+        return dict(_counts)
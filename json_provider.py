@@ -0,0 +1,74 @@
+# FAST JSON
+# Flask's default provider runs the stdlib encoder with sort_keys and a
+# Python default() call for every datetime, and formats them as HTTP dates.
+# FastJSONProvider encodes with orjson when it is installed: rows from the
+# cursor (plain dicts from dict_row) go in as they are, datetimes and dates
+# are written natively as ISO 8601 and the bytes go straight into the
+# response. Without orjson the stdlib encoder is used with the same output
+# format, so clients see one format either way.
+#
+# Naive datetimes are treated as UTC, as Flask's http_date() did.
+
+import datetime
+import decimal
+import json
+import uuid
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:     # optional - see requirements.txt
+    orjson = None
+
+def _default(obj):
+    """Types neither encoder handles natively"""
+    if isinstance(obj, decimal.Decimal):
+        # As Flask did: a string keeps NUMERIC precision
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, memoryview):
+        return obj.tobytes().decode()
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def _stdlib_default(obj):
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=datetime.timezone.utc)
+        return obj.isoformat()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    return _default(obj)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+class FastJSONProvider(JSONProvider):
+    """Compact, unsorted JSON; dumpb() returns bytes for callers that write them directly"""
+    mimetype = 'application/json'
+
+    @property
+    def backend(self):
+        return 'orjson' if orjson is not None else 'json'
+
+    def dumpb(self, obj):
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        return json.dumps(obj, default=_stdlib_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        # Formatting kwargs (separators, indent...) are ignored: output is always compact
+        return self.dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Load generator - simulates a shift of handheld scanners and dashboards
+
+Workers log in, load the holding areas and vessels once, then scan cars in a
+loop the way the scanner page does: a share of the scans re-scan a car that
+was already parked, a share go to a holding area with a vessel and stack, and
+every scan is followed by the worker's car list refresh. Supervisors poll
+/api/dashboard and the parked/holding car lists with ETags like app.js.
+
+At the end it prints throughput, p50/p95/p99 latency and the error rate per
+endpoint. Run it against a local server backed by Postgres:
+
+    python load_test.py --create-users --workers 40 --supervisors 5 --duration 120
+"""
+
+import argparse
+import json
+import math
+import random
+import string
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytz
+import requests
+
+SOUTH_AFRICA_TZ = pytz.timezone('Africa/Johannesburg')
+
+# Same field lists app.js asks for
+PARKED_CAR_FIELDS = 'car_identifier,first_scan_time,last_scan_time,scan_count,last_worker,last_worker_id'
+HOLDING_CAR_FIELDS = ('car_identifier,last_scan_time,vessel_name,vessel_type,holding_area_name,'
+                      'stack_number,last_worker,last_worker_id')
+
+def current_shift():
+    """Shift that is on duty now (see get_current_shift in app.py)"""
+    hour = datetime.now(SOUTH_AFRICA_TZ).hour
+    return 1 if 6 <= hour < 18 else 2
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile: the smallest value with at least pct% of values at or below it"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct * len(sorted_values) / 100) - 1)]
+
+class Stats:
+    """Latencies and outcomes per endpoint, shared by every client thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            entry = self.endpoints.get(endpoint)
+            if entry is None:
+                entry = self.endpoints[endpoint] = {'latencies': [], 'errors': 0, 'not_modified': 0, 'statuses': {}}
+            entry['latencies'].append(seconds)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            if status == 304:
+                entry['not_modified'] += 1
+            elif status == 0 or status >= 400:
+                entry['errors'] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        with self.lock:
+            items = sorted(self.endpoints.items())
+        for endpoint, entry in items:
+            latencies = sorted(entry['latencies'])
+            count = len(latencies)
+            rows.append({
+                'endpoint': endpoint,
+                'requests': count,
+                'rps': round(count / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+                'error_pct': round(entry['errors'] * 100 / count, 2) if count else 0.0,
+                'not_modified_pct': round(entry['not_modified'] * 100 / count, 2) if count else 0.0,
+                'statuses': {str(k): v for k, v in sorted(entry['statuses'].items())}
+            })
+        return rows
+
+class Client:
+    """One logged-in device: a requests session plus token refresh"""
+
+    def __init__(self, base_url, username, password, stats):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.session = requests.Session()
+        self.token = None
+        self.refresh_token = None
+        self.etags = {}
+
+    def call(self, method, endpoint, name=None, etag_key=None, retried=False, **kwargs):
+        """Send a request and record it under `name`; returns the response or None"""
+        headers = kwargs.pop('headers', {})
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if etag_key and etag_key in self.etags:
+            headers['If-None-Match'] = self.etags[etag_key]
+
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}/api{endpoint}',
+                                            headers=headers, timeout=30, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.stats.record(name or endpoint, time.perf_counter() - started, status)
+
+        if status == 401 and not retried and self.refresh_token and self.refresh():
+            return self.call(method, endpoint, name, etag_key, retried=True, **kwargs)
+        if response is not None and etag_key and response.headers.get('ETag'):
+            self.etags[etag_key] = response.headers['ETag']
+        return response
+
+    def login(self):
+        response = self.call('POST', '/login', json={'username': self.username, 'password': self.password})
+        if response is None or response.status_code != 200:
+            return False
+        data = response.json()
+        self.token = data['token']
+        self.refresh_token = data.get('refresh_token')
+        return True
+
+    def refresh(self):
+        response = self.call('POST', '/token/refresh', retried=True, json={'refresh_token': self.refresh_token})
+        if response is None or response.status_code != 200:
+            return False
+        data = response.json()
+        self.token = data['token']
+        self.refresh_token = data.get('refresh_token', self.refresh_token)
+        return True
+
+class ScannerWorker(threading.Thread):
+    """A worker walking the yard with a handheld scanner"""
+
+    def __init__(self, client, options, car_pool, stop_at):
+        super().__init__(daemon=True)
+        self.client = client
+        self.options = options
+        self.car_pool = car_pool
+        self.stop_at = stop_at
+        self.random = random.Random(f'{options.seed}:{client.username}')
+
+    def new_car_identifier(self):
+        return 'LT' + ''.join(self.random.choices(string.ascii_uppercase + string.digits, k=15))
+
+    def refresh(self):
+        """What the scanner page reloads after a scan and on its 60s timer (loadDashboardData, loadWorkerCars)"""
+        self.client.call('GET', '/dashboard', etag_key='dashboard')
+        self.client.call('GET', '/cars', name='/cars?group_by=location', etag_key='worker_cars', params={
+            'date': datetime.now(SOUTH_AFRICA_TZ).date().isoformat(),
+            'location': 'all',
+            'group_by': 'location',
+            'fields': f'{PARKED_CAR_FIELDS},{HOLDING_CAR_FIELDS}'
+        })
+
+    def run(self):
+        if not self.client.login():
+            return
+        holding_areas = self.client.call('GET', '/holding-areas')
+        vessels = self.client.call('GET', '/vessels')
+        holding_areas = holding_areas.json() if holding_areas is not None and holding_areas.ok else []
+        vessels = vessels.json() if vessels is not None and vessels.ok else []
+        self.refresh()
+        next_poll = time.time() + self.options.poll_interval
+
+        while time.time() < self.stop_at:
+            if self.car_pool and self.random.random() < self.options.rescan_ratio:
+                car_identifier = self.random.choice(self.car_pool)
+            else:
+                car_identifier = self.new_car_identifier()
+                self.car_pool.append(car_identifier)
+
+            body = {'car_identifier': car_identifier, 'is_in_holding': False}
+            if holding_areas and vessels and self.random.random() < self.options.holding_ratio:
+                body.update({
+                    'is_in_holding': True,
+                    'holding_area_id': self.random.choice(holding_areas)['holding_area_id'],
+                    'vessel_id': self.random.choice(vessels)['vessel_id'],
+                    'stack_number': str(self.random.randint(1, 40))
+                })
+            self.client.call('POST', '/scan', json=body)
+            self.refresh()
+
+            # The page's own timer keeps firing between scans
+            pause_until = time.time() + self.random.expovariate(1 / self.options.scan_interval)
+            while next_poll <= min(pause_until, self.stop_at):
+                time.sleep(max(0.0, next_poll - time.time()))
+                self.refresh()
+                next_poll += self.options.poll_interval
+            time.sleep(max(0.0, min(pause_until, self.stop_at) - time.time()))
+
+class DashboardPoller(threading.Thread):
+    """A supervisor screen refreshing on a timer"""
+
+    def __init__(self, client, options, stop_at):
+        super().__init__(daemon=True)
+        self.client = client
+        self.options = options
+        self.stop_at = stop_at
+        self.random = random.Random(f'{options.seed}:{client.username}')
+
+    def run(self):
+        if not self.client.login():
+            return
+        # Screens don't all refresh in lockstep
+        time.sleep(self.random.uniform(0, self.options.poll_interval))
+        while time.time() < self.stop_at:
+            date = datetime.now(SOUTH_AFRICA_TZ).date().isoformat()
+            self.client.call('GET', '/dashboard', etag_key='dashboard')
+            self.client.call('GET', '/cars', name='/cars?location=parked', etag_key='parked',
+                             params={'date': date, 'location': 'parked', 'fields': PARKED_CAR_FIELDS})
+            self.client.call('GET', '/cars', name='/cars?location=holding', etag_key='holding',
+                             params={'date': date, 'location': 'holding', 'fields': HOLDING_CAR_FIELDS})
+            time.sleep(self.options.poll_interval)
+
+def create_users(options, shift):
+    """Create the synthetic accounts through the admin API (existing ones are reused)"""
+    admin = Client(options.base_url, options.admin_username, options.admin_password, Stats())
+    if not admin.login():
+        print('❌ Admin login failed - cannot create load test users')
+        sys.exit(1)
+
+    supervisor_ids = []
+    for i in range(options.supervisors):
+        response = admin.call('POST', '/users', json={
+            'username': f'loadsupervisor_{i}', 'password': options.password,
+            'full_name': f'Load Supervisor {i}', 'role': 'supervisor'
+        })
+        if response is not None and response.status_code == 201:
+            supervisor_ids.append(response.json()['user_id'])
+
+    created = 0
+    for i in range(options.workers):
+        response = admin.call('POST', '/users', json={
+            'username': f'loadworker_s{shift}_{i}', 'password': options.password,
+            'full_name': f'Load Worker {shift}-{i}', 'role': 'worker', 'assigned_shift': shift,
+            'supervisor_id': supervisor_ids[i % len(supervisor_ids)] if supervisor_ids else None
+        })
+        if response is not None and response.status_code == 201:
+            created += 1
+    print(f'👥 Created {created} workers and {len(supervisor_ids)} supervisors (others already existed)')
+
+def print_report(rows, elapsed, scans):
+    print('\n' + '=' * 100)
+    print(f'📊 LOAD TEST RESULTS - {elapsed:.1f}s, {scans} scans')
+    print('=' * 100)
+    print(f"{'endpoint':<28}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'errors':>9}{'304':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<28}{row['requests']:>9}{row['rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+              f"{row['p99_ms']:>9}{row['max_ms']:>9}{row['error_pct']:>8}%{row['not_modified_pct']:>8}%")
+    print('=' * 100)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a shift of scanners and supervisor dashboards')
+    parser.add_argument('--base-url', default='http://localhost:5000', help='Server to load (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=20, help='Scanning workers')
+    parser.add_argument('--supervisors', type=int, default=3, help='Supervisor dashboards polling')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up starts')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which clients start')
+    parser.add_argument('--scan-interval', type=float, default=3.0, help='Mean seconds between one worker\'s scans')
+    parser.add_argument('--poll-interval', type=float, default=60.0, help='Dashboard and scanner page refresh period (app.js uses 60)')
+    parser.add_argument('--rescan-ratio', type=float, default=0.3, help='Share of scans that re-scan a known car')
+    parser.add_argument('--holding-ratio', type=float, default=0.25, help='Share of scans into a holding area')
+    parser.add_argument('--password', default='loadtest123', help='Password of the synthetic users')
+    parser.add_argument('--create-users', action='store_true', help='Create the synthetic users first (needs admin)')
+    parser.add_argument('--admin-username', default='admin')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for car ids and the scan mix')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to FILE as JSON')
+    options = parser.parse_args()
+
+    shift = current_shift()
+    if options.create_users:
+        create_users(options, shift)
+
+    stats = Stats()
+    car_pool = []   # cars scanned so far, shared so re-scans cross workers like in the yard
+    started = time.time()
+    stop_at = started + options.duration
+    clients = ([ScannerWorker(Client(options.base_url, f'loadworker_s{shift}_{i}', options.password, stats),
+                              options, car_pool, stop_at) for i in range(options.workers)] +
+               [DashboardPoller(Client(options.base_url, f'loadsupervisor_{i}', options.password, stats),
+                                options, stop_at) for i in range(options.supervisors)])
+
+    print(f'🚀 {options.workers} workers (shift {shift}) and {options.supervisors} supervisors '
+          f'against {options.base_url} for {options.duration:.0f}s')
+    try:
+        for i, client in enumerate(clients):
+            client.start()
+            time.sleep(options.ramp_up / max(len(clients), 1))
+        for client in clients:
+            client.join(max(0.0, stop_at - time.time()) + 30)
+    except KeyboardInterrupt:
+        print('\n⏹️  Interrupted - reporting what was collected')
+
+    elapsed = time.time() - started
+    rows = stats.summary(elapsed)
+    scans = next((row['requests'] for row in rows if row['endpoint'] == '/scan'), 0)
+    print_report(rows, elapsed, scans)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'options': vars(options), 'elapsed_seconds': round(elapsed, 2), 'endpoints': rows}, f, indent=2)
+        print(f'💾 Results written to {options.json}')
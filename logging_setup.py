@@ -0,0 +1,147 @@
+# STRUCTURED LOGGING
+# Log calls on request threads only put the record on a queue; a background
+# QueueListener thread formats each one as a JSON line and writes it to stdout
+# (and the log file, if any). An error storm therefore costs request threads
+# a queue put instead of a blocking write. Records carry the request id and
+# route, and records logged with extra={'sample': True} are thinned out per
+# route so a flood of identical errors doesn't swamp the log.
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_QUEUE_SIZE = 10000
+# endpoint -> keep 1 in N sampled records (unlisted routes keep everything)
+LOG_SAMPLING = {
+    'scan_car': 10,
+    'get_cars': 10,
+    'get_dashboard': 10,
+    'login': 10
+}
+
+_context_provider = None
+_sample_counters = {}
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+_outputs = []
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sample', 'request_id', 'route'}
+
+def set_context_provider(provider):
+    """provider() -> (request_id, route) for the current thread, or None"""
+    global _context_provider
+    _context_provider = provider
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage()
+        }
+        for key in ('request_id', 'route'):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: tags the request and applies per-route sampling"""
+
+    def filter(self, record):
+        context = _context_provider() if _context_provider else None
+        if context:
+            record.request_id, record.route = context
+
+        if getattr(record, 'sample', False):
+            every = LOG_SAMPLING.get(getattr(record, 'route', None), 1)
+            if every > 1:
+                key = (record.route, record.msg)
+                counter = _sample_counters.get(key)
+                if counter is None:
+                    counter = _sample_counters.setdefault(key, itertools.count())
+                if next(counter) % every:
+                    return False
+                record.sampled_1_in = every
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks: if the writer falls behind, records are dropped and counted"""
+    dropped = 0
+
+    def prepare(self, record):
+        # Merge args now (they may change later) but leave the JSON formatting
+        # and traceback rendering to the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+def _start_listener():
+    global _listener, _handler
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    root.addHandler(handler)
+    _handler = handler
+
+    _listener = logging.handlers.QueueListener(log_queue, *_outputs, respect_handler_level=True)
+    _listener.start()
+
+def configure_logging(log_file=None, level=logging.INFO):
+    """Route all logging through the queue; only the first call has an effect"""
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(formatter)
+        _outputs.append(stream)
+        if log_file:
+            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            _outputs.append(file_handler)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.setLevel(level)
+        _start_listener()
+        atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush everything still queued"""
+    if _listener is not None:
+        _listener.stop()
+
+def _after_fork_in_child():
+    # The writer thread doesn't survive fork(); prefork workers need their own
+    if _listener is not None:
+        _start_listener()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
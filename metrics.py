@@ -0,0 +1,119 @@
+# REQUEST METRICS
+# Every server thread records into its own shard (a plain dict nobody else
+# writes to), so the request path never takes a lock; /metrics sums the
+# shards when it is scraped. Output is the Prometheus text exposition format.
+
+import bisect
+import threading
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = {'started': {}, 'latency': {}, 'db': {}, 'status': {}}
+        _local.shard = shard
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+def _observe(histograms, key, seconds):
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+    histogram[0][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram[1] += seconds
+
+def request_started(route, method):
+    started = _shard()['started']
+    key = (route, method)
+    started[key] = started.get(key, 0) + 1
+
+def request_finished(route, method, status, seconds, db_seconds):
+    shard = _shard()
+    key = (route, method)
+    _observe(shard['latency'], key, seconds)
+    _observe(shard['db'], key, db_seconds)
+    status_key = (route, method, status)
+    shard['status'][status_key] = shard['status'].get(status_key, 0) + 1
+
+# EXPOSITION
+def _merge(name):
+    merged = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # Copy first: the owning thread may add keys while we iterate
+        for key, value in list(shard[name].items()):
+            if isinstance(value, list):
+                entry = merged.setdefault(key, [[0] * (len(LATENCY_BUCKETS) + 1), 0.0])
+                for i, count in enumerate(value[0]):
+                    entry[0][i] += count
+                entry[1] += value[1]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+def _histogram(lines, name, help_text, histograms):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (route, method), (counts, total) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {total:.6f}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {cumulative}')
+
+def _gauge(lines, name, help_text, samples, kind='gauge'):
+    """samples: [(labels dict, value)]"""
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(**labels) if labels else ""} {value}')
+
+def render_metrics(pool_stats=None, admission_stats=None, cancellations=None):
+    """The whole exposition as text; the extra stats come from the pool, admission.py and query_budget.py"""
+    latency = _merge('latency')
+    started = _merge('started')
+    lines = []
+
+    _histogram(lines, 'carscanner_http_request_duration_seconds',
+               'Time from routing to teardown per request', latency)
+    _histogram(lines, 'carscanner_http_request_db_seconds',
+               'Time spent waiting on Postgres per request', _merge('db'))
+    _gauge(lines, 'carscanner_http_requests_total', 'Finished requests by status code',
+           [({'route': r, 'method': m, 'status': s}, n) for (r, m, s), n in sorted(_merge('status').items())],
+           kind='counter')
+    _gauge(lines, 'carscanner_http_requests_in_flight', 'Requests currently being handled',
+           [({'route': r, 'method': m}, n - sum(latency.get((r, m), [[0]])[0]))
+            for (r, m), n in sorted(started.items())])
+
+    if pool_stats:
+        for key, value in sorted(pool_stats.items()):
+            _gauge(lines, f'carscanner_db_pool_{key}', f'psycopg pool statistic {key}', [({}, value)])
+
+    if admission_stats:
+        _gauge(lines, 'carscanner_admission_active', 'Requests holding an admission slot',
+               [({'class': c}, s['active']) for c, s in admission_stats.items()])
+        _gauge(lines, 'carscanner_admission_waiting', 'Requests queued for an admission slot',
+               [({'class': c}, s['waiting']) for c, s in admission_stats.items()])
+        _gauge(lines, 'carscanner_admission_rejected_total', 'Requests shed by admission control',
+               [({'class': c, 'reason': r}, n) for c, s in admission_stats.items() for r, n in s['rejected'].items()],
+               kind='counter')
+
+    if cancellations is not None:
+        _gauge(lines, 'carscanner_query_cancellations_total', 'Statements cancelled for exceeding a route budget',
+               [({'endpoint': c['endpoint'] or '', 'source': c['source']}, c['count']) for c in cancellations],
+               kind='counter')
+
+    return '\n'.join(lines) + '\n'
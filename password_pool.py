@@ -0,0 +1,78 @@
+# PASSWORD HASHING POOL
+# bcrypt is deliberately slow (~0.25s of CPU per check), and at the 06:00 and
+# 18:00 shift changes the whole crew logs in within a few minutes. Hashing and
+# verification run in a small process pool so they neither hold the GIL nor
+# tie up the threads /api/scan needs. The pool admits a bounded number of
+# jobs; past that, callers get PasswordPoolBusy and should answer 503.
+#
+# Each admitted job also parks the server thread waiting for its result, so
+# the bound sits below the server's thread count: a login surge can take at
+# most SERVER_THREADS - RESERVED_THREADS threads, and the rest stay free for
+# scans.
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+
+PASSWORD_POOL_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+PASSWORD_QUEUE_LIMIT = 32        # jobs allowed to wait behind the running ones
+SERVER_THREADS = int(os.environ.get('CAR_SCANNER_THREADS', 10))    # run.py --threads
+RESERVED_THREADS = 4             # server threads password jobs never take
+PASSWORD_JOB_LIMIT = max(1, min(PASSWORD_POOL_WORKERS + PASSWORD_QUEUE_LIMIT, SERVER_THREADS - RESERVED_THREADS))
+PASSWORD_TIMEOUT = 2             # seconds a request waits for its result
+PASSWORD_RETRY_AFTER = 2         # Retry-After sent with the 503
+
+class PasswordPoolBusy(Exception):
+    """Raised when the pool is full or a job did not finish in time"""
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_JOB_LIMIT)
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+def _hashpw(password):
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+def get_password_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the parent is a threaded server
+                _pool = ProcessPoolExecutor(max_workers=PASSWORD_POOL_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        future = get_password_pool().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+def submit_check_password(password, password_hash):
+    """Queue a bcrypt check; returns a concurrent.futures.Future of bool"""
+    if isinstance(password_hash, str):
+        password_hash = password_hash.encode('utf-8')
+    return _submit(_checkpw, password.encode(), password_hash)
+
+def check_password(password, password_hash):
+    try:
+        return submit_check_password(password, password_hash).result(timeout=PASSWORD_TIMEOUT)
+    except TimeoutError:
+        raise PasswordPoolBusy()
+
+def hash_password(password):
+    """bcrypt hash of password as a str, ready for users.password_hash"""
+    try:
+        return _submit(_hashpw, password.encode()).result(timeout=PASSWORD_TIMEOUT).decode()
+    except TimeoutError:
+        raise PasswordPoolBusy()
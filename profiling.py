@@ -0,0 +1,91 @@
+# ON-DEMAND REQUEST PROFILING
+# An admin can run a single request under cProfile by sending X-Profile: 1
+# (or ?profile=1). The profile is saved under a fresh server-side id as
+# <profile id>.prof in PROFILE_DIR and the id comes back in the X-Profile-Id
+# header; /api/admin/profiles lists and serves them. Requests without the switch only pay for the header check.
+
+import glob
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+PROFILE_KEEP = 50
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# cProfile hooks the interpreter, and from 3.12 only one profiler may be
+# active per process - so one profiled request at a time
+_active = threading.Lock()
+
+def start_profile():
+    """A running cProfile.Profile, or None if another request is being profiled"""
+    if not _active.acquire(blocking=False):
+        return None
+    # cProfile and pstats are imported on first use: most workers never profile
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Some other profiling tool is active
+        _active.release()
+        return None
+    return profiler
+
+def finish_profile(profiler, profile_id, metadata):
+    """Stop profiler and store it under profile_id (see new_profile_id)"""
+    profiler.disable()
+    _active.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id))
+    # Metadata lives next to the profile so every prefork worker sees the same list
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w') as f:
+        json.dump({'profile_id': profile_id, 'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                   **metadata}, f, default=str)
+
+    for old in sorted(glob.glob(os.path.join(PROFILE_DIR, '*.json')), key=os.path.getmtime)[:-PROFILE_KEEP]:
+        for path in (old, old[:-len('.json')] + '.prof'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return profile_id
+
+def new_profile_id():
+    # Never the client's X-Request-ID: a repeated id would overwrite another profile
+    return uuid.uuid4().hex
+
+def profile_path(profile_id):
+    return os.path.join(PROFILE_DIR, f'{profile_id}.prof')
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first"""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(PROFILE_DIR, '*.json')), key=os.path.getmtime, reverse=True):
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def has_profile(profile_id):
+    return bool(_SAFE_ID.match(profile_id or '')) and os.path.exists(profile_path(profile_id))
+
+def sort_keys():
+    """The orders profile_text() accepts (pstats.SortKey values)"""
+    import pstats
+    return sorted(key.value for key in pstats.SortKey)
+
+def profile_text(profile_id, sort='cumulative', limit=50):
+    """pstats report of a stored profile; sort is one of sort_keys()"""
+    import pstats
+    out = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
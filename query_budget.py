@@ -0,0 +1,189 @@
+# QUERY BUDGETS
+# Every route gets a time budget for its SQL. Each transaction on a checked out
+# connection runs with statement_timeout set to that budget, so Postgres
+# cancels any single statement that overruns it, and a watchdog thread cancels whatever the connection is
+# still running once the request as a whole is past budget plus a grace
+# period. Either way psycopg raises QueryCanceled; the cursors below note it
+# so the app can answer with a structured timeout error and count it. The
+# cursors also report every statement and its duration, for the request
+# metrics and the query statistics in query_stats.py.
+#
+# The timeout costs no round trip of its own: the cursors send
+# set_config(..., is_local => true) in a pipeline together with the first
+# statement of each transaction. Being transaction-local, nothing needs
+# committing and nothing carries over to the connection's next checkout.
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+import psycopg
+from psycopg.pq import TransactionStatus, PipelineStatus
+
+logger = logging.getLogger('car_scanner.query_budget')
+
+DEFAULT_QUERY_BUDGET_MS = 5000
+# endpoint -> milliseconds
+ROUTE_QUERY_BUDGETS = {
+    'login': 2000,
+    'scan_car': 2000,
+    'search_users': 2000,
+    'search_cars': 2000,
+    'get_dashboard': 3000,
+    'get_worker_profile': 3000,
+    'get_cars': 5000,
+    'export_excel': 30000,
+    'export_holding_excel': 30000
+}
+CANCEL_GRACE_MS = 500
+
+_cancellations = {}     # (endpoint, source) -> count
+_cancellations_lock = threading.Lock()
+_cancel_listener = None
+_statement_listener = None
+
+def query_budget_ms(endpoint):
+    return ROUTE_QUERY_BUDGETS.get(endpoint, DEFAULT_QUERY_BUDGET_MS)
+
+STATEMENT_TIMEOUT_SQL = "SELECT set_config('statement_timeout', %s, true)"
+
+def set_query_budget(conn, budget_ms):
+    """Run this checkout's transactions with statement_timeout = budget_ms (None: server default)"""
+    conn.statement_timeout_ms = budget_ms
+
+def _pending_timeout(conn, budget_ms):
+    """The timeout to send before the next statement, if it will open a transaction"""
+    if budget_ms is None or conn.info.transaction_status != TransactionStatus.IDLE:
+        return None
+    return (f'{budget_ms}ms',)
+
+def apply_statement_timeout(conn):
+    """
+    Send the checkout's timeout now, on its own. For statements the cursors
+    below don't see or can't pipeline, such as server-side cursors.
+    """
+    params = _pending_timeout(conn, getattr(conn, 'statement_timeout_ms', None))
+    if params:
+        psycopg.Cursor(conn).execute(STATEMENT_TIMEOUT_SQL, params)
+
+def on_cancellation(listener):
+    """Register listener(source) -> endpoint, called on every cancelled statement"""
+    global _cancel_listener
+    _cancel_listener = listener
+    return listener
+
+def on_statement(listener):
+    """Register listener(conn, query, params, seconds, name), called after every statement"""
+    global _statement_listener
+    _statement_listener = listener
+    return listener
+
+def record_statement(conn, query, params, seconds, name=None):
+    if _statement_listener:
+        _statement_listener(conn, query, params, seconds, name)
+
+def record_cancellation(conn):
+    """Called when a statement on conn raised QueryCanceled"""
+    source = 'deadline' if getattr(conn, 'deadline_cancelled', None) == getattr(conn, 'checkout_id', None) \
+        else 'statement_timeout'
+    endpoint = _cancel_listener(source) if _cancel_listener else None
+    with _cancellations_lock:
+        key = (endpoint, source)
+        _cancellations[key] = _cancellations.get(key, 0) + 1
+
+def get_cancellation_stats():
+    with _cancellations_lock:
+        return [{'endpoint': endpoint, 'source': source, 'count': count}
+                for (endpoint, source), count in sorted(_cancellations.items(), key=str)]
+
+class _BudgetedCursor:
+    def execute(self, query, params=None, **kwargs):
+        conn = self.connection
+        start = time.perf_counter()
+        try:
+            timeout = _pending_timeout(conn, getattr(conn, 'statement_timeout_ms', None))
+            if timeout is None:
+                return super().execute(query, params, **kwargs)
+            if conn.info.pipeline_status != PipelineStatus.OFF:
+                # Already batching (fetch_batch): queue it ahead of this statement
+                psycopg.Cursor(conn).execute(STATEMENT_TIMEOUT_SQL, timeout)
+                return super().execute(query, params, **kwargs)
+            with conn.pipeline():
+                psycopg.Cursor(conn).execute(STATEMENT_TIMEOUT_SQL, timeout)
+                super().execute(query, params, **kwargs)
+            return self
+        except psycopg.errors.QueryCanceled:
+            record_cancellation(self.connection)
+            raise
+        finally:
+            # In a pipeline execute() only queues; fetch_batch() times the whole batch
+            if self.connection.info.pipeline_status == PipelineStatus.OFF:
+                record_statement(self.connection, query, params, time.perf_counter() - start)
+
+class BudgetCursor(_BudgetedCursor, psycopg.Cursor):
+    pass
+
+# CLIENT-SIDE CANCEL
+class DeadlineWatchdog:
+    """
+    One thread holding a heap of deadlines for the connections in use, keyed
+    on the connection object: a connection has at most one live deadline, and
+    unwatch() (run when the pool takes it back) drops it.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.deadlines = {}     # connection -> sequence number of its live heap entry
+        # Held while a cancel is being sent, so unwatch() can wait for it
+        self.expiring = threading.Lock()
+        self.thread = None
+
+    def watch(self, conn, budget_ms):
+        deadline = time.monotonic() + (budget_ms + CANCEL_GRACE_MS) / 1000
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                # Started lazily so every prefork worker gets its own
+                self.thread = threading.Thread(target=self.run, name='query-deadlines', daemon=True)
+                self.thread.start()
+            sequence = next(self.sequence)
+            self.deadlines[conn] = sequence
+            heapq.heappush(self.heap, (deadline, sequence, conn))
+            self.condition.notify()
+
+    def unwatch(self, conn):
+        """Drop conn's deadline; statement_timeout still applies"""
+        with self.condition:
+            self.deadlines.pop(conn, None)
+        # A cancel already under way finishes before the caller reuses conn
+        with self.expiring:
+            pass
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, sequence, conn = heapq.heappop(self.heap)
+                if self.deadlines.get(conn) != sequence:
+                    continue    # unwatched or watched again since
+                del self.deadlines[conn]
+                self.expiring.acquire()
+            try:
+                self.expire(conn)
+            finally:
+                self.expiring.release()
+
+    def expire(self, conn):
+        # Skip connections that are idle between statements
+        if conn.closed or conn.info.transaction_status != TransactionStatus.ACTIVE:
+            return
+        conn.deadline_cancelled = conn.checkout_id
+        try:
+            conn.cancel_safe(timeout=5)
+        except Exception as e:
+            logger.warning('Query cancel error', extra={'error': str(e)})
+
+watchdog = DeadlineWatchdog()
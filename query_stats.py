@@ -0,0 +1,126 @@
+# QUERY STATISTICS AND SLOW-QUERY LOG
+# The pooled cursors report every statement (see query_budget.py). Each one
+# gets a stable name - the hot statement name for EXECUTEs, otherwise the
+# verb, first table and a hash of the normalised SQL - and its time is added
+# to per (name, route) totals. Statements over SLOW_QUERY_MS are written to
+# the slow-query log as JSON; a sample of the slow SELECTs is re-run under
+# EXPLAIN (ANALYZE, BUFFERS) so the log carries the plan as well.
+
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+import psycopg
+from psycopg.rows import tuple_row
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+# Fraction of slow SELECTs to EXPLAIN ANALYZE; it runs the query a second time
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.0))
+RECENT_SLOW_QUERIES = 100
+
+logger = logging.getLogger('car_scanner.slow_queries')
+
+_stats = {}     # (name, route) -> [calls, total_seconds, max_seconds]
+_stats_lock = threading.Lock()
+_recent_slow = deque(maxlen=RECENT_SLOW_QUERIES)
+_names = {}     # sql text -> name
+
+_EXECUTE = re.compile(r'^\s*EXECUTE\s+(\w+)', re.IGNORECASE)
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)', re.IGNORECASE)
+# Anything that can write, including a data-modifying CTE and SELECT ... INTO
+_WRITES = re.compile(r'\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|INTO)\b', re.IGNORECASE)
+
+def query_text(query):
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return str(query)
+
+def query_name(query):
+    """Stable, human-readable name for a SQL statement"""
+    text = query_text(query)
+    name = _names.get(text)
+    if name is None:
+        match = _EXECUTE.match(text)
+        if match:
+            name = match.group(1)
+        else:
+            normalised = ' '.join(text.split())
+            verb = normalised.split(' ', 1)[0].lower() if normalised else 'empty'
+            table = _TABLE.search(normalised)
+            digest = hashlib.sha1(normalised.encode()).hexdigest()[:8]
+            name = f"{verb}_{table.group(1).lower() if table else 'none'}_{digest}"
+        if len(_names) < 10000:
+            _names[text] = name
+    return name
+
+def record(conn, query, params, seconds, route, name=None):
+    name = name or query_name(query)
+    with _stats_lock:
+        entry = _stats.get((name, route))
+        if entry is None:
+            entry = _stats[(name, route)] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(conn, query, params, seconds, route, name)
+
+def log_slow_query(conn, query, params, seconds, route, name):
+    entry = {
+        'event': 'slow_query',
+        'query_name': name,
+        'route': route,
+        'duration_ms': round(seconds * 1000, 2),
+        'threshold_ms': SLOW_QUERY_MS,
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'sql': ' '.join(query_text(query).split())[:2000] if query is not None else None
+    }
+    if query is not None and SLOW_QUERY_EXPLAIN_RATE and random.random() < SLOW_QUERY_EXPLAIN_RATE:
+        entry['plan'] = explain(conn, query, params)
+    _recent_slow.append(entry)
+    logger.warning('Slow query', extra=entry)
+
+def explain(conn, query, params):
+    """EXPLAIN (ANALYZE, BUFFERS) a read-only statement on the same connection"""
+    text = query_text(query)
+    if not text.lstrip().upper().startswith('SELECT') or _WRITES.search(text):
+        return None     # ANALYZE would run the write again
+    if conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR:
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN itself isn't recorded
+        cur = psycopg.Cursor(conn, row_factory=tuple_row)
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + text, params)
+        return '\n'.join(row[0] for row in cur.fetchall())
+    except psycopg.Error as e:
+        return f'EXPLAIN failed: {e}'
+
+def get_query_stats(limit=20):
+    """Top statements by total time, plus the most recent slow queries"""
+    with _stats_lock:
+        rows = [
+            {
+                'query_name': name,
+                'route': route,
+                'calls': calls,
+                'total_ms': round(total * 1000, 2),
+                'mean_ms': round(total * 1000 / calls, 2),
+                'max_ms': round(longest * 1000, 2)
+            }
+            for (name, route), (calls, total, longest) in _stats.items()
+        ]
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return {
+        'slow_query_ms': SLOW_QUERY_MS,
+        'explain_rate': SLOW_QUERY_EXPLAIN_RATE,
+        'top': rows[:limit],
+        'recent_slow': list(_recent_slow)[-limit:]
+    }
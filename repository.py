@@ -0,0 +1,551 @@
+# STORAGE LAYER
+# The data routes (scan, cars, dashboard, worker profile, users, vessels,
+# holding areas) talk to a repository instead of a connection.
+# PostgresRepository wraps one pooled connection and runs the same SQL as
+# before - hot statements, pipelined batches and all. MemoryRepository keeps
+# the rows in dicts with the indexes those queries rely on and answers with
+# the same row shapes, so handlers can be run and benchmarked without
+# Postgres (CAR_SCANNER_STORAGE=memory, see app.get_repository).
+
+import bisect
+import itertools
+import threading
+import time
+from datetime import date, datetime, timedelta
+import psycopg
+from hot_statements import HOT_STATEMENTS, CAR_COLUMNS, execute_hot
+from query_budget import apply_statement_timeout, record_cancellation, record_statement
+import query_stats
+
+def fetch_batch(conn, statements):
+    """
+    Run independent (query, params) statements in one pipeline round trip.
+    A query may also be the name of a registered hot statement.
+    Returns the fetched rows of each statement, in order.
+    """
+    cursors = []
+    start = time.perf_counter()
+    try:
+        with conn.pipeline():
+            for query, params in statements:
+                if query in HOT_STATEMENTS:
+                    cur = execute_hot(conn, query, params)
+                else:
+                    cur = conn.cursor()
+                    cur.execute(query, params)
+                cursors.append(cur)
+    except psycopg.errors.QueryCanceled:
+        # Pipelined errors surface at the sync point, not in cursor.execute()
+        record_cancellation(conn)
+        raise
+    finally:
+        name = 'batch:' + '+'.join(q if q in HOT_STATEMENTS else query_stats.query_name(q) for q, _ in statements)
+        record_statement(conn, None, None, time.perf_counter() - start, name)
+    return [cur.fetchall() for cur in cursors]
+
+# STREAMED READS
+# Big lists are read through a named (server-side) cursor a chunk at a time,
+# so neither the rows nor the encoded JSON ever have to be held in full
+STREAM_CHUNK_ROWS = 500
+_stream_ids = itertools.count(1)
+
+def stream_rows(conn, query, params, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield lists of up to chunk_rows rows from a server-side cursor (needs an open transaction)"""
+    cur = conn.cursor(name=f'stream_{next(_stream_ids)}')
+    db_seconds = 0.0
+    try:
+        start = time.perf_counter()
+        # DECLARE can't go in a pipeline, so the budget goes out on its own
+        apply_statement_timeout(conn)
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            db_seconds += time.perf_counter() - start
+            if not rows:
+                break
+            yield rows
+            start = time.perf_counter()
+    except psycopg.errors.QueryCanceled:
+        record_cancellation(conn)
+        raise
+    finally:
+        try:
+            cur.close()
+        except psycopg.Error:
+            pass    # the transaction is already aborted; the pool rolls it back
+        record_statement(conn, query, params, db_seconds)
+
+def chunked(rows, chunk_rows=STREAM_CHUNK_ROWS):
+    for i in range(0, len(rows), chunk_rows):
+        yield rows[i:i + chunk_rows]
+
+# SQL
+HOLDING_AREAS_QUERY = 'SELECT * FROM holding_areas WHERE is_active = TRUE ORDER BY area_name'
+VESSELS_QUERY = 'SELECT * FROM vessels WHERE is_active = TRUE ORDER BY arrival_date DESC'
+VESSEL_INSERT = '''
+    INSERT INTO vessels (vessel_name, vessel_type, arrival_date)
+    VALUES (%s, %s, %s) RETURNING vessel_id
+'''
+
+def users_query(current_user):
+    """(query, params) for the user list the caller may see"""
+    if current_user['role'] == 'supervisor':
+        return ('''
+            SELECT u.*, s.full_name as supervisor_name
+            FROM users u
+            LEFT JOIN users s ON u.supervisor_id = s.user_id
+            WHERE u.supervisor_id = %s AND u.role = 'worker'
+            ORDER BY u.full_name
+        ''', (current_user['user_id'],))
+    return ('''
+        SELECT u.*, s.full_name as supervisor_name
+        FROM users u
+        LEFT JOIN users s ON u.supervisor_id = s.user_id
+        ORDER BY u.role, u.full_name
+    ''', ())
+
+def worker_profile_statements(worker_id, today):
+    """
+    The profile queries. The stats don't depend on the worker lookup, so they
+    can all go out in one pipeline and be discarded if the worker is missing.
+    """
+    return [
+        ('SELECT * FROM users WHERE user_id = %s AND role = \'worker\'', (worker_id,)),
+        ('SELECT COUNT(*) as today_scans FROM scans WHERE worker_id = %s AND date = %s', (worker_id, today)),
+        ('SELECT COUNT(*) as week_scans FROM scans WHERE worker_id = %s AND date >= CURRENT_DATE - INTERVAL \'7 days\'', (worker_id,)),
+        ('SELECT COUNT(DISTINCT car_id) as unique_cars FROM scans WHERE worker_id = %s', (worker_id,)),
+        ('''
+            SELECT c.car_identifier, s.scan_time, s.shift_number
+            FROM scans s
+            JOIN cars c ON s.car_id = c.car_id
+            WHERE s.worker_id = %s
+            ORDER BY s.scan_time DESC
+            LIMIT 10
+        ''', (worker_id,))
+    ]
+
+def dashboard_statements(current_user, today):
+    if current_user['role'] == 'worker':
+        stats_query = ('dashboard_worker_stats', (today, current_user['user_id']))
+    else:
+        stats_query = ('dashboard_stats', (today,))
+    return [stats_query, ('dashboard_active_workers', ())]
+
+# Columns update_car() may change, in the order scan_update_car_holding takes them
+HOLDING_COLUMNS = ('vessel_id', 'holding_area_id', 'stack_number', 'is_in_holding')
+
+def update_car_statement(car_id, changes):
+    """(hot statement, params) writing a re-scan's changes (see app.scan_car_changes)"""
+    base = (changes['last_scan_time'], changes['scan_count'], changes['status'])
+    if 'is_in_holding' in changes:
+        return ('scan_update_car_holding', base + tuple(changes[c] for c in HOLDING_COLUMNS) + (car_id,))
+    return ('scan_update_car', base + (car_id,))
+
+def insert_car_params(values):
+    """Params for the scan_insert_car hot statement"""
+    return (values['car_identifier'], values['first_scan_time'], values['last_scan_time'], values['status'],
+            values['date'], values['vessel_id'], values['holding_area_id'], values['stack_number'],
+            values['is_in_holding'])
+
+# Columns a client may request with fields=; the last worker subqueries only
+# run when last_worker / last_worker_id are asked for.
+LAST_WORKER_SQL = '''(SELECT u.full_name FROM scans s
+                    JOIN users u ON s.worker_id = u.user_id
+                    WHERE s.car_id = c.car_id
+                    ORDER BY s.scan_time DESC LIMIT 1) as last_worker'''
+LAST_WORKER_ID_SQL = '''(SELECT s.worker_id FROM scans s
+                    WHERE s.car_id = c.car_id
+                    ORDER BY s.scan_time DESC LIMIT 1) as last_worker_id'''
+
+CAR_FIELDS = {
+    'car_id': 'c.car_id',
+    'car_identifier': 'c.car_identifier',
+    'first_scan_time': 'c.first_scan_time',
+    'last_scan_time': 'c.last_scan_time',
+    'scan_count': 'c.scan_count',
+    'status': 'c.status',
+    'date': 'c.date',
+    'is_active': 'c.is_active',
+    'vessel_id': 'c.vessel_id',
+    'holding_area_id': 'c.holding_area_id',
+    'stack_number': 'c.stack_number',
+    'is_in_holding': 'c.is_in_holding',
+    'last_worker': LAST_WORKER_SQL,
+    'last_worker_id': LAST_WORKER_ID_SQL,
+    'vessel_name': 'v.vessel_name',
+    'vessel_type': 'v.vessel_type',
+    'holding_area_name': 'ha.area_name as holding_area_name'
+}
+DEFAULT_CAR_COLUMNS = f'''c.*,
+                   {LAST_WORKER_SQL},
+                   {LAST_WORKER_ID_SQL},
+                   v.vessel_name, v.vessel_type,
+                   ha.area_name as holding_area_name'''
+
+def cars_sql(spec):
+    """(query, params) for a car list spec built by app.build_cars_query()"""
+    columns = ', '.join(CAR_FIELDS[f] for f in spec['fields']) if spec['fields'] else DEFAULT_CAR_COLUMNS
+    query = f'''
+        SELECT {columns}
+        FROM cars c
+        LEFT JOIN vessels v ON c.vessel_id = v.vessel_id
+        LEFT JOIN holding_areas ha ON c.holding_area_id = ha.holding_area_id
+        WHERE c.date = %s AND c.is_active = TRUE
+    '''
+    params = [spec['date']]
+
+    if spec['location'] == 'holding':
+        query += ' AND c.is_in_holding = TRUE'
+    elif spec['location'] == 'parked':
+        query += ' AND c.is_in_holding IS NOT TRUE'
+
+    if spec['worker_id']:
+        query += ' AND EXISTS (SELECT 1 FROM scans s WHERE s.car_id = c.car_id AND s.worker_id = %s)'
+        params.append(spec['worker_id'])
+    elif spec['shift']:
+        query += ' AND EXISTS (SELECT 1 FROM scans s WHERE s.car_id = c.car_id AND s.shift_number = %s)'
+        params.append(spec['shift'])
+
+    if spec['status']:
+        query += ' AND c.status = %s'
+        params.append(spec['status'])
+
+    if spec['after']:
+        query += ' AND (c.last_scan_time, c.car_id) < (%s, %s)'
+        params += list(spec['after'])
+
+    query += ' ORDER BY c.last_scan_time DESC, c.car_id DESC'
+
+    if spec['paginate']:
+        # One extra row tells us whether another page exists
+        query += ' LIMIT %s'
+        params.append(spec['limit'] + 1)
+    return query, params
+
+class PostgresRepository:
+    """Repository over one pooled connection; close() returns it to the pool"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _fetch_all(self, query, params=()):
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        return cur.fetchall()
+
+    # holding areas and vessels
+    def list_holding_areas(self):
+        """Active areas by name; raises psycopg.errors.UndefinedTable before setup_db.py has run"""
+        return self._fetch_all(HOLDING_AREAS_QUERY)
+
+    def list_vessels(self):
+        return self._fetch_all(VESSELS_QUERY)
+
+    def stream_vessels(self):
+        return stream_rows(self.conn, VESSELS_QUERY, ())
+
+    def create_vessel(self, vessel_name, vessel_type, arrival_date):
+        return self._fetch_all(VESSEL_INSERT, (vessel_name, vessel_type, arrival_date))[0]['vessel_id']
+
+    # users
+    def list_users(self, current_user):
+        return self._fetch_all(*users_query(current_user))
+
+    def stream_users(self, current_user):
+        return stream_rows(self.conn, *users_query(current_user))
+
+    def worker_profile(self, worker_id, today):
+        """Rows of the worker_profile_statements(), for app.worker_profile_payload()"""
+        return fetch_batch(self.conn, worker_profile_statements(worker_id, today))
+
+    # cars and scans
+    def find_car(self, car_identifier):
+        return execute_hot(self.conn, 'scan_find_car', (car_identifier,)).fetchone()
+
+    def insert_car(self, values):
+        return execute_hot(self.conn, 'scan_insert_car', insert_car_params(values)).fetchone()['car_id']
+
+    def update_car(self, car_id, changes):
+        execute_hot(self.conn, *update_car_statement(car_id, changes))
+
+    def insert_scan(self, car_id, worker_id, scan_time, shift_number, scan_date):
+        execute_hot(self.conn, 'scan_insert_scan', (car_id, worker_id, scan_time, shift_number, scan_date))
+
+    def scan_result(self, car_id, worker_id):
+        """(car with last worker/vessel/area, last 3 scans of it by other workers)"""
+        updated_rows, previous_scans = fetch_batch(self.conn, [
+            ('scan_car_details', (car_id,)),
+            ('scan_previous_scans', (car_id, worker_id))
+        ])
+        return updated_rows[0], previous_scans
+
+    def list_cars(self, spec):
+        return self._fetch_all(*cars_sql(spec))
+
+    def stream_cars(self, spec):
+        """Chunks of list_cars(spec); the cursor is only opened once iteration starts"""
+        return stream_rows(self.conn, *cars_sql(spec))
+
+    def dashboard(self, current_user, today):
+        """(stats row, active worker count)"""
+        stats_rows, worker_rows = fetch_batch(self.conn, dashboard_statements(current_user, today))
+        return stats_rows[0], worker_rows[0]['count']
+
+# IN-MEMORY BACKEND
+# Column defaults of setup_db.py's tables, applied to every inserted row
+TABLE_DEFAULTS = {
+    'users': {'supervisor_id': None, 'assigned_shift': None, 'is_active': True, 'phone': None, 'email': None,
+              'profile_image': None, 'bio': None, 'total_scans': 0, 'last_scan_date': None},
+    'cars': {'scan_count': 1, 'is_active': True, 'vessel_id': None, 'holding_area_id': None,
+             'stack_number': None, 'is_in_holding': False},
+    'scans': {},
+    'vessels': {'vessel_type': 'ship', 'arrival_date': None, 'departure_date': None, 'is_active': True},
+    'holding_areas': {'area_code': None, 'capacity': None, 'is_active': True}
+}
+PRIMARY_KEYS = {'users': 'user_id', 'cars': 'car_id', 'scans': 'scan_id',
+                'vessels': 'vessel_id', 'holding_areas': 'holding_area_id'}
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def _scan_key(scan):
+    return (scan['scan_time'], scan['scan_id'])
+
+def _name_key(user):
+    # ORDER BY full_name puts NULLs last
+    return (user['full_name'] is None, user['full_name'] or '')
+
+class MemoryRepository:
+    """
+    Process-local store with the same semantics as PostgresRepository. Writes
+    are visible immediately (commit() is a no-op) and one lock serialises all
+    access, which is plenty for tests and single-process benchmarks.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tables = {table: {} for table in PRIMARY_KEYS}
+        self.next_ids = {table: 1 for table in PRIMARY_KEYS}
+        self.car_ids_by_identifier = {}
+        self.car_ids_by_date = {}
+        self.scans_by_car = {}      # car_id -> scans sorted by (scan_time, scan_id)
+        self.scans_by_worker = {}   # worker_id -> scans sorted by (scan_time, scan_id)
+        self.versions = {table: 0 for table in PRIMARY_KEYS}   # stands in for data_versions
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def insert(self, table, row):
+        """Add a row (setup_db.py defaults applied, id assigned unless given); returns its id"""
+        key = PRIMARY_KEYS[table]
+        with self.lock:
+            row = {**TABLE_DEFAULTS[table], **row}
+            if row.get(key) is None:
+                row[key] = self.next_ids[table]
+            self.next_ids[table] = max(self.next_ids[table], row[key] + 1)
+            self.tables[table][row[key]] = row
+            self.versions[table] += 1
+
+            if table == 'cars':
+                if row['car_identifier'] in self.car_ids_by_identifier:
+                    raise ValueError(f"duplicate car_identifier {row['car_identifier']}")
+                self.car_ids_by_identifier[row['car_identifier']] = row['car_id']
+                self.car_ids_by_date.setdefault(row['date'], set()).add(row['car_id'])
+            elif table == 'scans':
+                for index, owner in ((self.scans_by_car, row['car_id']), (self.scans_by_worker, row['worker_id'])):
+                    scans = index.setdefault(owner, [])
+                    if not scans or _scan_key(scans[-1]) <= _scan_key(row):
+                        scans.append(row)
+                    else:
+                        bisect.insort(scans, row, key=_scan_key)
+            return row[key]
+
+    def data_versions(self, resources):
+        """{resource: version} like the data_versions table; every write bumps its table"""
+        with self.lock:
+            return {r: self.versions[r] for r in resources if r in self.versions}
+
+    # holding areas and vessels
+    def list_holding_areas(self):
+        with self.lock:
+            areas = [dict(a) for a in self.tables['holding_areas'].values() if a['is_active']]
+        return sorted(areas, key=lambda a: a['area_name'])
+
+    def list_vessels(self):
+        with self.lock:
+            vessels = [dict(v) for v in self.tables['vessels'].values() if v['is_active']]
+        # ORDER BY arrival_date DESC puts NULLs first
+        undated = [v for v in vessels if v['arrival_date'] is None]
+        dated = sorted((v for v in vessels if v['arrival_date'] is not None),
+                       key=lambda v: _as_date(v['arrival_date']), reverse=True)
+        return undated + dated
+
+    def stream_vessels(self):
+        yield from chunked(self.list_vessels())
+
+    def create_vessel(self, vessel_name, vessel_type, arrival_date):
+        return self.insert('vessels', {'vessel_name': vessel_name, 'vessel_type': vessel_type,
+                                       'arrival_date': _as_date(arrival_date) or None,
+                                       'created_date': datetime.now()})
+
+    # users
+    def _user_row(self, user):
+        supervisor = self.tables['users'].get(user['supervisor_id'])
+        return {**user, 'supervisor_name': supervisor['full_name'] if supervisor else None}
+
+    def list_users(self, current_user):
+        with self.lock:
+            users = self.tables['users'].values()
+            if current_user['role'] == 'supervisor':
+                rows = [self._user_row(u) for u in users
+                        if u['supervisor_id'] == current_user['user_id'] and u['role'] == 'worker']
+                return sorted(rows, key=_name_key)
+            return sorted((self._user_row(u) for u in users), key=lambda u: (u['role'], *_name_key(u)))
+
+    def stream_users(self, current_user):
+        yield from chunked(self.list_users(current_user))
+
+    def worker_profile(self, worker_id, today):
+        today = _as_date(today)
+        with self.lock:
+            worker = self.tables['users'].get(worker_id)
+            scans = self.scans_by_worker.get(worker_id, [])
+            week_start = today - timedelta(days=7)
+            recent = [{'car_identifier': self.tables['cars'][s['car_id']]['car_identifier'],
+                       'scan_time': s['scan_time'], 'shift_number': s['shift_number']}
+                      for s in reversed(scans[-10:])]
+            return [
+                [dict(worker)] if worker and worker['role'] == 'worker' else [],
+                [{'today_scans': sum(1 for s in scans if s['date'] == today)}],
+                [{'week_scans': sum(1 for s in scans if s['date'] >= week_start)}],
+                [{'unique_cars': len({s['car_id'] for s in scans})}],
+                recent
+            ]
+
+    # cars and scans
+    def find_car(self, car_identifier):
+        with self.lock:
+            car = self.tables['cars'].get(self.car_ids_by_identifier.get(car_identifier))
+            return dict(car) if car and car['is_active'] else None
+
+    def insert_car(self, values):
+        return self.insert('cars', {**values, 'date': _as_date(values['date'])})
+
+    def update_car(self, car_id, changes):
+        with self.lock:
+            self.tables['cars'][car_id].update(changes)
+            self.versions['cars'] += 1
+
+    def insert_scan(self, car_id, worker_id, scan_time, shift_number, scan_date):
+        self.insert('scans', {'car_id': car_id, 'worker_id': worker_id, 'scan_time': scan_time,
+                              'shift_number': shift_number, 'date': _as_date(scan_date)})
+
+    def _last_scan(self, car_id):
+        scans = self.scans_by_car.get(car_id)
+        return scans[-1] if scans else None
+
+    def _car_row(self, car):
+        """c.* plus the joined columns of DEFAULT_CAR_COLUMNS"""
+        last_scan = self._last_scan(car['car_id'])
+        last_worker = self.tables['users'].get(last_scan['worker_id']) if last_scan else None
+        vessel = self.tables['vessels'].get(car['vessel_id'])
+        area = self.tables['holding_areas'].get(car['holding_area_id'])
+        return {
+            **{column: car[column] for column in CAR_COLUMNS},
+            'last_worker': last_worker['full_name'] if last_worker else None,
+            'last_worker_id': last_scan['worker_id'] if last_scan else None,
+            'vessel_name': vessel['vessel_name'] if vessel else None,
+            'vessel_type': vessel['vessel_type'] if vessel else None,
+            'holding_area_name': area['area_name'] if area else None
+        }
+
+    def scan_result(self, car_id, worker_id):
+        with self.lock:
+            car = self.tables['cars'][car_id]
+            # scan_car_details joins the scan taken at last_scan_time
+            last_scan = next((s for s in reversed(self.scans_by_car.get(car_id, []))
+                              if s['scan_time'] == car['last_scan_time']), None)
+            last_worker = self.tables['users'].get(last_scan['worker_id']) if last_scan else None
+            vessel = self.tables['vessels'].get(car['vessel_id'])
+            area = self.tables['holding_areas'].get(car['holding_area_id'])
+            details = {**car,
+                       'last_worker': last_worker['full_name'] if last_worker else None,
+                       'vessel_name': vessel['vessel_name'] if vessel else None,
+                       'vessel_type': vessel['vessel_type'] if vessel else None,
+                       'holding_area_name': area['area_name'] if area else None}
+
+            previous = []
+            for scan in reversed(self.scans_by_car.get(car_id, [])):
+                worker = self.tables['users'].get(scan['worker_id'])
+                if scan['worker_id'] != worker_id and worker is not None:
+                    previous.append({'scan_time': scan['scan_time'], 'worker_name': worker['full_name'],
+                                     'shift_number': scan['shift_number']})
+                    if len(previous) == 3:
+                        break
+            return details, previous
+
+    def list_cars(self, spec):
+        on_date = _as_date(spec['date'])
+        with self.lock:
+            matches = []
+            for car_id in self.car_ids_by_date.get(on_date, ()):
+                car = self.tables['cars'][car_id]
+                if not car['is_active']:
+                    continue
+                if spec['location'] == 'holding' and car['is_in_holding'] is not True:
+                    continue
+                if spec['location'] == 'parked' and car['is_in_holding'] is True:
+                    continue
+                if spec['status'] and car['status'] != spec['status']:
+                    continue
+                if spec['worker_id']:
+                    if not any(s['worker_id'] == spec['worker_id'] for s in self.scans_by_car.get(car_id, ())):
+                        continue
+                elif spec['shift']:
+                    if not any(s['shift_number'] == spec['shift'] for s in self.scans_by_car.get(car_id, ())):
+                        continue
+                if spec['after'] and (car['last_scan_time'], car_id) >= spec['after']:
+                    continue
+                matches.append(car)
+
+            matches.sort(key=lambda c: (c['last_scan_time'], c['car_id']), reverse=True)
+            if spec['paginate']:
+                matches = matches[:spec['limit'] + 1]
+
+            rows = [self._car_row(car) for car in matches]
+        if spec['fields']:
+            rows = [{f: row[f] for f in spec['fields']} for row in rows]
+        return rows
+
+    def stream_cars(self, spec):
+        yield from chunked(self.list_cars(spec))
+
+    def dashboard(self, current_user, today):
+        today = _as_date(today)
+        with self.lock:
+            if current_user['role'] == 'worker':
+                car_ids = {s['car_id'] for s in self.scans_by_worker.get(current_user['user_id'], ())
+                           if s['date'] == today}
+                cars = [self.tables['cars'][car_id] for car_id in car_ids]
+            else:
+                cars = [c for c in (self.tables['cars'][i] for i in self.car_ids_by_date.get(today, ()))
+                        if c['is_active']]
+            active_workers = sum(1 for u in self.tables['users'].values() if u['is_active'] and u['role'] == 'worker')
+
+        statuses = [c['status'] for c in cars]
+        stats = {
+            'total_cars': len(statuses),
+            'overdue_cars': statuses.count('red'),
+            'warning_cars': statuses.count('amber'),
+            'active_cars': statuses.count('green')
+        }
+        return stats, active_workers
@@ -0,0 +1,56 @@
+# ACCESS TOKEN REVOCATION LIST
+# Access tokens are checked without touching the database, so deactivating a
+# user has to reach every process some other way. The users_revoke_tokens
+# trigger (setup_db.py) NOTIFYs 'auth_revocations' with the user id; a
+# listener thread per process records it here, and decode_token() rejects any
+# token issued before that moment.
+
+import time
+import threading
+import logging
+import psycopg
+
+logger = logging.getLogger('car_scanner.revocations')
+
+CHANNEL = 'auth_revocations'
+RECONNECT_SECONDS = 5
+
+# user_id -> epoch seconds of the revocation. Replaced wholesale or updated
+# one key at a time, so readers never need the lock.
+_revoked = {}
+_listener_lock = threading.Lock()
+_listener = None
+
+def revoke_user(user_id, when=None):
+    """Reject this user's access tokens issued at or before `when`"""
+    _revoked[int(user_id)] = time.time() if when is None else when
+
+def is_revoked(claims):
+    revoked_at = _revoked.get(claims.get('user_id'))
+    return revoked_at is not None and claims.get('iat', 0) <= revoked_at
+
+def _listen(db_config):
+    while True:
+        try:
+            with psycopg.connect(**db_config, autocommit=True) as conn:
+                conn.execute(f'LISTEN {CHANNEL}')
+                # Anything deactivated while we weren't listening
+                now = time.time()
+                for (user_id,) in conn.execute('SELECT user_id FROM users WHERE is_active = FALSE'):
+                    _revoked.setdefault(user_id, now)
+                for notify in conn.notifies():
+                    revoke_user(notify.payload)
+        except Exception as e:
+            logger.warning('Revocation listener error', extra={'error': str(e)})
+            time.sleep(RECONNECT_SECONDS)
+
+def start_revocation_listener(db_config):
+    """Start this process's listener thread (idempotent, safe after fork)"""
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, args=(db_config,),
+                                         name='revocations', daemon=True)
+            _listener.start()
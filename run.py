@@ -1,41 +1,253 @@
 #!/usr/bin/env python
+"""
+Car Scanner API server.
+
+    python run.py                  single waitress process (as before)
+    python run.py --workers 4      prefork: a master process supervises 4 waitress
+                                   workers sharing one listening socket
+
+In prefork mode the master restarts workers that crash, recycles each worker
+after --max-requests requests, and on SIGTERM/Ctrl+C lets every worker finish
+its in-flight requests (up to --graceful-timeout seconds) before exiting.
+"""
 import sys
 import logging
 import signal
 import os
+import time
+import random
+import socket
+import argparse
+import threading
 
-# Set up logging to file
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('server.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from logging_setup import configure_logging, stop_logging
 
 logger = logging.getLogger(__name__)
 
-# Handle Windows signals gracefully
-def signal_handler(sig, frame):
-    logger.info('Received signal, shutting down gracefully...')
-    sys.exit(0)
+def parse_args():
+    parser = argparse.ArgumentParser(description='Car Scanner API server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CAR_SCANNER_WORKERS', 1)),
+                        help='worker processes (1 = no master process)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('CAR_SCANNER_THREADS', 10)),
+                        help='waitress threads per worker')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recycle a worker after this many requests (0 = never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help='random extra requests per worker so they do not all recycle at once')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='seconds a draining worker may spend finishing requests')
+    return parser.parse_args()
+
+def create_listen_socket(host, port):
+    """Bind the socket every worker accepts on"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # Lets a new master bind alongside the old one during a restart
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+# WORKER
+class Worker:
+    """One waitress server on the shared socket, counting requests for recycling"""
+
+    def __init__(self, app, sock, args):
+        from waitress.server import create_server
+
+        self.app = app
+        self.max_requests = args.max_requests
+        if self.max_requests and args.max_requests_jitter:
+            self.max_requests += random.randint(0, args.max_requests_jitter)
+        self.graceful_timeout = args.graceful_timeout
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.draining = False
+        self.server = create_server(self.wsgi, sockets=[sock], threads=args.threads)
+
+    def wsgi(self, environ, start_response):
+        with self.lock:
+            self.requests += 1
+            recycle = self.max_requests and self.requests == self.max_requests
+        if recycle:
+            logger.info(f"Worker served {self.requests} requests, recycling")
+            self.drain()
+        return self.app(environ, start_response)
+
+    def drain(self, *_):
+        with self.lock:
+            if self.draining:
+                return
+            self.draining = True
+        threading.Thread(target=self._drain, name='drain', daemon=True).start()
+
+    def _drain(self):
+        server = self.server
+        # Stop accepting; the other workers keep serving the shared socket
+        server.trigger.pull_trigger(lambda: setattr(server, 'accepting', False))
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while server.active_channels and time.monotonic() < deadline:
+            # Idle keep-alive connections are closed once their last response is flushed
+            server.trigger.pull_trigger(self._close_idle_channels)
+            time.sleep(0.1)
+
+        if server.active_channels:
+            logger.warning(f"Graceful timeout, dropping {len(server.active_channels)} connections")
+
+        from waitress import wasyncore
+        server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map))
+
+    def _close_idle_channels(self):
+        for channel in list(self.server.active_channels.values()):
+            if not channel.requests:
+                channel.will_close = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.drain)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master decides on Ctrl+C
+        self.server.run()
+        self.server.task_dispatcher.shutdown()
+
+# MASTER
+class Master:
+    """Forks the workers and keeps N of them running until told to stop"""
+
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self, sock):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+
+        status = 0
+        try:
+            Worker(self.app, sock, self.args).run()
+        except Exception as e:
+            logger.error(f"Worker error: {e}", exc_info=True)
+            status = 1
+        finally:
+            # os._exit skips atexit, so flush the log queue by hand
+            stop_logging()
+            os._exit(status)
+
+    def stop(self, sig, frame):
+        if not self.stopping:
+            logger.info('Received signal, draining workers...')
+        self.stopping = True
+
+    def run(self, sock):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for _ in range(self.args.workers):
+            self.spawn(sock)
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+        while not self.stopping:
+            self.reap(respawn_sock=sock)
+            time.sleep(0.5)
+
+        for pid in self.workers:
+            self.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in self.workers:
+            logger.warning(f"Worker {pid} did not exit, killing it")
+            self.kill(pid, signal.SIGKILL)
+        sock.close()
+        logger.info('Server stopped')
+
+    def reap(self, respawn_sock=None):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0:
+                logger.error(f"Worker {pid} exited with status {code}")
+
+            if respawn_sock is not None and not self.stopping:
+                if code != 0 and time.monotonic() - started < 1:
+                    # Crashing on startup (e.g. a bad deploy) - don't spin
+                    time.sleep(1)
+                self.spawn(respawn_sock)
+
+    def kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+def serve_single(app, args):
+    from waitress import serve
+
+    # Handle Windows signals gracefully
+    def signal_handler(sig, frame):
+        logger.info('Received signal, shutting down gracefully...')
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+def main():
+    args = parse_args()
+
+    # JSON lines to stdout and server.log, written by a background thread so a
+    # burst of errors never blocks the request threads on file I/O. Done here
+    # rather than at import: the bcrypt pool's spawned processes import this
+    # module too, and must not open server.log or start writer threads.
+    # Before importing app, whose own configure_logging() call is then a no-op.
+    configure_logging(log_file='server.log')
 
-try:
     # Prevent sys.exit() from being called by Flask
     os.environ['WERKZEUG_RUN_MAIN'] = 'true'
-    
-    from waitress import serve
+    # password_pool.py sizes its job limit from the thread count
+    os.environ['CAR_SCANNER_THREADS'] = str(args.threads)
+
+    # Imported before forking so workers share the loaded code; the database
+    # pool is created lazily, so no connection crosses the fork
     from app import app
-    
+
     logger.info("Starting Car Scanner API Server...")
-    logger.info("Server running on http://0.0.0.0:5000")
+    logger.info(f"Server running on http://{args.host}:{args.port}")
     logger.info("Press Ctrl+C to stop")
-    
-    serve(app, host='0.0.0.0', port=5000, threads=10)
-except Exception as e:
-    logger.error(f"Fatal error: {e}", exc_info=True)
-    sys.exit(1)
+
+    if args.workers > 1 and not hasattr(os, 'fork'):
+        logger.warning("Prefork mode needs os.fork (not available on Windows), running one process")
+        args.workers = 1
+
+    if args.workers <= 1:
+        serve_single(app, args)
+        return
+
+    logger.info(f"Prefork mode: {args.workers} workers x {args.threads} threads")
+    Master(app, args).run(create_listen_socket(args.host, args.port))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"Fatal error: {e}", exc_info=True)
+        sys.exit(1)
@@ -1,3 +1,4 @@
+import argparse
 import psycopg
 from psycopg import sql
 import bcrypt
@@ -8,8 +9,8 @@ DB_USER = 'postgres'
 DB_PASSWORD = 'postgres'
 DB_HOST = 'localhost'
 
-def check_and_fix_database():
-    """Check database and fix all issues"""
+def check_and_fix_database(change_events=False):
+    """Check database and fix all issues; change_events installs the /api/events NOTIFY triggers"""
     try:
         conn = psycopg.connect(
             dbname=DB_NAME,
@@ -248,11 +249,155 @@ def check_and_fix_database():
             cur.execute('CREATE INDEX IF NOT EXISTS idx_scans_worker_id ON scans(worker_id)')
             cur.execute('CREATE INDEX IF NOT EXISTS idx_scans_date ON scans(date)')
             cur.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
+            # Keyset order for /api/cars, plus partial indexes for location=holding|parked
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cars_date_keyset ON cars(date, last_scan_time DESC, car_id DESC)
+                WHERE is_active = TRUE
+            ''')
+            cur.execute('DROP INDEX IF EXISTS idx_cars_holding_date')
+            cur.execute('DROP INDEX IF EXISTS idx_cars_parked_date')
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cars_holding_keyset ON cars(date, last_scan_time DESC, car_id DESC)
+                WHERE is_in_holding = TRUE AND is_active = TRUE
+            ''')
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cars_parked_keyset ON cars(date, last_scan_time DESC, car_id DESC)
+                WHERE is_in_holding IS NOT TRUE AND is_active = TRUE
+            ''')
             print("✅ Indexes created!")
             conn.commit()
         except Exception as e:
             print(f"⚠️  Indexes: {e}")
-        
+
+        # CHECK 7A: Trigram indexes for /api/users/search
+        print("🔧 Creating search indexes...")
+        try:
+            cur.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING gin (username gin_trgm_ops)')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops)')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_users_supervisor ON users(supervisor_id) WHERE is_active = TRUE')
+            # /api/cars/search: prefix LIKE, substring/fuzzy trigram match, latest scan per car
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_cars_identifier_prefix ON cars(car_identifier varchar_pattern_ops)')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_cars_identifier_trgm ON cars USING gin (car_identifier gin_trgm_ops)')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_scans_car_time ON scans(car_id, scan_time DESC)')
+            print("✅ Search indexes created!")
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️  Search indexes: {e}")
+            conn.rollback()
+
+        # CHECK 8: Data version counters used for API ETags
+        print("🔧 Creating data version triggers...")
+        try:
+            # One counter row per (resource, backend slot); the version is their sum.
+            # A writer only ever locks its own backend's row, so concurrent scans
+            # don't queue behind each other on a single 'cars'/'scans' row, and the
+            # bump still only becomes visible when the writing transaction commits.
+            # (A sequence would avoid the row entirely, but nextval() is visible
+            # before commit: a poll in between would cache the new version with the
+            # old rows.)
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    resource VARCHAR(50) NOT NULL,
+                    slot SMALLINT NOT NULL DEFAULT 0,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (resource, slot)
+                )
+            ''')
+            # Tables created before slots existed keep their count in slot 0. Only
+            # migrated once: rebuilding the key locks the table and rewrites the index.
+            cur.execute("""
+                SELECT column_name
+                FROM information_schema.key_column_usage
+                WHERE table_name = 'data_versions' AND constraint_name = 'data_versions_pkey'
+            """)
+            if {row[0] for row in cur.fetchall()} != {'resource', 'slot'}:
+                print("🔧 Adding backend slots to data_versions...")
+                cur.execute('ALTER TABLE data_versions ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0')
+                cur.execute('ALTER TABLE data_versions DROP CONSTRAINT IF EXISTS data_versions_pkey')
+                cur.execute('ALTER TABLE data_versions ADD PRIMARY KEY (resource, slot)')
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO data_versions (resource, slot, version)
+                    VALUES (TG_TABLE_NAME, pg_backend_pid() % 1024, 1)
+                    ON CONFLICT (resource, slot) DO UPDATE SET version = data_versions.version + 1;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            # NOTIFY makes every committing transaction take Postgres's global
+            # notify queue lock, so the change events for asgi.py's /api/events
+            # are only sent when asked for (setup_db.py --change-events)
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION notify_data_change() RETURNS trigger AS $$
+                BEGIN
+                    -- Delivered on commit; asgi.py relays it to /api/events subscribers
+                    PERFORM pg_notify('data_versions', TG_TABLE_NAME);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            for table in ('users', 'cars', 'scans', 'vessels', 'holding_areas'):
+                cur.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                    sql.Identifier(f'{table}_change_event'), sql.Identifier(table)))
+                if change_events:
+                    cur.execute(sql.SQL('''
+                        CREATE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_data_change()
+                    ''').format(sql.Identifier(f'{table}_change_event'), sql.Identifier(table)))
+                cur.execute(
+                    'INSERT INTO data_versions (resource) VALUES (%s) ON CONFLICT DO NOTHING',
+                    (table,)
+                )
+                cur.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                    sql.Identifier(f'{table}_data_version'), sql.Identifier(table)))
+                cur.execute(sql.SQL('''
+                    CREATE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()
+                ''').format(sql.Identifier(f'{table}_data_version'), sql.Identifier(table)))
+            print(f"✅ Data version triggers created (change events {'on' if change_events else 'off'})!")
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️  Data versions: {e}")
+            conn.rollback()
+
+        # CHECK 9: Refresh tokens and access token revocation
+        print("🔧 Creating refresh token table...")
+        try:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS refresh_tokens (
+                    token_id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(user_id),
+                    token_hash CHAR(64) NOT NULL UNIQUE,
+                    issued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    expires_at TIMESTAMPTZ NOT NULL,
+                    revoked_at TIMESTAMPTZ
+                )
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id)')
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION notify_user_revoked() RETURNS trigger AS $$
+                BEGIN
+                    -- Every app process drops the user's access tokens on commit
+                    IF OLD.is_active AND NOT NEW.is_active THEN
+                        PERFORM pg_notify('auth_revocations', NEW.user_id::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            cur.execute('DROP TRIGGER IF EXISTS users_revoke_tokens ON users')
+            cur.execute('''
+                CREATE TRIGGER users_revoke_tokens AFTER UPDATE OF is_active ON users
+                FOR EACH ROW EXECUTE FUNCTION notify_user_revoked()
+            ''')
+            print("✅ Refresh tokens created!")
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️  Refresh tokens: {e}")
+            conn.rollback()
+
         print("=" * 60)
         print("✅ DATABASE CHECK COMPLETE!")
         print("=" * 60)
@@ -283,10 +428,15 @@ def check_and_fix_database():
         return False
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create or repair the Car Scanner schema')
+    parser.add_argument('--change-events', action='store_true',
+                        help='NOTIFY on every data change for the ASGI /api/events stream')
+    args = parser.parse_args()
+
     print("\n🚀 M SCANNER DATABASE FIX TOOL")
     print("=" * 60)
     
-    if check_and_fix_database():
+    if check_and_fix_database(change_events=args.change_events):
         print("\n✅ ALL FIXES COMPLETED SUCCESSFULLY!")
         print("\nNext steps:")
         print("1. Start your Flask app: python app.py")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Cold-start report for an API worker process.
+
+    python startup_report.py                     import time per module, time to first request
+    python startup_report.py --runs 5 --top 30   median of 5 fresh interpreters
+    python startup_report.py --budget-ms 1500    exit 1 if the cold start is over budget
+    python startup_report.py --json
+
+Every run is a fresh interpreter (python -X importtime) that imports app and
+serves one request through the test client - what a new or recycled prefork
+worker goes through before it can answer. Storage defaults to memory, so no
+database is needed and the numbers are not skewed by connection set-up.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Dependencies only some requests need; none of them should be loaded by a cold start
+LAZY_MODULES = ('openpyxl', 'cProfile', 'pstats')
+RESULT_PREFIX = 'STARTUP_RESULT '
+
+# Runs in the child: argv[1] = spawn time (time.time()), argv[2] = path to request
+CHILD = f'''
+import json, resource, sys, time
+import_start = time.perf_counter()
+import app
+imported = time.perf_counter()
+with app.app.test_client() as client:
+    status = client.get(sys.argv[2]).status_code
+served = time.perf_counter()
+print({RESULT_PREFIX!r} + json.dumps({{
+    'cold_start_ms': (time.time() - float(sys.argv[1])) * 1000,
+    'import_ms': (imported - import_start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': status,
+    'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'lazy_loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]
+}}), flush=True)
+'''
+
+def parse_importtime(stderr):
+    """Modules imported directly by app: {name: (self_ms, cumulative_ms)}"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # "import time:   self |   cumulative | <2 spaces per nesting level>name"
+        head, cumulative_us, name = line.split('|')
+        self_us = head[len('import time:'):]
+        name = name[1:]
+        level = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), level))
+
+    # -X importtime lists a module after everything it imported
+    modules = {}
+    for index, (name, self_us, cumulative_us, level) in enumerate(entries):
+        if name == 'app' and level == 0:
+            modules['app (module body)'] = (self_us / 1000, self_us / 1000)
+            for child, child_self, child_cumulative, child_level in reversed(entries[:index]):
+                if child_level == 0:
+                    break
+                if child_level == 1:
+                    modules[child] = (child_self / 1000, child_cumulative / 1000)
+            break
+    return modules
+
+def run_once(path, storage):
+    env = {**os.environ, 'CAR_SCANNER_STORAGE': storage}
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, str(time.time()), path],
+                          cwd=HERE, env=env, capture_output=True, text=True)
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+    if proc.returncode != 0 or result is None:
+        raise RuntimeError(f'startup run failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}')
+    result['modules'] = parse_importtime(proc.stderr)
+    return result
+
+def measure(runs=3, path='/', storage='memory'):
+    """Median timings over runs fresh interpreters"""
+    samples = [run_once(path, storage) for _ in range(runs)]
+    result = {key: statistics.median(s[key] for s in samples)
+              for key in ('cold_start_ms', 'import_ms', 'first_request_ms', 'maxrss_kb')}
+    result.update({
+        'runs': runs,
+        'path': path,
+        'storage': storage,
+        'status': samples[-1]['status'],
+        'lazy_loaded': sorted({m for s in samples for m in s['lazy_loaded']}),
+        'modules': {
+            name: {
+                'self_ms': statistics.median(s['modules'].get(name, (0, 0))[0] for s in samples),
+                'cumulative_ms': statistics.median(s['modules'].get(name, (0, 0))[1] for s in samples)
+            }
+            for name in samples[-1]['modules']
+        }
+    })
+    return result
+
+def print_report(result, top):
+    print(f"\n🚀 Cold start ({result['runs']} runs, median, storage={result['storage']})")
+    print(f"   interpreter + import + first request: {result['cold_start_ms']:8.1f} ms")
+    print(f"   import app:                           {result['import_ms']:8.1f} ms")
+    print(f"   first request (GET {result['path']}, {result['status']}):     {result['first_request_ms']:8.1f} ms")
+    print(f"   peak RSS:                             {result['maxrss_kb'] / 1024:8.1f} MB")
+
+    modules = sorted(result['modules'].items(), key=lambda item: item[1]['cumulative_ms'], reverse=True)
+    print(f"\n📦 Imports of app.py by cumulative time (top {top})")
+    print(f"   {'module':<28}{'cumulative':>12}{'self':>10}")
+    for name, times in modules[:top]:
+        print(f"   {name:<28}{times['cumulative_ms']:>10.1f}ms{times['self_ms']:>8.1f}ms")
+
+    if result['lazy_loaded']:
+        print(f"\n⚠️  Loaded during cold start but meant to be lazy: {', '.join(result['lazy_loaded'])}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Car Scanner worker cold-start report')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--path', default='/', help='first request to serve')
+    parser.add_argument('--storage', choices=['memory', 'postgres'], default='memory')
+    parser.add_argument('--top', type=int, default=20, help='modules to list')
+    parser.add_argument('--budget-ms', type=float, help='exit 1 if the cold start takes longer')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.path, args.storage)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, args.top)
+
+    if args.budget_ms is not None:
+        if result['cold_start_ms'] > args.budget_ms:
+            print(f"\n❌ Cold start {result['cold_start_ms']:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+            sys.exit(1)
+        print(f"\n✅ Cold start within the {args.budget_ms:.0f} ms budget")
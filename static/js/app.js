@@ -11,16 +11,74 @@ function getToken() {
     return localStorage.getItem('token');
 }
 
-function setToken(token) {
+function setToken(token, refreshToken) {
     localStorage.setItem('token', token);
+    if (refreshToken) localStorage.setItem('refresh_token', refreshToken);
     authToken = token;
 }
 
 function clearToken() {
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     authToken = null;
 }
 
+// Access tokens last 15 minutes; the refresh token renews them without a
+// password (and without the server running bcrypt). Concurrent 401s share
+// one refresh request.
+let refreshInFlight = null;
+
+function refreshAccessToken() {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) return Promise.resolve(false);
+    
+    if (!refreshInFlight) {
+        refreshInFlight = fetch(`${API_URL}/token/refresh`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken })
+        })
+        .then(async response => {
+            if (!response.ok) return false;
+            const data = await response.json();
+            setToken(data.token, data.refresh_token);
+            setUser(data.user);
+            return true;
+        })
+        .catch(() => false)
+        .finally(() => { refreshInFlight = null; });
+    }
+    return refreshInFlight;
+}
+
+// fetch() with the access token, refreshing it once on 401 (used for file downloads)
+async function authorizedFetch(url, options = {}) {
+    const send = () => fetch(url, {
+        ...options,
+        headers: { ...options.headers, 'Authorization': `Bearer ${getToken()}` }
+    });
+    
+    const response = await send();
+    if (response.status === 401 && await refreshAccessToken()) {
+        return send();
+    }
+    return response;
+}
+
+function logout() {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+        fetch(`${API_URL}/logout`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+            keepalive: true
+        }).catch(() => {});
+    }
+    clearToken();
+    responseCache.clear();
+}
+
 function getUser() {
     const userData = localStorage.getItem('user');
     return userData ? JSON.parse(userData) : null;
@@ -31,11 +89,21 @@ function setUser(user) {
     currentUser = user;
 }
 
-async function apiCall(endpoint, options = {}) {
+// Columns each car table renders, sent as fields= so /cars skips the rest
+const PARKED_CAR_FIELDS = 'car_identifier,first_scan_time,last_scan_time,scan_count,last_worker,last_worker_id';
+const HOLDING_CAR_FIELDS = 'car_identifier,last_scan_time,vessel_name,vessel_type,holding_area_name,stack_number,last_worker,last_worker_id';
+
+// Validators for conditional GET: endpoint -> { etag, data }
+const responseCache = new Map();
+
+async function apiCall(endpoint, options = {}, retried = false) {
     const token = getToken();
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const cached = isGet ? responseCache.get(endpoint) : null;
     const headers = {
         'Content-Type': 'application/json',
-        ...(token && { 'Authorization': `Bearer ${token}` })
+        ...(token && { 'Authorization': `Bearer ${token}` }),
+        ...(cached && { 'If-None-Match': cached.etag })
     };
     
     try {
@@ -46,11 +114,20 @@ async function apiCall(endpoint, options = {}) {
         
         // Only redirect on 401 if NOT login endpoint (login endpoint handles 401 as invalid credentials)
         if (response.status === 401 && endpoint !== '/login') {
+            if (!retried && await refreshAccessToken()) {
+                return apiCall(endpoint, options, true);
+            }
             clearToken();
+            responseCache.clear();
             window.location.href = '/';
             return null;
         }
         
+        // Nothing changed since the last poll - reuse the cached body
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        
         let data;
         try {
             data = await response.json();
@@ -62,6 +139,11 @@ async function apiCall(endpoint, options = {}) {
             throw new Error(data.error || data.message || 'Request failed');
         }
         
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            responseCache.set(endpoint, { etag, data });
+        }
+        
         return data;
     } catch (error) {
         console.error('API Error:', error);
@@ -184,7 +266,7 @@ if (document.getElementById('loginForm')) {
             }
             
             if (data.token && data.user) {
-                setToken(data.token);
+                setToken(data.token, data.refresh_token);
                 setUser(data.user);
                 window.location.href = '/dashboard';
             } else {
@@ -231,7 +313,7 @@ function initDashboard() {
     }
     
     document.getElementById('logoutBtn').addEventListener('click', () => {
-        clearToken();
+        logout();
         localStorage.removeItem('user');
         window.location.href = '/';
     });
@@ -248,15 +330,13 @@ function initDashboard() {
 function loadWorkerDashboard() {
     showScannerSection();
     loadDashboardData();
-    loadHoldingCars();
-    loadParkedCars();
+    loadWorkerCars();
     document.getElementById('userManagementSection')?.remove();
     document.getElementById('navbarSearch').style.display = 'none';
     
     // Auto-refresh data every 60 seconds to update times and status
     setInterval(() => {
-        loadHoldingCars();
-        loadParkedCars();
+        loadWorkerCars();
         loadDashboardData();
     }, 60000);
 }
@@ -760,31 +840,39 @@ function showSupervisorDashboard() {
     loadCars();
 }
 
-async function handleGlobalSearch(event) {
-    const searchTerm = event.target.value.toLowerCase().trim();
+// Debounced server-side search: one /users/search request once typing pauses
+const SEARCH_DEBOUNCE_MS = 250;
+let searchTimer = null;
+let searchSeq = 0;
+
+function handleGlobalSearch(event) {
+    const searchTerm = event.target.value.trim();
     const dropdown = document.getElementById('searchDropdown');
     
     if (!dropdown) return;
     
+    clearTimeout(searchTimer);
+    
     if (searchTerm.length < 2) {
+        searchSeq++;
         dropdown.style.display = 'none';
         return;
     }
     
+    searchTimer = setTimeout(() => runGlobalSearch(searchTerm), SEARCH_DEBOUNCE_MS);
+}
+
+async function runGlobalSearch(searchTerm) {
+    const seq = ++searchSeq;
+    
     try {
-        const users = await apiCall('/users');
-        let filtered;
-        
-        if (currentUser.role === 'supervisor') {
-            filtered = users.filter(u => 
-                u.role === 'worker' && 
-                u.supervisor_id === currentUser.user_id &&
-                (u.full_name.toLowerCase().includes(searchTerm) || 
-                 u.username.toLowerCase().includes(searchTerm))
-            );
-        }
+        const params = new URLSearchParams({ q: searchTerm });
+        const users = await apiCall(`/users/search?${params}`);
         
-        displaySearchDropdown(filtered);
+        // Ignore responses that arrive after a newer search was started
+        if (seq !== searchSeq) return;
+        
+        displaySearchDropdown(users || []);
     } catch (error) {
         console.error('Search failed:', error);
     }
@@ -864,12 +952,13 @@ async function loadCars() {
     if (shift) params.append('shift', shift);
     if (status) params.append('status', status);
     params.append('date', date);
+    params.append('location', 'parked');
+    params.append('fields', PARKED_CAR_FIELDS);
     
     try {
         const cars = await apiCall(`/cars?${params}`);
         console.log('Cars loaded:', cars);
-        const parkedCars = cars.filter(c => !c.is_in_holding);
-        displayCars(parkedCars);
+        displayCars(cars);
     } catch (error) {
         console.error('Failed to load cars:', error);
         const tbody = document.getElementById('carsTableBody');
@@ -1205,7 +1294,7 @@ async function loadHoldingAreas() {
 
 function endSession() {
     if (confirm('Are you sure you want to END YOUR SESSION?\n\nThis will log you out.')) {
-        clearToken();
+        logout();
         localStorage.removeItem('user');
         alert('✅ Session ended successfully!\n\nThank you for your work today!');
         window.location.href = '/';
@@ -1219,7 +1308,8 @@ async function loadHoldingCars() {
         
         const params = new URLSearchParams();
         params.append('date', date);
-        params.append('holding_only', 'true');
+        params.append('location', 'holding');
+        params.append('fields', HOLDING_CAR_FIELDS);
         if (shift) params.append('shift', shift);
         
         const cars = await apiCall(`/cars?${params}`);
@@ -1239,6 +1329,8 @@ async function loadParkedCars() {
         if (shift) params.append('shift', shift);
         if (status) params.append('status', status);
         params.append('date', date);
+        params.append('location', 'parked');
+        params.append('fields', PARKED_CAR_FIELDS);
         
         const cars = await apiCall(`/cars?${params}`);
         displayParkedCars(cars);
@@ -1247,11 +1339,40 @@ async function loadParkedCars() {
     }
 }
 
+// Worker dashboard: fill both tables from one request when their filters agree
+async function loadWorkerCars() {
+    const today = new Date().toISOString().split('T')[0];
+    const holdingDate = document.getElementById('holdingDateFilter')?.value || today;
+    const parkedDate = document.getElementById('dateFilter')?.value || today;
+    const status = document.getElementById('statusFilter')?.value || '';
+    
+    if (holdingDate !== parkedDate || status) {
+        loadHoldingCars();
+        loadParkedCars();
+        return;
+    }
+    
+    try {
+        const params = new URLSearchParams({
+            date: parkedDate,
+            location: 'all',
+            group_by: 'location',
+            fields: `${PARKED_CAR_FIELDS},${HOLDING_CAR_FIELDS}`
+        });
+        const cars = await apiCall(`/cars?${params}`);
+        displayHoldingCars(cars.holding);
+        displayParkedCars(cars.parked);
+    } catch (error) {
+        console.error('Failed to load cars:', error);
+    }
+}
+
 function displayHoldingCars(cars) {
     const tbody = document.getElementById('holdingCarsTableBody');
     if (!tbody) return;
     
-    const holdingCars = cars.filter(c => c.is_in_holding);
+    // /cars?location=holding already filtered these server-side
+    const holdingCars = cars || [];
     
     if (holdingCars.length === 0) {
         tbody.innerHTML = '<tr><td colspan="9" style="text-align: center; padding: 40px; color: #6b7280;">No vehicles in holding area</td></tr>';
@@ -1292,7 +1413,8 @@ function displayParkedCars(cars) {
     const tbody = document.getElementById('parkedCarsTableBody');
     if (!tbody) return;
     
-    const parkedCars = cars.filter(c => !c.is_in_holding);
+    // /cars?location=parked already filtered these server-side
+    const parkedCars = cars || [];
     
     if (parkedCars.length === 0) {
         tbody.innerHTML = '<tr><td colspan="8" style="text-align: center; padding: 40px; color: #6b7280;">No parked vehicles</td></tr>';
@@ -1422,8 +1544,7 @@ async function scanManually() {
         input.focus();
         
         loadDashboardData();
-        loadHoldingCars();
-        loadParkedCars();
+        loadWorkerCars();
         
         setTimeout(() => {
             resultDiv.style.display = 'none';
@@ -1472,13 +1593,7 @@ async function exportExcel() {
     params.append('date', date);
     
     try {
-        const token = getToken();
-        const response = await fetch(`${API_URL}/export?${params}`, {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        });
+        const response = await authorizedFetch(`${API_URL}/export?${params}`);
         
         if (!response.ok) {
             throw new Error('Export failed');
@@ -1897,13 +2012,7 @@ async function downloadWorkerExcel(workerId, workerName) {
     params.append('date', date);
     
     try {
-        const token = getToken();
-        const response = await fetch(`${API_URL}/export?${params}`, {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        });
+        const response = await authorizedFetch(`${API_URL}/export?${params}`);
         
         if (!response.ok) {
             throw new Error('Export failed');
@@ -1934,14 +2043,11 @@ function loadAdminHoldingCars() {
     const date = document.getElementById('holdingDateFilter')?.value || new Date().toISOString().split('T')[0];
     const shift = document.getElementById('holdingShiftFilter')?.value;
     
-    const params = new URLSearchParams({ date, holding_only: 'true' });
+    const params = new URLSearchParams({ date, location: 'holding', fields: HOLDING_CAR_FIELDS });
     if (shift) params.append('shift', shift);
     
     apiCall(`/cars?${params}`)
-        .then(cars => {
-            const holdingCars = cars.filter(c => c.is_in_holding);
-            displayAdminHoldingCars(holdingCars);
-        })
+        .then(cars => displayAdminHoldingCars(cars))
         .catch(error => console.error('Error:', error));
 }
 
@@ -1994,13 +2100,7 @@ function exportHoldingExcel() {
     if (shift) params.append('shift', shift);
     
     try {
-        const token = getToken();
-        fetch(`${API_URL}/export/holding?${params}`, {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        })
+        authorizedFetch(`${API_URL}/export/holding?${params}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('Export failed');
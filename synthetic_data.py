@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator - a production-sized yard for benchmarks
+
+Builds supervisors and workers across both shifts, vessels, holding areas,
+tens of thousands of cars and millions of scans spread over months, all
+loaded with COPY. Every car's history comes from its own seeded RNG, so the
+same --seed always produces exactly the same rows.
+
+How the yard behaves:
+  * cars arrive mostly during the day shift, on every day of the window
+  * parked cars dwell for a log-normal time (median ~6h, long tail into
+    days); cars in holding wait for their vessel (median ~30h)
+  * while a car is in the yard it is re-scanned on patrols, by a worker of
+    the shift that is on duty at that moment
+  * status follows the app's rule: green < 4h, amber 4-12h, red 12h+
+
+Synthetic rows are tagged (users 'syn_', cars 'SYN', vessels/areas 'SYN ')
+so they can live next to real data; --reset removes them again first.
+
+    python synthetic_data.py --seed 7 --cars 80000 --days 120
+"""
+
+import argparse
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import bcrypt
+import psycopg
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'dbname': 'parking_system',
+    'user': 'postgres',
+    'password': 'postgres'
+}
+
+USER_PREFIX = 'syn_'
+CAR_PREFIX = 'SYN'
+NAME_PREFIX = 'SYN '
+
+# zoneinfo rather than pytz: it is what psycopg hands back for timestamptz columns
+SOUTH_AFRICA_TZ = ZoneInfo('Africa/Johannesburg')
+
+# Share of arrivals per hour of the day (ships discharge mostly in daylight)
+ARRIVAL_HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 5, 8, 9, 9, 9, 8, 6, 8, 9, 9, 8, 6, 4, 3, 2, 2, 1, 1]
+
+# Dwell time in hours: log-normal (median, sigma)
+PARKED_DWELL = (6.0, 0.9)
+HOLDING_DWELL = (30.0, 0.7)
+MAX_DWELL_HOURS = 24 * 14
+
+FIRST_NAMES = ['Thabo', 'Sipho', 'Lerato', 'Naledi', 'Johan', 'Pieter', 'Ayanda', 'Zanele', 'Kagiso',
+               'Nomvula', 'Bongani', 'Lindiwe', 'Andile', 'Karabo', 'Mpho', 'Themba', 'Anele', 'Refilwe']
+LAST_NAMES = ['Nkosi', 'Dlamini', 'Mokoena', 'van der Merwe', 'Botha', 'Khumalo', 'Ndlovu', 'Mahlangu',
+              'Naidoo', 'Pillay', 'Smith', 'Molefe', 'Zulu', 'Mthembu', 'Petersen', 'Jacobs']
+VESSEL_WORDS = ['Morning', 'Grand', 'Hoegh', 'Glovis', 'Silver', 'Ocean', 'Cape', 'Atlantic', 'Pacific',
+                'Southern', 'Star', 'Pride', 'Spirit', 'Harmony', 'Victory', 'Horizon']
+
+def shift_for_hour(hour):
+    """Same split as get_current_shift in app.py"""
+    return 1 if 6 <= hour < 18 else 2
+
+def status_for_hours(hours_parked):
+    """Same thresholds as get_status_color in app.py"""
+    if hours_parked < 4:
+        return 'green'
+    elif hours_parked < 12:
+        return 'amber'
+    return 'red'
+
+def reserve_ids(cur, table, column, count):
+    """Take `count` consecutive values from the table's serial sequence"""
+    cur.execute('SELECT pg_get_serial_sequence(%s, %s)', (table, column))
+    sequence = cur.fetchone()[0]
+    cur.execute('SELECT nextval(%s)', (sequence,))
+    first = cur.fetchone()[0]
+    cur.execute('SELECT setval(%s, %s)', (sequence, first + count - 1))
+    return first
+
+# Fixed so a seed always means the same rows, whatever day it is run;
+# --end-date today gives a yard whose history runs up to now instead
+DEFAULT_END_DATE = date(2026, 1, 31)
+
+def parse_end_date(value):
+    if value == 'today':
+        return datetime.now(SOUTH_AFRICA_TZ).date()
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+class Yard:
+    """Deterministic description of the synthetic yard"""
+
+    def __init__(self, options):
+        self.options = options
+        # South Africa time like the app's scans (no DST, so timedelta arithmetic stays exact)
+        end_date = options.end_date or DEFAULT_END_DATE
+        self.end = datetime.combine(end_date, datetime.min.time(), SOUTH_AFRICA_TZ) + timedelta(days=1)
+        self.start = self.end - timedelta(days=options.days)
+
+    def car_rng(self, index):
+        return random.Random(self.options.seed * 1_000_003 + index)
+
+    def car_history(self, index, workers_by_shift, vessels, holding_areas):
+        """(car row without id, [(scan_time, worker_id, shift)]) for car number `index`"""
+        rng = self.car_rng(index)
+        day = rng.randrange(self.options.days)
+        hour = rng.choices(range(24), weights=ARRIVAL_HOUR_WEIGHTS)[0]
+        arrival = self.start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+        if arrival >= self.end:
+            arrival = self.end - timedelta(seconds=rng.randrange(1, 3600))
+
+        in_holding = bool(vessels and holding_areas) and rng.random() < self.options.holding_ratio
+        median, sigma = HOLDING_DWELL if in_holding else PARKED_DWELL
+        dwell = min(rng.lognormvariate(math.log(median), sigma), MAX_DWELL_HOURS)
+        leaves = min(arrival + timedelta(hours=dwell), self.end)
+
+        scans = []
+        moment = arrival
+        patrol = self.options.patrol_minutes
+        while moment <= leaves:
+            shift = shift_for_hour(moment.hour)
+            on_duty = workers_by_shift[shift] or workers_by_shift[3 - shift]
+            scans.append((moment, rng.choice(on_duty), shift))
+            moment += timedelta(minutes=rng.expovariate(1 / patrol))
+
+        first, last = scans[0][0], scans[-1][0]
+        car = (
+            f'{CAR_PREFIX}{index:08d}{rng.randrange(16 ** 6):06X}',
+            first,
+            last,
+            len(scans),
+            status_for_hours((last - first).total_seconds() / 3600),
+            first.date(),
+            True,
+            rng.choice(vessels) if in_holding else None,
+            rng.choice(holding_areas) if in_holding else None,
+            str(rng.randint(1, 40)) if in_holding else None,
+            in_holding
+        )
+        return car, scans
+
+def reset(cur):
+    print('🧹 Removing previous synthetic rows...')
+    cur.execute(r"DELETE FROM scans WHERE worker_id IN (SELECT user_id FROM users WHERE username LIKE 'syn\_%')")
+    cur.execute('DELETE FROM cars WHERE car_identifier LIKE %s', (CAR_PREFIX + '%',))
+    cur.execute(r"DELETE FROM refresh_tokens WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE 'syn\_%')")
+    cur.execute(r"UPDATE users SET supervisor_id = NULL WHERE username LIKE 'syn\_%'")
+    cur.execute(r"DELETE FROM users WHERE username LIKE 'syn\_%'")
+    cur.execute('DELETE FROM vessels WHERE vessel_name LIKE %s', (NAME_PREFIX + '%',))
+    cur.execute('DELETE FROM holding_areas WHERE area_name LIKE %s', (NAME_PREFIX + '%',))
+
+def full_name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+USER_COLUMNS = ('user_id', 'username', 'password_hash', 'role', 'full_name', 'assigned_shift',
+                'supervisor_id', 'is_active', 'date_joined')
+VESSEL_COLUMNS = ('vessel_id', 'vessel_name', 'vessel_type', 'arrival_date', 'departure_date', 'is_active')
+AREA_COLUMNS = ('holding_area_id', 'area_name', 'area_code', 'capacity', 'is_active')
+CAR_COLUMNS = ('car_id', 'car_identifier', 'first_scan_time', 'last_scan_time', 'scan_count', 'status',
+               'date', 'is_active', 'vessel_id', 'holding_area_id', 'stack_number', 'is_in_holding')
+SCAN_COLUMNS = ('car_id', 'worker_id', 'scan_time', 'shift_number', 'date')
+
+def copy_sql(table, columns):
+    return f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+
+def user_rows(options, yard, password_hash, first_id):
+    """(supervisor and worker rows in USER_COLUMNS order, {shift: [worker ids]})"""
+    rng = random.Random(options.seed)
+    worker_id = first_id + options.supervisors
+    joined = yard.start.date() - timedelta(days=365)
+
+    rows = []
+    supervisors_by_shift = {1: [], 2: []}
+    for i in range(options.supervisors):
+        shift = i % 2 + 1
+        supervisors_by_shift[shift].append(first_id + i)
+        rows.append((first_id + i, f'{USER_PREFIX}supervisor_{i}', password_hash, 'supervisor',
+                     full_name(rng), shift, None, True, joined))
+
+    workers_by_shift = {1: [], 2: []}
+    for i in range(options.workers):
+        shift = i % 2 + 1
+        team = supervisors_by_shift[shift] or supervisors_by_shift[1] or [None]
+        workers_by_shift[shift].append(worker_id + i)
+        rows.append((worker_id + i, f'{USER_PREFIX}worker_{i}', password_hash, 'worker', full_name(rng),
+                     shift, team[i // 2 % len(team)], True, joined + timedelta(days=rng.randrange(365))))
+    return rows, workers_by_shift
+
+def vessel_rows(options, yard, first_id):
+    rng = random.Random(options.seed + 1)
+    rows = []
+    for i in range(options.vessels):
+        arrival = yard.start.date() + timedelta(days=rng.randrange(options.days))
+        rows.append((first_id + i, f'{NAME_PREFIX}{rng.choice(VESSEL_WORDS)} {rng.choice(VESSEL_WORDS)} {i}',
+                     'ship', arrival, arrival + timedelta(days=rng.randint(1, 4)), True))
+    return rows
+
+def area_rows(options, first_id):
+    rng = random.Random(options.seed + 2)
+    return [(first_id + i, f'{NAME_PREFIX}Holding Area {i + 1}', f'SYN-{i + 1}', rng.choice([250, 500, 1000]), True)
+            for i in range(options.holding_areas)]
+
+def load_users(cur, options, yard, password_hash):
+    """COPY supervisors and workers; returns {shift: [worker ids]}"""
+    first_id = reserve_ids(cur, 'users', 'user_id', options.supervisors + options.workers)
+    rows, workers_by_shift = user_rows(options, yard, password_hash, first_id)
+    # Supervisors come first, so workers' supervisor_id references already exist
+    with cur.copy(copy_sql('users', USER_COLUMNS)) as copy:
+        for row in rows:
+            copy.write_row(row)
+    return workers_by_shift
+
+def load_reference_data(cur, options, yard):
+    """COPY vessels and holding areas; returns (vessel ids, holding area ids)"""
+    vessel_id = reserve_ids(cur, 'vessels', 'vessel_id', options.vessels)
+    with cur.copy(copy_sql('vessels', VESSEL_COLUMNS)) as copy:
+        for row in vessel_rows(options, yard, vessel_id):
+            copy.write_row(row)
+
+    area_id = reserve_ids(cur, 'holding_areas', 'holding_area_id', options.holding_areas)
+    with cur.copy(copy_sql('holding_areas', AREA_COLUMNS)) as copy:
+        for row in area_rows(options, area_id):
+            copy.write_row(row)
+
+    return list(range(vessel_id, vessel_id + options.vessels)), list(range(area_id, area_id + options.holding_areas))
+
+def load_cars_and_scans(cur, options, yard, workers_by_shift, vessels, holding_areas):
+    """COPY cars, then replay each car's history again to COPY its scans"""
+    car_id = reserve_ids(cur, 'cars', 'car_id', options.cars)
+
+    started = time.time()
+    scan_total = 0
+    with cur.copy(copy_sql('cars', CAR_COLUMNS)) as copy:
+        for i in range(options.cars):
+            car, scans = yard.car_history(i, workers_by_shift, vessels, holding_areas)
+            copy.write_row((car_id + i,) + car)
+            scan_total += len(scans)
+    print(f'   🚗 {options.cars:,} cars in {time.time() - started:.1f}s')
+
+    # Scans reference cars, so they go second; regenerating each history is
+    # cheaper than holding millions of tuples until the cars are in
+    started = time.time()
+    with cur.copy(copy_sql('scans', SCAN_COLUMNS)) as copy:
+        for i in range(options.cars):
+            _, scans = yard.car_history(i, workers_by_shift, vessels, holding_areas)
+            for scan_time, worker_id, shift in scans:
+                copy.write_row((car_id + i, worker_id, scan_time, shift, scan_time.date()))
+            if i and i % 10000 == 0:
+                print(f'   📋 scans for {i:,} / {options.cars:,} cars...')
+    print(f'   📋 {scan_total:,} scans in {time.time() - started:.1f}s')
+    return scan_total
+
+def update_worker_totals(cur):
+    cur.execute(r'''
+        UPDATE users u SET total_scans = s.total, last_scan_date = s.last_date
+        FROM (SELECT worker_id, COUNT(*) AS total, MAX(date) AS last_date FROM scans GROUP BY worker_id) s
+        WHERE u.user_id = s.worker_id AND u.username LIKE 'syn\_%'
+    ''')
+
+def fill_repository(repository, options, password_hash='!'):
+    """Load the same yard into a repository.MemoryRepository (ids start at 1)"""
+    yard = Yard(options)
+    rows, workers_by_shift = user_rows(options, yard, password_hash, 1)
+    for row in rows:
+        repository.insert('users', dict(zip(USER_COLUMNS, row)))
+    for row in vessel_rows(options, yard, 1):
+        repository.insert('vessels', dict(zip(VESSEL_COLUMNS, row)))
+    for row in area_rows(options, 1):
+        repository.insert('holding_areas', dict(zip(AREA_COLUMNS, row)))
+
+    vessels = list(range(1, options.vessels + 1))
+    holding_areas = list(range(1, options.holding_areas + 1))
+    totals = {}
+    for i in range(options.cars):
+        car, scans = yard.car_history(i, workers_by_shift, vessels, holding_areas)
+        repository.insert('cars', dict(zip(CAR_COLUMNS, (i + 1,) + car)))
+        for scan_time, worker_id, shift in scans:
+            repository.insert('scans', dict(zip(SCAN_COLUMNS, (i + 1, worker_id, scan_time, shift, scan_time.date()))))
+            totals[worker_id] = totals.get(worker_id, 0) + 1
+    for worker_id, total in totals.items():
+        repository.tables['users'][worker_id]['total_scans'] = total
+    return yard
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load a deterministic, production-sized synthetic dataset with COPY')
+    parser.add_argument('--seed', type=int, default=1, help='Same seed, same rows (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=400, help='Workers, split across both shifts')
+    parser.add_argument('--supervisors', type=int, default=24, help='Supervisors, split across both shifts')
+    parser.add_argument('--cars', type=int, default=80000, help='Cars passing through the yard')
+    parser.add_argument('--days', type=int, default=120, help='Days of history')
+    parser.add_argument('--end-date', type=parse_end_date,
+                        help=f'Last day of history, YYYY-MM-DD or "today" (default: {DEFAULT_END_DATE})')
+    parser.add_argument('--vessels', type=int, default=60)
+    parser.add_argument('--holding-areas', type=int, default=8)
+    parser.add_argument('--holding-ratio', type=float, default=0.3, help='Share of cars that go to holding')
+    parser.add_argument('--patrol-minutes', type=float, default=45, help='Mean minutes between re-scans of a car')
+    parser.add_argument('--password', default='synthetic123', help='Password of every synthetic user')
+    parser.add_argument('--reset', action='store_true', help='Delete earlier synthetic rows first')
+    options = parser.parse_args()
+
+    yard = Yard(options)
+    print('=' * 60)
+    print(f'🏭 SYNTHETIC DATASET (seed {options.seed}): {yard.start:%Y-%m-%d} → {yard.end:%Y-%m-%d %H:%M}')
+    print('=' * 60)
+
+    started = time.time()
+    password_hash = bcrypt.hashpw(options.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+    with psycopg.connect(**DB_CONFIG) as conn:
+        with conn.cursor() as cur:
+            if options.reset:
+                reset(cur)
+            else:
+                cur.execute(r"SELECT EXISTS (SELECT 1 FROM users WHERE username LIKE 'syn\_%')")
+                if cur.fetchone()[0]:
+                    raise SystemExit('❌ Synthetic data already loaded - run again with --reset to replace it')
+
+            workers_by_shift = load_users(cur, options, yard, password_hash)
+            print(f'   👥 {options.supervisors} supervisors, {options.workers} workers')
+            vessels, holding_areas = load_reference_data(cur, options, yard)
+            print(f'   🚢 {options.vessels} vessels, {options.holding_areas} holding areas')
+            scan_total = load_cars_and_scans(cur, options, yard, workers_by_shift, vessels, holding_areas)
+            update_worker_totals(cur)
+        conn.commit()
+
+        # Fresh statistics so query plans reflect the new volumes straight away
+        conn.autocommit = True
+        for table in ('users', 'vessels', 'holding_areas', 'cars', 'scans'):
+            conn.execute(f'ANALYZE {table}')
+
+    print('=' * 60)
+    print(f'✅ Loaded {options.cars:,} cars and {scan_total:,} scans in {time.time() - started:.1f}s')
+    print(f'   Log in as {USER_PREFIX}worker_0 / {USER_PREFIX}supervisor_0 with password "{options.password}"')
+    print('=' * 60)
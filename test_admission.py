@@ -0,0 +1,113 @@
+"""
+Admission control: each class admits up to its limit, queues a bounded number
+of requests for at most its deadline and turns the rest away with a 503; a
+login surge never takes the threads scans need. Runs on the in-memory store.
+
+    python -m pytest test_admission.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import threading
+import time
+import pytest
+import admission
+import app as app_module
+from admission import ADMISSION_CLASSES, AdmissionClass, AdmissionRejected, admit
+from password_pool import PASSWORD_JOB_LIMIT, SERVER_THREADS, RESERVED_THREADS
+from test_repository import api
+
+@pytest.fixture(autouse=True)
+def classes(monkeypatch):
+    """Admission classes of this test's own, with no requests in flight"""
+    classes = {name: AdmissionClass(name, **settings) for name, settings in ADMISSION_CLASSES.items()}
+    monkeypatch.setattr(admission, '_classes', classes)
+    return classes
+
+def fill(name):
+    """Take every slot of a class, as that many in-flight requests would"""
+    return [admit(name) for _ in range(ADMISSION_CLASSES[name]['limit'])]
+
+def rejection(name):
+    with pytest.raises(AdmissionRejected) as e:
+        admit(name)
+    return e.value.reason
+
+def queue_behind(name):
+    """Start a request that queues for the class; returns (thread, outcome)"""
+    outcome = {}
+    def run():
+        try:
+            outcome['admitted'] = admit(name)
+        except AdmissionRejected as e:
+            outcome['rejected'] = e.reason
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not admission._classes[name].waiting and thread.is_alive():
+        time.sleep(0.01)
+    return thread, outcome
+
+# CLASSES
+def test_password_class_leaves_threads_for_scans():
+    assert ADMISSION_CLASSES['password']['limit'] == PASSWORD_JOB_LIMIT
+    assert PASSWORD_JOB_LIMIT <= max(1, SERVER_THREADS - RESERVED_THREADS)
+
+def test_full_password_class_refuses_without_queueing(classes):
+    fill('password')
+    assert rejection('password') == 'queue_full'
+    assert classes['password'].waiting == 0
+
+def test_scan_is_admitted_while_logins_are_saturated(classes):
+    fill('password')
+    admit('scan').release()
+    assert classes['scan'].admitted == 1
+
+def test_queued_request_is_admitted_when_a_slot_frees(classes):
+    slots = fill('default')
+    thread, outcome = queue_behind('default')
+    slots.pop().release()
+    thread.join(2)
+    assert 'admitted' in outcome
+    assert classes['default'].active == ADMISSION_CLASSES['default']['limit']
+
+def test_queued_request_is_refused_past_its_deadline(monkeypatch, classes):
+    monkeypatch.setattr(classes['default'], 'deadline', 0.05)
+    fill('default')
+    thread, outcome = queue_behind('default')
+    thread.join(2)
+    assert outcome == {'rejected': 'deadline'}
+
+def test_queue_is_bounded(monkeypatch, classes):
+    monkeypatch.setattr(classes['sheddable'], 'deadline', 1.0)
+    fill('sheddable')
+    thread, outcome = queue_behind('sheddable')
+    assert rejection('sheddable') == 'queue_full'
+    classes['sheddable'].release()
+    thread.join(2)
+    assert 'admitted' in outcome
+
+def test_queued_scans_shed_lower_priorities(classes):
+    slots = fill('scan')
+    thread, outcome = queue_behind('scan')
+    assert rejection('sheddable') == 'priority'
+    assert rejection('default') == 'priority'
+    assert rejection('password') == 'priority'
+    slots.pop().release()
+    thread.join(3)
+    assert 'admitted' in outcome
+    assert classes['sheddable'].rejected['priority'] == 1
+
+# API (in-memory store)
+def test_login_surge_gets_503_while_scans_go_through(api, classes):
+    client, headers, _ = api
+    fill('password')
+
+    # Turned away before the handler runs, so no database is needed
+    response = client.post('/api/login', json={'username': 'someone', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app_module.ADMISSION_RETRY_AFTER)
+    assert response.get_json()['class'] == 'password'
+
+    response = client.post('/api/scan', json={'car_identifier': 'TESTADMIT000'}, headers=headers)
+    assert response.status_code == 200
+    assert classes['scan'].active == 0
@@ -0,0 +1,108 @@
+"""
+Conditional GET: read endpoints answer 304 from the data versions alone while
+nothing they depend on has changed. Runs on the in-memory store; the trigger
+test also runs against Postgres when DB_CONFIG reaches a migrated database.
+
+    python -m pytest test_conditional_get.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import psycopg
+import pytest
+from psycopg.rows import dict_row
+import app as app_module
+from test_repository import DAY, add_user, api
+
+def get(api, url, etag=None, user_headers=None):
+    client, headers, _ = api
+    headers = {**(user_headers or headers), **({'If-None-Match': etag} if etag else {})}
+    response = client.get(url, headers=headers)
+    response.get_data()     # run streamed bodies to the end
+    return response
+
+def token_headers(repo, user_id):
+    token = app_module.login_payload(repo.tables['users'][user_id], None)['token']
+    return {'Authorization': f'Bearer {token}'}
+
+def test_matching_etag_skips_the_handler(api, monkeypatch):
+    _, _, repo = api
+    url = f'/api/cars?date={DAY.isoformat()}'
+    etag = get(api, url).headers['ETag']
+
+    def fail(*args, **kwargs):
+        raise AssertionError('handler ran for a current ETag')
+    monkeypatch.setattr(repo, 'stream_cars', fail)
+    monkeypatch.setattr(repo, 'list_cars', fail)
+    response = get(api, url, etag)
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+def test_etag_changes_with_the_data(api):
+    _, _, repo = api
+    etag = get(api, '/api/vessels').headers['ETag']
+    assert get(api, '/api/vessels', etag).status_code == 304
+
+    repo.create_vessel('MV Test', 'ship', DAY.isoformat())
+    response = get(api, '/api/vessels', etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [v['vessel_name'] for v in response.get_json()] == ['MV Test']
+
+def test_writes_to_other_tables_keep_the_etag(api):
+    _, _, repo = api
+    etag = get(api, '/api/vessels').headers['ETag']
+    add_user(repo, 'late', 'worker', 'Late Arrival')
+    assert get(api, '/api/vessels', etag).status_code == 304
+
+def test_etag_depends_on_user_and_query(api):
+    _, _, repo = api
+    supervisor_id = add_user(repo, 'sup', 'supervisor', 'Sipho')
+    url = f'/api/cars?date={DAY.isoformat()}'
+    admin_etag = get(api, url).headers['ETag']
+    supervisor_etag = get(api, url, user_headers=token_headers(repo, supervisor_id)).headers['ETag']
+    holding_etag = get(api, url + '&location=holding').headers['ETag']
+    assert len({admin_etag, supervisor_etag, holding_etag}) == 3
+    # Someone else's tag is not a match
+    assert get(api, url, supervisor_etag).status_code == 200
+
+def test_errors_carry_no_etag(api):
+    response = get(api, '/api/cars?date=not-a-date')
+    assert response.status_code == 400
+    assert 'ETag' not in response.headers
+
+def test_without_versions_the_handler_always_runs(api, monkeypatch):
+    url = f'/api/cars?date={DAY.isoformat()}'
+    etag = get(api, url).headers['ETag']
+    monkeypatch.setattr(app_module, 'get_data_versions', lambda resources: None)
+    response = get(api, url, etag)
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+# POSTGRES
+@pytest.fixture
+def conn():
+    try:
+        conn = psycopg.connect(**app_module.DB_CONFIG, row_factory=dict_row, connect_timeout=2)
+    except psycopg.OperationalError as e:
+        pytest.skip(f'Postgres not reachable: {e}')
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+def versions(conn):
+    return {row['resource']: row['version']
+            for row in conn.execute(app_module.DATA_VERSIONS_QUERY, (['vessels', 'cars'],))}
+
+def test_trigger_bumps_only_the_written_table(conn):
+    try:
+        before = versions(conn)
+    except psycopg.errors.UndefinedTable:
+        pytest.skip('data_versions missing - run setup_db.py')
+    conn.execute("INSERT INTO vessels (vessel_name) VALUES ('MV Test'), ('MV Test 2')")
+    after = versions(conn)
+    # Statement-level trigger: one bump per statement, not per row
+    assert after['vessels'] == before['vessels'] + 1
+    assert after['cars'] == before['cars']
@@ -0,0 +1,52 @@
+"""
+FastJSONProvider pins one wire format for dates and times, with orjson and
+with the stdlib fallback: ISO 8601, aware datetimes keep their offset and
+naive ones are UTC.
+
+    python -m pytest test_json_provider.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import datetime
+import json
+import pytest
+import pytz
+import json_provider
+from app import app
+
+JOHANNESBURG = pytz.timezone('Africa/Johannesburg')
+
+@pytest.fixture(params=['orjson', 'json'])
+def provider(request, monkeypatch):
+    if request.param == 'orjson':
+        if json_provider.orjson is None:
+            pytest.skip('orjson not installed')
+    else:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    provider = json_provider.FastJSONProvider(app)
+    assert provider.backend == request.param
+    return provider
+
+def encoded(provider, value):
+    return json.loads(provider.dumpb({'value': value}))['value']
+
+def test_date(provider):
+    assert encoded(provider, datetime.date(2026, 1, 5)) == '2026-01-05'
+
+def test_aware_datetime_keeps_its_offset(provider):
+    scanned = JOHANNESBURG.localize(datetime.datetime(2026, 1, 5, 6, 30, 15))
+    assert encoded(provider, scanned) == '2026-01-05T06:30:15+02:00'
+
+def test_aware_datetime_keeps_microseconds(provider):
+    scanned = datetime.datetime(2026, 1, 5, 18, 0, 0, 250000, tzinfo=datetime.timezone.utc)
+    assert encoded(provider, scanned) == '2026-01-05T18:00:00.250000+00:00'
+
+def test_naive_datetime_is_utc(provider):
+    assert encoded(provider, datetime.datetime(2026, 1, 5, 6, 30)) == '2026-01-05T06:30:00+00:00'
+
+def test_response_body(provider):
+    with app.app_context():
+        response = provider.response({'date': datetime.date(2026, 1, 5)})
+    assert response.mimetype == 'application/json'
+    assert response.get_data() == b'{"date":"2026-01-05"}\n'
@@ -0,0 +1,24 @@
+"""
+load_test.py's report: percentiles are nearest-rank, so p50 of 1..10 is 5
+and p95 of 1..100 is 95 whatever the rounding of the rank.
+
+    python -m pytest test_load_test.py
+"""
+import pytest
+from load_test import percentile
+
+@pytest.mark.parametrize('values, pct, expected', [
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 11)), 25, 3),
+    (list(range(1, 11)), 95, 10),
+    (list(range(1, 101)), 7, 7),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 99, 99),
+    (list(range(1, 101)), 100, 100),
+    ([1, 2], 50, 1),
+    ([4], 99, 4),
+    ([4], 0, 4),
+    ([], 95, 0.0),
+])
+def test_nearest_rank(values, pct, expected):
+    assert percentile(values, pct) == expected
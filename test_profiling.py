@@ -0,0 +1,51 @@
+"""
+On-demand profiling: every profiled request gets a fresh server-side id, and
+the text report only takes pstats sort keys. Runs on the in-memory store.
+
+    python -m pytest test_profiling.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import pytest
+import profiling
+from test_repository import api
+
+@pytest.fixture(autouse=True)
+def profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    return tmp_path
+
+def profiled(api, request_id='client-chosen-id'):
+    client, headers, _ = api
+    response = client.get('/api/vessels', headers={**headers, 'X-Profile': '1', 'X-Request-ID': request_id})
+    assert response.status_code == 200
+    return response.headers['X-Profile-Id']
+
+def test_profile_ids_are_chosen_by_the_server(api, profile_dir):
+    first, second = profiled(api), profiled(api)
+    assert 'client-chosen-id' not in (first, second)
+    assert first != second
+    assert (profile_dir / f'{first}.prof').exists()
+    assert not (profile_dir / 'client-chosen-id.prof').exists()
+
+def test_profile_keeps_the_request_id(api):
+    profile_id = profiled(api)
+    client, headers, _ = api
+    listed = {p['profile_id']: p for p in client.get('/api/admin/profiles', headers=headers).get_json()}
+    assert listed[profile_id]['request_id'] == 'client-chosen-id'
+
+@pytest.mark.parametrize('sort', profiling.sort_keys())
+def test_report_takes_every_sort_key(api, sort):
+    profile_id = profiled(api)
+    client, headers, _ = api
+    response = client.get(f'/api/admin/profiles/{profile_id}?format=text&sort={sort}', headers=headers)
+    assert response.status_code == 200
+    assert 'function calls' in response.get_data(as_text=True)
+
+def test_unknown_sort_key_is_a_bad_request(api):
+    profile_id = profiled(api)
+    client, headers, _ = api
+    response = client.get(f'/api/admin/profiles/{profile_id}?format=text&sort=bogus', headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['sort_keys'] == profiling.sort_keys()
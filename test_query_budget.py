@@ -0,0 +1,119 @@
+"""
+Query deadlines: each transaction carries the route's statement_timeout, and
+the watchdog cancels whatever a connection is still running once the request
+is past its budget. A streamed list stops being bounded (and gives back its
+admission slot) once the handler is done. The watchdog runs against stand-in
+connections; the API test runs on the in-memory store.
+
+    python -m pytest test_query_budget.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from psycopg.pq import TransactionStatus
+import admission
+import query_budget
+from admission import ADMISSION_CLASSES, AdmissionClass
+from query_budget import DeadlineWatchdog, _pending_timeout
+from test_repository import DAY, api
+
+class FakeConnection:
+    """Just what the watchdog looks at; cancel_safe() records the call"""
+
+    def __init__(self, status=TransactionStatus.ACTIVE, checkout_id=1):
+        self.closed = False
+        self.info = SimpleNamespace(transaction_status=status)
+        self.checkout_id = checkout_id
+        self.cancelled = threading.Event()
+
+    def cancel_safe(self, timeout=None):
+        self.cancelled.set()
+
+@pytest.fixture
+def watchdog(monkeypatch):
+    monkeypatch.setattr(query_budget, 'CANCEL_GRACE_MS', 0)
+    return DeadlineWatchdog()
+
+# STATEMENT TIMEOUT
+def test_timeout_goes_with_the_first_statement_of_a_transaction():
+    conn = SimpleNamespace(info=SimpleNamespace(transaction_status=TransactionStatus.IDLE))
+    assert _pending_timeout(conn, 2000) == ('2000ms',)
+    assert _pending_timeout(conn, None) is None
+
+def test_timeout_is_not_resent_inside_a_transaction():
+    conn = SimpleNamespace(info=SimpleNamespace(transaction_status=TransactionStatus.INTRANS))
+    assert _pending_timeout(conn, 2000) is None
+
+def test_routes_fall_back_to_the_default_budget():
+    assert query_budget.query_budget_ms('scan_car') == query_budget.ROUTE_QUERY_BUDGETS['scan_car']
+    assert query_budget.query_budget_ms('no_such_route') == query_budget.DEFAULT_QUERY_BUDGET_MS
+
+# WATCHDOG
+def test_overdue_statement_is_cancelled(watchdog):
+    conn = FakeConnection(checkout_id=7)
+    watchdog.watch(conn, 10)
+    assert conn.cancelled.wait(2)
+    assert conn.deadline_cancelled == 7
+
+def test_unwatched_connection_is_left_alone(watchdog):
+    conn = FakeConnection()
+    watchdog.watch(conn, 50)
+    watchdog.unwatch(conn)
+    assert not conn.cancelled.wait(0.2)
+
+def test_watching_again_replaces_the_deadline(watchdog):
+    conn = FakeConnection()
+    watchdog.watch(conn, 50)
+    watchdog.watch(conn, 60000)
+    assert not conn.cancelled.wait(0.2)
+    assert len(watchdog.deadlines) == 1
+
+def test_idle_connection_is_not_cancelled(watchdog):
+    conn = FakeConnection(status=TransactionStatus.INTRANS)
+    watchdog.watch(conn, 10)
+    time.sleep(0.2)
+    assert not conn.cancelled.is_set()
+    assert conn not in watchdog.deadlines
+
+def test_other_connections_keep_their_deadlines(watchdog):
+    slow, fast = FakeConnection(), FakeConnection()
+    watchdog.watch(slow, 60000)
+    watchdog.watch(fast, 10)
+    assert fast.cancelled.wait(2)
+    assert not slow.cancelled.is_set()
+
+# CANCELLATION SOURCE
+@pytest.fixture
+def cancellations(monkeypatch):
+    monkeypatch.setattr(query_budget, '_cancellations', {})
+    monkeypatch.setattr(query_budget, '_cancel_listener', lambda source: 'get_cars')
+    return query_budget.get_cancellation_stats
+
+def test_cancel_by_this_checkouts_deadline_counts_as_deadline(cancellations):
+    conn = FakeConnection(checkout_id=3)
+    conn.deadline_cancelled = 3
+    query_budget.record_cancellation(conn)
+    assert cancellations() == [{'endpoint': 'get_cars', 'source': 'deadline', 'count': 1}]
+
+def test_cancel_left_over_from_an_earlier_checkout_is_not_a_deadline(cancellations):
+    conn = FakeConnection(checkout_id=4)
+    conn.deadline_cancelled = 3
+    query_budget.record_cancellation(conn)
+    assert cancellations() == [{'endpoint': 'get_cars', 'source': 'statement_timeout', 'count': 1}]
+
+# STREAMED LISTS (in-memory store)
+def test_streamed_list_gives_back_its_slot_before_the_body_is_sent(api, monkeypatch):
+    client, headers, _ = api
+    classes = {name: AdmissionClass(name, **settings) for name, settings in ADMISSION_CLASSES.items()}
+    monkeypatch.setattr(admission, '_classes', classes)
+
+    response = client.get(f'/api/cars?date={DAY.isoformat()}', headers=headers)
+    assert response.is_streamed
+    assert classes['default'].active == 0       # released with the body still unsent
+    assert len(response.get_json()) > 0
+    assert classes['default'].active == 0       # and not released twice
+    assert classes['default'].admitted == 1
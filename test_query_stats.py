@@ -0,0 +1,44 @@
+"""
+Slow-query EXPLAIN: only plain reads are re-run under EXPLAIN ANALYZE, since
+ANALYZE executes the statement again.
+
+    python -m pytest test_query_stats.py
+"""
+from types import SimpleNamespace
+import pytest
+from psycopg.pq import TransactionStatus
+import query_stats
+
+class UnusableConnection:
+    """Fails the test if explain() gets as far as the connection"""
+    @property
+    def info(self):
+        raise AssertionError('explain() ran a write')
+
+@pytest.mark.parametrize('sql', [
+    'UPDATE cars SET status = %s WHERE car_id = %s',
+    'INSERT INTO scans (car_id) VALUES (%s)',
+    'WITH gone AS (DELETE FROM cars WHERE car_id = %s RETURNING car_id) SELECT * FROM gone',
+    'WITH moved AS (UPDATE cars SET is_in_holding = TRUE RETURNING car_id) SELECT count(*) FROM moved',
+    'with t as (insert into vessels (vessel_name) values (%s) returning *) select * from t',
+    'SELECT * INTO cars_copy FROM cars',
+    'SELECT car_id FROM cars WHERE car_id = %s FOR UPDATE',
+    '  delete from refresh_tokens',
+])
+def test_writes_are_never_explained(sql):
+    assert query_stats.explain(UnusableConnection(), sql, ()) is None
+
+def test_reads_are_explained(monkeypatch):
+    executed = []
+    class Cursor:
+        def __init__(self, conn, row_factory=None):
+            pass
+        def execute(self, sql, params):
+            executed.append(sql)
+        def fetchall(self):
+            return [('Seq Scan on cars',)]
+    conn = SimpleNamespace(info=SimpleNamespace(transaction_status=TransactionStatus.INTRANS))
+    monkeypatch.setattr(query_stats.psycopg, 'Cursor', Cursor)
+    plan = query_stats.explain(conn, 'SELECT last_update_by FROM cars WHERE date = %s', ('2001-03-14',))
+    assert plan == 'Seq Scan on cars'
+    assert executed == ['EXPLAIN (ANALYZE, BUFFERS) SELECT last_update_by FROM cars WHERE date = %s']
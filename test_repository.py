@@ -0,0 +1,186 @@
+"""
+MemoryRepository has to answer like PostgresRepository: the same rows in the
+same order. The repository tests run against the in-memory store, and again
+against Postgres when DB_CONFIG reaches a database (inside a transaction that
+is rolled back). The API tests drive app.py on the in-memory store.
+
+    python -m pytest test_repository.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+from datetime import date, datetime, timedelta
+import psycopg
+import pytest
+from flask import request
+from psycopg.rows import dict_row
+import app as app_module
+from repository import MemoryRepository, PostgresRepository
+
+# A day no real yard data is on, so the Postgres run only sees its own cars
+DAY = date(2001, 3, 14)
+PREFIX = 'test_repo_'
+CAR_COUNT = 25
+PAGE_SIZE = 4
+ADMIN = {'user_id': 0, 'role': 'admin'}
+
+@pytest.fixture(params=['memory', 'postgres'])
+def repo(request):
+    if request.param == 'memory':
+        yield MemoryRepository()
+        return
+    try:
+        conn = psycopg.connect(**app_module.DB_CONFIG, row_factory=dict_row, connect_timeout=2)
+    except psycopg.OperationalError as e:
+        pytest.skip(f'Postgres not reachable: {e}')
+    try:
+        yield PostgresRepository(conn)
+    finally:
+        conn.rollback()
+        conn.close()
+
+def add_user(repo, username, role, full_name, supervisor_id=None):
+    row = {'username': PREFIX + username, 'password_hash': '-', 'role': role,
+           'full_name': full_name, 'supervisor_id': supervisor_id}
+    if isinstance(repo, MemoryRepository):
+        return repo.insert('users', row)
+    return repo.conn.execute('''
+        INSERT INTO users (username, password_hash, role, full_name, supervisor_id)
+        VALUES (%(username)s, %(password_hash)s, %(role)s, %(full_name)s, %(supervisor_id)s)
+        RETURNING user_id
+    ''', row).fetchone()['user_id']
+
+def add_yard(repo):
+    """CAR_COUNT cars on DAY, three to a scan time so the car_id tie-break matters"""
+    worker_id = add_user(repo, 'worker', 'worker', 'Yard Worker')
+    start = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=6)
+    for i in range(CAR_COUNT):
+        scan_time = start + timedelta(minutes=i // 3)
+        car_id = repo.insert_car({
+            'car_identifier': f'TESTREPO{i:03d}', 'first_scan_time': scan_time, 'last_scan_time': scan_time,
+            'status': 'green', 'date': DAY, 'vessel_id': None, 'holding_area_id': None,
+            'stack_number': None, 'is_in_holding': i % 4 == 0
+        })
+        repo.insert_scan(car_id, worker_id, scan_time, 1, DAY)
+    return worker_id
+
+def cars_spec(**args):
+    with app_module.app.test_request_context(query_string={'date': DAY.isoformat(), **args}):
+        return app_module.build_cars_query(request.args, ADMIN)
+
+def identifiers(cars):
+    return [c['car_identifier'] for c in cars]
+
+# REPOSITORY
+def test_keyset_pages_have_no_duplicates_or_gaps(repo):
+    add_yard(repo)
+    everything = identifiers(repo.list_cars(cars_spec()))
+    assert len(everything) == CAR_COUNT
+
+    paged, cursor = [], None
+    while True:
+        spec = cars_spec(limit=PAGE_SIZE, **({'cursor': cursor} if cursor else {}))
+        page = app_module.cars_payload(repo.list_cars(spec), spec)
+        assert len(page['cars']) <= PAGE_SIZE
+        paged += identifiers(page['cars'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert paged == everything
+
+def test_cars_ordered_by_last_scan_then_car_id(repo):
+    add_yard(repo)
+    cars = repo.list_cars(cars_spec(fields='car_id,last_scan_time'))
+    keys = [(c['last_scan_time'], c['car_id']) for c in cars]
+    assert keys == sorted(keys, reverse=True)
+
+def test_location_filters_split_the_list(repo):
+    add_yard(repo)
+    everything = repo.list_cars(cars_spec())
+    holding = repo.list_cars(cars_spec(location='holding'))
+    parked = repo.list_cars(cars_spec(location='parked'))
+    assert identifiers(holding) == [c['car_identifier'] for c in everything if c['is_in_holding']]
+    assert identifiers(parked) == [c['car_identifier'] for c in everything if not c['is_in_holding']]
+    assert len(holding) == (CAR_COUNT + 3) // 4
+
+def test_users_with_null_names_sort_last(repo):
+    if isinstance(repo, PostgresRepository):
+        # Older databases allow NULL names (see fix_full_names.py); undone by the rollback
+        repo.conn.execute('ALTER TABLE users ALTER COLUMN full_name DROP NOT NULL')
+    supervisor_id = add_user(repo, 'supervisor', 'supervisor', 'Sipho')
+    add_user(repo, 'bongani', 'worker', 'Bongani', supervisor_id)
+    add_user(repo, 'nameless', 'worker', None, supervisor_id)
+    add_user(repo, 'ayanda', 'worker', 'Ayanda', supervisor_id)
+    add_user(repo, 'admin', 'admin', None)
+
+    everyone = [(u['role'], u['full_name']) for u in repo.list_users(ADMIN)
+                if u['username'].startswith(PREFIX)]
+    assert everyone == [('admin', None), ('supervisor', 'Sipho'),
+                        ('worker', 'Ayanda'), ('worker', 'Bongani'), ('worker', None)]
+
+    team = repo.list_users({'user_id': supervisor_id, 'role': 'supervisor'})
+    assert [u['full_name'] for u in team] == ['Ayanda', 'Bongani', None]
+    assert {u['supervisor_name'] for u in team} == {'Sipho'}
+
+# API (in-memory store)
+@pytest.fixture
+def api(monkeypatch):
+    """(test client, Authorization header, repository) over a fresh in-memory yard"""
+    repo = MemoryRepository()
+    monkeypatch.setattr(app_module, 'memory_repository', repo)
+    add_yard(repo)
+    admin_id = add_user(repo, 'admin', 'admin', 'Admin')
+    token = app_module.login_payload(repo.tables['users'][admin_id], None)['token']
+    with app_module.app.test_client() as client:
+        yield client, {'Authorization': f'Bearer {token}'}, repo
+
+def get_cars(api, **args):
+    client, headers, _ = api
+    response = client.get('/api/cars', query_string={'date': DAY.isoformat(), **args}, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_api_pages_have_no_duplicates_or_gaps(api):
+    everything = identifiers(get_cars(api))
+    paged, cursor = [], None
+    while True:
+        page = get_cars(api, limit=PAGE_SIZE, **({'cursor': cursor} if cursor else {}))
+        paged += identifiers(page['cars'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert len(everything) == CAR_COUNT
+    assert paged == everything
+
+def test_api_group_by_location(api):
+    everything = get_cars(api)
+    grouped = get_cars(api, group_by='location')
+    assert set(grouped) == {'holding', 'parked'}
+    assert identifiers(grouped['holding']) == [c['car_identifier'] for c in everything if c['is_in_holding']]
+    assert identifiers(grouped['parked']) == [c['car_identifier'] for c in everything if not c['is_in_holding']]
+
+    paged = get_cars(api, group_by='location', limit=PAGE_SIZE)
+    assert set(paged) == {'holding', 'parked', 'next_cursor'}
+    assert len(paged['holding']) + len(paged['parked']) == PAGE_SIZE
+
+def test_api_not_modified_until_the_data_changes(api):
+    client, headers, repo = api
+    url = f'/api/cars?date={DAY.isoformat()}'
+    first = client.get(url, headers=headers)
+    assert len(first.get_json()) == CAR_COUNT
+    etag = first.headers['ETag']
+
+    unchanged = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.data == b''
+    assert unchanged.headers['ETag'] == etag
+    # Compressed responses carry the weak form of the same tag
+    weak = client.get(url, headers={**headers, 'If-None-Match': f'W/{etag}'})
+    assert weak.status_code == 304
+
+    car = repo.tables['cars'][repo.car_ids_by_identifier['TESTREPO000']]
+    repo.update_car(car['car_id'], {'status': 'amber'})
+    changed = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert 'amber' in {c['status'] for c in changed.get_json()}
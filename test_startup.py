@@ -0,0 +1,30 @@
+"""
+Cold-start budget: a fresh interpreter must import app and serve its first
+request within STARTUP_BUDGET_MS, without loading the lazily imported
+dependencies. Run with pytest, or directly for a quick check.
+
+    CAR_SCANNER_STARTUP_BUDGET_MS=800 python -m pytest test_startup.py
+"""
+import os
+from startup_report import measure, print_report
+
+# About 2.5x a cold start on a developer laptop (~400 ms), to absorb slow CI machines
+STARTUP_BUDGET_MS = float(os.environ.get('CAR_SCANNER_STARTUP_BUDGET_MS', 1000))
+
+def test_cold_start_within_budget():
+    result = measure(runs=3)
+    assert result['status'] == 200
+    assert result['cold_start_ms'] <= STARTUP_BUDGET_MS, (
+        f"cold start took {result['cold_start_ms']:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms); "
+        f"run python startup_report.py to see which imports grew")
+
+def test_rarely_used_dependencies_stay_lazy():
+    result = measure(runs=1)
+    assert result['lazy_loaded'] == [], f"loaded at start-up: {', '.join(result['lazy_loaded'])}"
+
+if __name__ == '__main__':
+    result = measure(runs=3)
+    print_report(result, top=10)
+    test_cold_start_within_budget()
+    test_rarely_used_dependencies_stay_lazy()
+    print("\n✅ Start-up tests passed")
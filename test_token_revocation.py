@@ -0,0 +1,120 @@
+"""
+Revocation: a deactivated user's access tokens stop working at once, and a
+refresh token is good for exactly one refresh. The access-token tests run on
+the in-memory store; the refresh-token tests run against Postgres when
+DB_CONFIG reaches a migrated database (inside a transaction that is rolled
+back).
+
+    python -m pytest test_token_revocation.py
+"""
+import os
+os.environ.setdefault('CAR_SCANNER_STORAGE', 'memory')
+
+import time
+import psycopg
+import pytest
+from psycopg.rows import dict_row
+import app as app_module
+import revocations
+from test_repository import PREFIX, add_user, api
+
+@pytest.fixture(autouse=True)
+def revoked(monkeypatch):
+    """A revocation list of this test's own"""
+    monkeypatch.setattr(revocations, '_revoked', {})
+
+def login_headers(repo, user_id):
+    token = app_module.login_payload(repo.tables['users'][user_id], None)['token']
+    return {'Authorization': f'Bearer {token}'}
+
+# ACCESS TOKENS (in-memory store)
+def test_revoked_user_is_refused(api):
+    client, _, repo = api
+    worker_id = add_user(repo, 'leaver', 'worker', 'Leaver')
+    headers = login_headers(repo, worker_id)
+    assert client.get('/api/vessels', headers=headers).status_code == 200
+
+    app_module.revoke_user(worker_id)
+    response = client.get('/api/vessels', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Invalid token'}
+
+def test_revocation_covers_only_that_user(api):
+    client, headers, repo = api
+    worker_id = add_user(repo, 'leaver', 'worker', 'Leaver')
+    app_module.revoke_user(worker_id)
+    assert client.get('/api/vessels', headers=headers).status_code == 200
+
+def test_tokens_issued_after_the_revocation_work(api):
+    client, _, repo = api
+    worker_id = add_user(repo, 'returner', 'worker', 'Returner')
+    app_module.revoke_user(worker_id, when=time.time() - 60)
+    assert client.get('/api/vessels', headers=login_headers(repo, worker_id)).status_code == 200
+
+def test_notifications_carry_the_user_id_as_text():
+    # NOTIFY payloads arrive as strings; claims carry ints
+    revocations.revoke_user('42')
+    assert revocations.is_revoked({'user_id': 42, 'iat': int(time.time())})
+    assert not revocations.is_revoked({'user_id': 43, 'iat': int(time.time())})
+
+# REFRESH TOKENS (Postgres)
+@pytest.fixture
+def conn():
+    try:
+        conn = psycopg.connect(**app_module.DB_CONFIG, row_factory=dict_row, connect_timeout=2)
+    except psycopg.OperationalError as e:
+        pytest.skip(f'Postgres not reachable: {e}')
+    try:
+        conn.execute('SELECT 1 FROM refresh_tokens LIMIT 0')
+    except psycopg.errors.UndefinedTable:
+        conn.close()
+        pytest.skip('refresh_tokens missing - run setup_db.py')
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+def issue(conn, user):
+    refresh_token, params = app_module.new_refresh_token(user)
+    conn.execute(app_module.REFRESH_TOKEN_INSERT, params)
+    return refresh_token
+
+def rotate(conn, refresh_token):
+    return conn.execute(app_module.REFRESH_TOKEN_ROTATE,
+                        (app_module.hash_refresh_token(refresh_token),)).fetchone()
+
+@pytest.fixture
+def user(conn):
+    return conn.execute('''
+        INSERT INTO users (username, password_hash, role, full_name)
+        VALUES (%s, '-', 'worker', 'Refresher') RETURNING *
+    ''', (PREFIX + 'refresher',)).fetchone()
+
+def test_refresh_token_is_spent_by_its_first_use(conn, user):
+    refresh_token = issue(conn, user)
+    assert rotate(conn, refresh_token)['user_id'] == user['user_id']
+    assert rotate(conn, refresh_token) is None
+
+def test_only_the_hash_is_stored(conn, user):
+    refresh_token = issue(conn, user)
+    stored = conn.execute('SELECT token_hash FROM refresh_tokens WHERE user_id = %s',
+                          (user['user_id'],)).fetchone()['token_hash']
+    assert stored == app_module.hash_refresh_token(refresh_token)
+    assert stored != refresh_token
+
+def test_logged_out_refresh_token_is_refused(conn, user):
+    refresh_token = issue(conn, user)
+    conn.execute(app_module.REFRESH_TOKEN_REVOKE, (app_module.hash_refresh_token(refresh_token),))
+    assert rotate(conn, refresh_token) is None
+
+def test_deactivated_user_cannot_refresh(conn, user):
+    refresh_token = issue(conn, user)
+    conn.execute('UPDATE users SET is_active = FALSE WHERE user_id = %s', (user['user_id'],))
+    assert rotate(conn, refresh_token) is None
+
+def test_expired_refresh_token_is_refused(conn, user):
+    refresh_token = issue(conn, user)
+    conn.execute("UPDATE refresh_tokens SET expires_at = NOW() - INTERVAL '1 second' WHERE user_id = %s",
+                 (user['user_id'],))
+    assert rotate(conn, refresh_token) is None